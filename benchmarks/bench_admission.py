@@ -0,0 +1,158 @@
+# benchmarks/bench_admission.py
+
+"""
+/api/chat/ under overload, with and without admission control, and the per-client rate limit.
+
+The stub LLM works on at most --upstream-concurrency requests at a time, each
+taking --latency seconds, so it saturates at upstream-concurrency / latency
+requests a second. Requests arrive open-loop (Poisson, --rate a second, for
+--duration seconds), faster than that, and go through Django's in-process ASGI
+handler. Each message is distinct and the answer cache is off, so every request
+reaches the LLM.
+
+1. Overload: without admission control every request is accepted and queues
+   for the upstream, so latency keeps growing for as long as the overload lasts.
+   With it, --max-concurrent requests run, --max-queue wait up to
+   --queue-timeout, and the rest get a fast 503. The latency of admitted
+   requests is reported for the first and last third of the run, to show
+   whether it is stable.
+2. Rate limit: one client sending at --greedy-rate and --clients clients at
+   --client-rate, with a limit of --rate-limit requests a minute per client.
+
+    python -m benchmarks.bench_admission --rate 40 --duration 10 --upstream-concurrency 4 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+
+from benchmarks.common import percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_assistant_project.settings")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+
+async def post_chat(client, message: str, address: str) -> tuple[float, int, float]:
+    """(arrival time, status, latency) of one /api/chat/ request from `address`."""
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/chat/", data=json.dumps({"message": message}), content_type="application/json",
+        headers={"X-Forwarded-For": address},
+    )
+    return start, response.status_code, time.perf_counter() - start
+
+
+async def open_loop(client, rate: float, duration: float, address: str, seed: int) -> list:
+    """Sends requests at Poisson arrival times for `duration` seconds; returns their results."""
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    begin, at, tasks = loop.time(), 0.0, []
+    while True:
+        at += rng.expovariate(rate)
+        if at >= duration:
+            break
+        await asyncio.sleep(max(0.0, begin + at - loop.time()))
+        message = f"What are the symptoms of a common cold? ({address} request {len(tasks)})"
+        tasks.append(asyncio.ensure_future(post_chat(client, message, address)))
+    return list(await asyncio.gather(*tasks))
+
+
+def run(scenarios: dict, duration: float) -> dict:
+    """Runs one open-loop sender per `address: rate` in `scenarios` at once."""
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+        results = await asyncio.gather(*(
+            open_loop(client, rate, duration, address, seed)
+            for seed, (address, rate) in enumerate(scenarios.items())
+        ))
+        await llm_rag._get_llm_client().aclose()
+        return dict(zip(scenarios, results))
+
+    with quiet():
+        return asyncio.run(main())
+
+
+def report_overload(label: str, results: list, duration: float):
+    statuses = Counter(status for _, status, _ in results)
+    admitted = sorted((start, latency) for start, status, latency in results if status == 200)
+    rejected = [latency for _, status, latency in results if status == 503]
+    third = len(admitted) // 3
+    first, last = [latency for _, latency in admitted[:third]], [latency for _, latency in admitted[-third:]]
+    print(f"{label}: {len(results)} requests, {statuses[200]} answered ({statuses[200] / duration:.1f}/s), "
+          f"{statuses[503]} rejected with 503, {sum(n for s, n in statuses.items() if s not in (200, 503))} other")
+    print(f"  answered   p50 {percentile([l for _, l in admitted], 50) * 1000:>8.0f} ms  "
+          f"p95 {percentile([l for _, l in admitted], 95) * 1000:>8.0f} ms  "
+          f"p99 {percentile([l for _, l in admitted], 99) * 1000:>8.0f} ms")
+    print(f"  answered   p50 first third {percentile(first, 50) * 1000:>8.0f} ms, "
+          f"last third {percentile(last, 50) * 1000:>8.0f} ms")
+    if rejected:
+        print(f"  rejected   p50 {percentile(rejected, 50) * 1000:>8.1f} ms  p99 {percentile(rejected, 99) * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=40, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic per run")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--upstream-concurrency", type=int, default=4, help="requests the stub LLM works on at once")
+    parser.add_argument("--max-concurrent", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--queue-timeout", type=float, default=1.0)
+    parser.add_argument("--greedy-rate", type=float, default=10, help="requests per second of the greedy client")
+    parser.add_argument("--clients", type=int, default=5, help="well-behaved clients")
+    parser.add_argument("--client-rate", type=float, default=0.5, help="requests per second of each well-behaved client")
+    parser.add_argument("--rate-limit", type=float, default=60, help="requests per minute per client")
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)  # one warning per 429/503 otherwise
+    llm_rag.RATE_LIMIT_CLIENT_HEADER = "X-Forwarded-For"
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    llm_rag.RATE_LIMIT_PER_MINUTE = 0
+    with quiet():
+        if not llm_rag.warm_up_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+
+    capacity = args.upstream_concurrency / args.latency
+    with StubLLMServer(latency=args.latency, max_concurrency=args.upstream_concurrency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"Upstream capacity {capacity:.0f} req/s, offered {args.rate:.0f} req/s for {args.duration:.0f} s")
+
+        llm_rag.ADMISSION_MAX_CONCURRENT = 0
+        results = run({"10.0.0.1": args.rate}, args.duration)["10.0.0.1"]
+        report_overload("admission control off", results, args.duration)
+
+        llm_rag.ADMISSION_MAX_CONCURRENT = args.max_concurrent
+        llm_rag.ADMISSION_MAX_QUEUE = args.max_queue
+        llm_rag.ADMISSION_QUEUE_TIMEOUT_SECONDS = args.queue_timeout
+        results = run({"10.0.0.1": args.rate}, args.duration)["10.0.0.1"]
+        report_overload(f"admission control on ({args.max_concurrent} running, {args.max_queue} queued, "
+                        f"{args.queue_timeout:g} s queue timeout)", results, args.duration)
+
+        llm_rag.RATE_LIMIT_PER_MINUTE = args.rate_limit
+        scenarios = {"10.0.1.1": args.greedy_rate}
+        scenarios.update({f"10.0.2.{index}": args.client_rate for index in range(1, args.clients + 1)})
+        results = run(scenarios, args.duration)
+        print(f"Rate limit {args.rate_limit:g}/min, burst {llm_rag.RATE_LIMIT_BURST}:")
+        for label, addresses in (("greedy client", ["10.0.1.1"]), (f"{args.clients} other clients", list(scenarios)[1:])):
+            statuses = Counter(status for address in addresses for _, status, _ in results[address])
+            print(f"  {label:<16} {sum(statuses.values()):>4} requests, {statuses[200]:>4} answered, "
+                  f"{statuses[429]:>4} rate limited, {statuses[503]:>4} rejected with 503")
+
+
+if __name__ == "__main__":
+    main()
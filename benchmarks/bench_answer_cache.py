@@ -0,0 +1,120 @@
+# benchmarks/bench_answer_cache.py
+
+"""
+Replays a query log through `get_rag_response` with the semantic answer cache
+disabled and enabled, against a local stub LLM, and reports latency and cache
+counters. Uses the real embedding model and ChromaDB collection.
+
+    python -m benchmarks.bench_answer_cache --log benchmarks/data/query_log.txt --latency 0.5
+    python -m benchmarks.bench_answer_cache --near-hits --threshold 0.97
+
+With --pairs, checks near-hit thresholds instead: for each labeled pair of
+questions in benchmarks/data/cache_pairs.jsonl, the first question's answer is
+cached and the second is looked up. A paraphrase served is a correct near-hit; a
+non-paraphrase served ("type 1" / "type 2 diabetes") is another question's answer.
+
+    python -m benchmarks.bench_answer_cache --pairs
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+from medical_assistant_app.answer_cache import SemanticAnswerCache  # noqa: E402
+
+DEFAULT_LOG = os.path.join(REPO_ROOT, "benchmarks", "data", "query_log.txt")
+DEFAULT_PAIRS = os.path.join(REPO_ROOT, "benchmarks", "data", "cache_pairs.jsonl")
+THRESHOLDS = (0.85, 0.9, 0.93, 0.95, 0.97, 0.99)
+
+
+def replay(queries: list[str]) -> list[float]:
+    latencies = []
+    with quiet():
+        for query in queries:
+            start = time.perf_counter()
+            llm_rag.get_rag_response(query)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label: str, latencies: list[float]):
+    print(
+        f"{label:<16} total {sum(latencies):>7.2f} s  mean {sum(latencies) / len(latencies) * 1000:>7.1f} ms  "
+        f"p50 {percentile(latencies, 50) * 1000:>7.1f} ms  p95 {percentile(latencies, 95) * 1000:>7.1f} ms"
+    )
+
+
+def check_pairs(path: str, thresholds=THRESHOLDS):
+    """Per threshold: paraphrases served and non-paraphrases served, as near-hits of the real cache."""
+    with open(path, encoding="utf-8") as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    embeddings = llm_rag._embedding_model.encode([text for pair in pairs for text in (pair["a"], pair["b"])])
+    paraphrases = sum(pair["paraphrase"] for pair in pairs)
+    print(f"{len(pairs)} labeled pairs: {paraphrases} paraphrases, {len(pairs) - paraphrases} different questions")
+    for threshold in thresholds:
+        served, wrong = 0, []
+        for index, pair in enumerate(pairs):
+            cache = SemanticAnswerCache(max_entries=1, similarity_threshold=threshold, near_hits=True)
+            cache.put(llm_rag._normalize_query(pair["a"]), embeddings[2 * index], "answer")
+            if cache.get(llm_rag._normalize_query(pair["b"]), embeddings[2 * index + 1]) is None:
+                continue
+            if pair["paraphrase"]:
+                served += 1
+            else:
+                wrong.append(pair)
+        print(f"threshold {threshold:.2f}  paraphrases served {served:>2}/{paraphrases}  "
+              f"wrong answers served {len(wrong):>2}/{len(pairs) - paraphrases}")
+        for pair in wrong:
+            print(f"                 {pair['a']!r} -> {pair['b']!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=DEFAULT_LOG, help="file with one query per line")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--threshold", type=float, default=llm_rag.ANSWER_CACHE_SIMILARITY)
+    parser.add_argument("--near-hits", action="store_true", help="serve near-hits in the replay (off by default)")
+    parser.add_argument("--pairs", nargs="?", const=DEFAULT_PAIRS, help="check near-hit thresholds on labeled pairs")
+    args = parser.parse_args()
+
+    with quiet():
+        if not llm_rag._initialize_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+    if args.pairs:
+        check_pairs(args.pairs)
+        return
+
+    with open(args.log, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"Replaying {len(queries)} queries (stub LLM latency {args.latency * 1000:.0f} ms)")
+
+        llm_rag.ANSWER_CACHE_ENABLED = False
+        llm_rag._answer_cache = None
+        calls_before = stub.request_count
+        report("cache disabled", replay(queries))
+        print(f"{'':<16} LLM calls: {stub.request_count - calls_before}")
+
+        llm_rag.ANSWER_CACHE_ENABLED = True
+        llm_rag._answer_cache = SemanticAnswerCache(
+            max_entries=llm_rag.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=llm_rag.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=args.threshold,
+            near_hits=args.near_hits,
+        )
+        calls_before = stub.request_count
+        report("cache enabled", replay(queries))
+        print(f"{'':<16} LLM calls: {stub.request_count - calls_before}  counters: {llm_rag.get_answer_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
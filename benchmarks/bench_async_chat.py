@@ -0,0 +1,79 @@
+# benchmarks/bench_async_chat.py
+
+"""
+Compares the sync and async LLM call paths against a local stub LLM server.
+
+The sync path is driven from a fixed-size thread pool, modelling a WSGI
+deployment where every in-flight LLM call pins one worker. The async path runs
+all requests as tasks on one event loop sharing the pooled aiohttp session, as the
+async `chat_api` does under ASGI.
+
+    python -m benchmarks.bench_async_chat --requests 400 --sync-workers 8 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import format_row, quiet, summarize
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+PROMPT = llm_rag._build_prompt("What are the symptoms of a common cold?", [])
+
+
+def run_sync(total: int, workers: int) -> dict:
+    def timed_call(_):
+        start = time.perf_counter()
+        llm_rag._call_gemini_api(PROMPT)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet(), ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(timed_call, range(total)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def _run_async(total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_call():
+        async with semaphore:
+            start = time.perf_counter()
+            await llm_rag._acall_gemini_api(PROMPT)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed_call() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await llm_rag._get_llm_client().aclose()
+    return summarize(list(latencies), elapsed)
+
+
+def run_async(total: int, concurrency: int) -> dict:
+    with quiet():
+        return asyncio.run(_run_async(total, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="requests per path")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--sync-workers", type=int, default=8, help="threads for the sync path (WSGI workers)")
+    parser.add_argument("--async-concurrency", type=int, default=200, help="in-flight requests for the async path")
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"Stub LLM at {stub.url} (latency {args.latency * 1000:.0f} ms)")
+        print(format_row(f"sync ({args.sync_workers} workers)", run_sync(args.requests, args.sync_workers)))
+        print(format_row(f"async ({args.async_concurrency} in-flight)", run_async(args.requests, args.async_concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_batch_api.py
+
+"""
+Throughput of the batch entry points against answering the same messages one
+at a time, the way an offline job calling /api/chat/ per message does.
+
+- sequential: `get_rag_response` per message, each paying its own embedding
+  call, vector lookup and LLM round-trip.
+- batch (threads): `get_rag_responses`, with one embedding call, one multi-query
+  lookup, and the LLM calls spread over --concurrency threads.
+- batch (asyncio): `aget_rag_responses`, as used by /api/chat/batch/.
+
+The LLM is a local stub. The answer cache is disabled and every message is
+distinct, so nothing is short-circuited.
+
+    python -m benchmarks.bench_batch_api --messages 100 --latency 0.2 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.bench_embedding_batcher import load_queries
+from benchmarks.common import quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+
+class _EncodeCounter:
+    """Wraps the embedding model's `encode` to count model calls and embedded texts."""
+
+    def __init__(self, model):
+        self.calls = 0
+        self.texts = 0
+        self._encode = model.encode
+
+    def __call__(self, texts, *args, **kwargs):
+        self.calls += 1
+        self.texts += len(texts)
+        return self._encode(texts, *args, **kwargs)
+
+
+def run_sequential(messages: list[str], concurrency: int):
+    return [{'response': llm_rag.get_rag_response(message)} for message in messages]
+
+
+def run_batch_threads(messages: list[str], concurrency: int):
+    return llm_rag.get_rag_responses(messages, concurrency)
+
+
+def run_batch_asyncio(messages: list[str], concurrency: int):
+    async def run():
+        results = await llm_rag.aget_rag_responses(messages, concurrency)
+        await llm_rag._get_llm_client().aclose()
+        return results
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight per batch")
+    args = parser.parse_args()
+
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    with quiet():
+        if not llm_rag._initialize_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+        # Installed before warm-up, so the embedding batcher picks it up too.
+        counter = llm_rag._embedding_model.encode = _EncodeCounter(llm_rag._embedding_model)
+        llm_rag.warm_up_rag_components()
+
+    messages = load_queries(args.messages)
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"{args.messages} distinct messages, stub LLM latency {args.latency * 1000:.0f} ms, "
+              f"batch concurrency {args.concurrency}")
+        for label, runner in (
+            ("sequential", run_sequential),
+            ("batch (threads)", run_batch_threads),
+            ("batch (asyncio)", run_batch_asyncio),
+        ):
+            embeds_before, calls_before = counter.calls, stub.request_count
+            start = time.perf_counter()
+            with quiet():
+                results = runner(messages, args.concurrency)
+            elapsed = time.perf_counter() - start
+            errors = sum('error' in result for result in results)
+            print(
+                f"  {label:<16} {len(messages) / elapsed:>8.1f} msg/s  wall {elapsed:>7.2f} s  "
+                f"encode calls {counter.calls - embeds_before:>4}  LLM calls {stub.request_count - calls_before:>4}  "
+                f"errors {errors}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# benchmarks/bench_chat_log.py
+
+"""
+Cost of the chat log on /api/chat/, and its flush-on-shutdown guarantee.
+
+Requests arrive open-loop (Poisson, at each --rates value a second, for
+--duration seconds) and go through Django's in-process ASGI handler to a stub
+LLM taking --latency seconds. Each message is distinct and the answer cache is
+off, so every request runs the whole pipeline. The database is a temporary
+SQLite file with the project's settings (WAL).
+
+Modes:
+- off: CHAT_LOG_ENABLED=0.
+- write-behind: the default; records are buffered and bulk-inserted by the
+  background writer.
+- inline insert: each record inserted in its own transaction on the request
+  path, the naive alternative, for comparison.
+
+For each mode: chat_api latency percentiles, rows written against requests
+answered, and the writer's batches. Then the request path's cost of queuing
+one record, and a child process that queues --shutdown-records records with a
+60 s flush interval and exits at once: all of them must be in the table.
+
+    python -m benchmarks.bench_chat_log --rates 10 50 100 --duration 10 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_assistant_project.settings")
+os.environ.setdefault("RAG_WARMUP_ON_STARTUP", "0")  # warmed up explicitly below
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+MODES = ("off", "write-behind", "inline insert")
+
+# Run in a child process: queues records, then exits without flushing explicitly.
+SHUTDOWN_CHILD = """
+import os, sys
+import django
+from django.conf import settings
+django.setup()
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+settings.CHAT_LOG_FLUSH_INTERVAL_SECONDS = 60
+from medical_assistant_app import chat_log
+for index in range(int(sys.argv[2])):
+    chat_log.log_chat('chat', {'query': f'shutdown test {index}', 'outcome': 'answered'}, {}, 200, 0.1)
+print(chat_log.get_chat_log().pending())
+"""
+
+
+class InlineLog:
+    """Stands in for the write-behind log: inserts each record on the caller's thread, in its own transaction."""
+
+    def __init__(self):
+        from medical_assistant_app import chat_log
+        self.insert = chat_log._insert_chat_logs
+        self.written = 0
+
+    def submit(self, record) -> bool:
+        self.insert([record])
+        self.written += 1
+        return True
+
+
+async def post_chat(client, message: str) -> tuple[int, float]:
+    start = time.perf_counter()
+    response = await client.post("/api/chat/", data=json.dumps({"message": message}), content_type="application/json")
+    return response.status_code, time.perf_counter() - start
+
+
+async def open_loop(rate: float, duration: float, seed: int) -> list:
+    """Sends distinct messages at Poisson arrival times for `duration` seconds; returns (status, latency) pairs."""
+    import random
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    begin, at, tasks = loop.time(), 0.0, []
+    while True:
+        at += rng.expovariate(rate)
+        if at >= duration:
+            break
+        await asyncio.sleep(max(0.0, begin + at - loop.time()))
+        tasks.append(asyncio.ensure_future(post_chat(client, f"What are the symptoms of a common cold? (request {seed}-{len(tasks)})")))
+    results = list(await asyncio.gather(*tasks))
+    await llm_rag._get_llm_client().aclose()
+    return results
+
+
+def run_mode(mode: str, rate: float, duration: float, seed: int) -> dict:
+    from django.conf import settings
+    from medical_assistant_app import chat_log
+    from medical_assistant_app.models import ChatLog
+
+    ChatLog.objects.all().delete()
+    settings.CHAT_LOG_ENABLED = mode != "off"
+    chat_log._chat_log = InlineLog() if mode == "inline insert" else None
+    if mode == "inline insert":
+        os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"  # the ORM call blocks the event loop, as inline logging would
+    batches = []
+    if mode == "write-behind":
+        writer = chat_log.get_chat_log()
+        write_batch = writer.write_batch
+        writer.write_batch = lambda records: (batches.append(len(records)), write_batch(records))
+    try:
+        with quiet():
+            results = asyncio.run(open_loop(rate, duration, seed))
+        if mode == "write-behind":
+            writer.flush()
+    finally:
+        os.environ.pop("DJANGO_ALLOW_ASYNC_UNSAFE", None)
+    latencies = [latency for status, latency in results if status == 200]
+    return {
+        "requests": len(results),
+        "answered": len(latencies),
+        "rows": ChatLog.objects.count(),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "batches": batches,
+    }
+
+
+def submit_cost(loops: int) -> list[float]:
+    """Seconds per `log_chat` call, on a writer that never flushes during the measurement."""
+    from medical_assistant_app import chat_log
+
+    writer = chat_log.WriteBehindLog(lambda records: None, batch_size=loops + 1, flush_interval=3600, max_pending=loops + 1)
+    chat_log._chat_log = writer
+    record = {"query": "What are the symptoms of a common cold?", "outcome": "answered",
+              "retrieved_ids": ["chunk_0", "chunk_1", "chunk_2"], "prompt_tokens": 420}
+    timings = {"embed": 0.004, "retrieve": 0.002, "prompt_build": 0.0003, "llm": 0.05}
+    samples = []
+    for _ in range(loops):
+        start = time.perf_counter()
+        chat_log.log_chat("chat", dict(record), timings, 200, 0.06)
+        samples.append(time.perf_counter() - start)
+    writer.close()
+    chat_log._chat_log = None
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 50, 100], help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic per run")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--loops", type=int, default=100000, help="calls timed for the per-record cost")
+    parser.add_argument("--shutdown-records", type=int, default=5000)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    workdir = tempfile.mkdtemp(prefix="bench_chat_log_")
+    database = os.path.join(workdir, "db.sqlite3")
+    django.setup()
+    settings.DATABASES["default"]["NAME"] = database
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    call_command("migrate", verbosity=0)
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    llm_rag.ADMISSION_MAX_CONCURRENT = 0
+    with quiet():
+        if not llm_rag.warm_up_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+
+    print(f"/api/chat/ with a {args.latency * 1000:.0f} ms stub LLM, {args.duration:g} s per run, "
+          f"batches of up to {settings.CHAT_LOG_BATCH_SIZE} every {settings.CHAT_LOG_FLUSH_INTERVAL_SECONDS:g} s")
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        for rate in args.rates:
+            print(f"{rate:g} req/s:")
+            for mode in args.modes:
+                result = run_mode(mode, rate, args.duration, seed=int(rate))
+                line = (f"  {mode:<14} p50 {result['p50_ms']:>7.1f} ms  p95 {result['p95_ms']:>7.1f} ms  "
+                        f"p99 {result['p99_ms']:>7.1f} ms  {result['answered']:>5}/{result['requests']} answered  "
+                        f"{result['rows']:>5} rows")
+                if result["batches"]:
+                    batches = result["batches"]
+                    line += f"  {len(batches)} batches (mean {sum(batches) / len(batches):.0f} rows)"
+                print(line)
+
+    samples = submit_cost(args.loops)
+    print(f"Request-path cost of log_chat: p50 {percentile(samples, 50) * 1e6:.1f} us, "
+          f"p99 {percentile(samples, 99) * 1e6:.1f} us")
+
+    shutdown_db = os.path.join(workdir, "shutdown.sqlite3")
+    settings.DATABASES["default"]["NAME"] = shutdown_db
+    from django.db import connections
+    connections.close_all()
+    call_command("migrate", verbosity=0)
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, "-c", SHUTDOWN_CHILD, shutdown_db, str(args.shutdown_records)],
+                           cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+                           env={**os.environ, "RAG_WARMUP_ON_STARTUP": "0"})
+    from medical_assistant_app.models import ChatLog
+    rows = ChatLog.objects.count()
+    print(f"Shutdown: the child exited with {child.stdout.strip()} records still buffered; "
+          f"{rows}/{args.shutdown_records} rows in the table after exit ({time.perf_counter() - start:.1f} s, "
+          f"{'OK' if rows == args.shutdown_records else 'LOST RECORDS'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/bench_conversation.py
+
+"""
+Prompt size, LLM latency and retrieval for a long conversation, with and without conversation memory.
+
+A --turns turn conversation alternates standalone questions from
+benchmarks/data/query_log.txt with follow-ups that only make sense in context
+("Is it contagious?"). It is replayed through `get_rag_response` three ways:
+
+- stateless: no history, as before conversation memory existed.
+- full history: every turn kept verbatim (a conversation with an unlimited
+  history budget), the naive way to add memory.
+- bounded memory: the shipped defaults, recent turns within
+  CONVERSATION_HISTORY_TOKEN_BUDGET plus a rolling summary.
+
+The stub LLM's time to first token grows by --prompt-token-delay per prompt
+token, modelling prefill cost. For follow-ups, "on topic" counts how often at
+least one retrieved chunk is also among those retrieved for the question
+being followed up. Finally, the cost of recording a turn and rendering the
+history is timed early and late in a --long-turns turn conversation.
+
+    python -m benchmarks.bench_conversation --turns 50 --prompt-token-delay 0.0002
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import STUB_ANSWER, StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+from medical_assistant_app.conversation import Conversation, is_follow_up  # noqa: E402
+from medical_assistant_app.prompt_builder import estimate_tokens  # noqa: E402
+
+QUERY_LOG = os.path.join(REPO_ROOT, "benchmarks", "data", "query_log.txt")
+FOLLOW_UPS = [
+    "Is it contagious?",
+    "What about for children?",
+    "How long does it usually last?",
+    "What are the treatment options for it?",
+    "Should I see a doctor about this?",
+]
+
+
+def build_script(turns: int) -> list[str]:
+    """Standalone questions, each followed by two follow-ups."""
+    with open(QUERY_LOG, encoding="utf-8") as f:
+        questions = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    script = []
+    for index in range(turns):
+        if index % 3 == 0:
+            script.append(questions[(index // 3) % len(questions)])
+        else:
+            script.append(FOLLOW_UPS[index % len(FOLLOW_UPS)])
+    return script
+
+
+def replay(script: list[str], conversation) -> list[dict]:
+    captured = {}
+    build_prompt = llm_rag._build_prompt
+
+    def recording_build_prompt(user_query, documents, history=""):
+        captured["documents"] = list(documents)
+        captured["prompt"] = build_prompt(user_query, documents, history)
+        return captured["prompt"]
+
+    turns, topic_documents = [], []
+    llm_rag._build_prompt = recording_build_prompt
+    try:
+        for message in script:
+            start = time.perf_counter()
+            with quiet():
+                answer = llm_rag.get_rag_response(message, conversation)
+            elapsed = time.perf_counter() - start
+            follow_up = is_follow_up(message)
+            if not follow_up:
+                topic_documents = captured["documents"]
+            turns.append({
+                "ok": answer == STUB_ANSWER,
+                "latency": elapsed,
+                "prompt_tokens": estimate_tokens(captured["prompt"]),
+                "follow_up": follow_up,
+                "on_topic": bool(set(captured["documents"]) & set(topic_documents)),
+            })
+    finally:
+        llm_rag._build_prompt = build_prompt
+    return turns
+
+
+def time_bookkeeping(turns: int, window: int = 50) -> tuple[float, float]:
+    """Microseconds per add_turn + render over the first and the last `window` turns."""
+    conversation = Conversation("bench", llm_rag.CONVERSATION_HISTORY_TOKEN_BUDGET, llm_rag.CONVERSATION_SUMMARY_TOKEN_BUDGET)
+    script = build_script(turns)
+    samples = []
+    for message in script:
+        start = time.perf_counter()
+        conversation.render()
+        conversation.add_turn(message, STUB_ANSWER)
+        samples.append(time.perf_counter() - start)
+    return sum(samples[:window]) / window * 1e6, sum(samples[-window:]) / window * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM base latency in seconds")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0002, help="stub prefill seconds per prompt token")
+    parser.add_argument("--long-turns", type=int, default=5000, help="turns for the bookkeeping cost check")
+    args = parser.parse_args()
+
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    with quiet():
+        if not llm_rag.warm_up_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+
+    script = build_script(args.turns)
+    modes = [
+        ("stateless", lambda: None),
+        ("full history", lambda: Conversation("full", 10**9, 0)),
+        ("bounded memory", lambda: Conversation(
+            "bounded", llm_rag.CONVERSATION_HISTORY_TOKEN_BUDGET, llm_rag.CONVERSATION_SUMMARY_TOKEN_BUDGET,
+        )),
+    ]
+    checkpoints = [turn for turn in (1, 10, 25, args.turns) if turn <= args.turns]
+    with StubLLMServer(latency=args.latency, prompt_token_delay=args.prompt_token_delay) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"{args.turns} turns ({sum(map(is_follow_up, script))} follow-ups), stub LLM "
+              f"{args.latency * 1000:.0f} ms + {args.prompt_token_delay * 1e6:.0f} us per prompt token")
+        for label, make_conversation in modes:
+            turns = replay(script, make_conversation())
+            tokens = [turn["prompt_tokens"] for turn in turns]
+            latencies = [turn["latency"] for turn in turns]
+            follow_ups = [turn for turn in turns if turn["follow_up"]]
+            print(f"{label}:")
+            print("  prompt tokens  " + "  ".join(f"turn {turn} {tokens[turn - 1]:>5}" for turn in checkpoints)
+                  + f"  max {max(tokens)}")
+            print(f"  latency        p50 {percentile(latencies, 50) * 1000:>6.0f} ms, last 10 turns p50 "
+                  f"{percentile(latencies[-10:], 50) * 1000:>6.0f} ms, max {max(latencies) * 1000:>6.0f} ms")
+            print(f"  follow-ups on topic {sum(turn['on_topic'] for turn in follow_ups)}/{len(follow_ups)}, "
+                  f"errors {sum(not turn['ok'] for turn in turns)}")
+
+    first, last = time_bookkeeping(args.long_turns)
+    print(f"Bookkeeping per turn (render + add_turn): {first:.1f} us over the first 50 turns, "
+          f"{last:.1f} us over the last 50 of {args.long_turns}")
+
+
+if __name__ == "__main__":
+    main()
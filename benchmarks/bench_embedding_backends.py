@@ -0,0 +1,157 @@
+# benchmarks/bench_embedding_backends.py
+
+"""
+Latency, throughput, memory and accuracy of each embedding backend (EMBEDDING_BACKEND).
+
+Each backend runs in a fresh child process, so its RSS is its own: the load
+time and RSS after loading, single-query latency over the queries of
+benchmarks/data/query_log.txt and intent_queries.jsonl (as in a chat request),
+throughput encoding the knowledge-base chunks of medical_data.txt in batches
+(as at ingestion), and peak RSS. The ONNX backends are then compared with
+torch: the lowest and mean cosine similarity of their embeddings, and how many
+of each query's top-k chunks (each backend searching its own chunk embeddings)
+match torch's.
+
+Export the model first (python manage.py export_embedding_onnx). For a fair
+CPU comparison, --threads caps both PyTorch and ONNX Runtime.
+
+    python -m benchmarks.bench_embedding_backends --threads 1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def load_texts(chunks_limit: int) -> tuple[list[str], list[str]]:
+    data = os.path.join(REPO_ROOT, "benchmarks", "data")
+    with open(os.path.join(data, "query_log.txt"), encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    with open(os.path.join(data, "intent_queries.jsonl"), encoding="utf-8") as f:
+        queries += [json.loads(line)["message"] for line in f if line.strip()]
+    with open(os.path.join(REPO_ROOT, "medical_data.txt"), encoding="utf-8") as f:
+        chunks = [chunk.strip() for chunk in f.read().split("\n\n") if chunk.strip()]
+    return list(dict.fromkeys(queries)), chunks[:chunks_limit]
+
+
+def _rss_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _child(backend: str, args: dict, results):
+    from medical_assistant_app.onnx_embedder import OnnxEmbedder, load_embedder
+
+    queries, chunks = load_texts(args["chunks"])
+    if backend == "torch" and args["threads"]:
+        import torch
+        torch.set_num_threads(args["threads"])
+    start = time.perf_counter()
+    with quiet():
+        model = load_embedder(args["model"], backend, args["onnx_path"], args["threads"])
+    load_seconds = time.perf_counter() - start
+    if backend != "torch" and not isinstance(model, OnnxEmbedder):
+        results.put({"error": f"no ONNX export at {args['onnx_path']}"})
+        return
+    loaded_mb = _rss_mb("VmRSS")
+
+    model.encode(queries[:4])  # first calls pay one-off setup
+    latencies, query_embeddings = [], []
+    for _ in range(args["repeats"]):
+        query_embeddings = []
+        for query in queries:
+            start = time.perf_counter()
+            query_embeddings.append(model.encode([query])[0])
+            latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    chunk_embeddings = model.encode(chunks, batch_size=args["batch_size"])
+    throughput = len(chunks) / (time.perf_counter() - start)
+    results.put({
+        "load_seconds": load_seconds,
+        "loaded_mb": loaded_mb,
+        "peak_mb": _rss_mb("VmHWM"),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "chunks_per_second": throughput,
+        "queries": np.asarray(query_embeddings, dtype=np.float32),
+        "chunks": np.asarray(chunk_embeddings, dtype=np.float32),
+    })
+
+
+def run(backend: str, args: dict) -> dict:
+    context = multiprocessing.get_context("spawn")  # a clean interpreter per backend
+    results = context.Queue()
+    process = context.Process(target=_child, args=(backend, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(queries: np.ndarray, chunks: np.ndarray, k: int) -> list[set]:
+    scores = _unit(queries) @ _unit(chunks).T
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--model", help="model name or directory (default: MODEL_NAME)")
+    parser.add_argument("--onnx-path", help="ONNX export directory (default: EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per backend (0 = library default)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--chunks", type=int, default=10000, help="knowledge-base chunks encoded for throughput")
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the queries")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    from medical_assistant_app import llm_rag
+
+    settings = {
+        "model": args.model or llm_rag.MODEL_NAME,
+        "onnx_path": args.onnx_path or llm_rag.EMBEDDING_ONNX_PATH,
+        "threads": args.threads,
+        "batch_size": args.batch_size,
+        "chunks": args.chunks,
+        "repeats": args.repeats,
+    }
+    queries, chunks = load_texts(args.chunks)
+    print(f"{settings['model']}: {len(queries)} queries x {args.repeats}, {len(chunks)} chunks in batches of "
+          f"{args.batch_size}, threads {args.threads or 'default'}")
+    results = {}
+    for backend in args.backends:
+        result = results[backend] = run(backend, settings)
+        if "error" in result:
+            print(f"{backend:<10} skipped: {result['error']}")
+            continue
+        line = (f"{backend:<10} load {result['load_seconds']:>5.2f} s  query p50 {result['p50_ms']:>6.2f} ms  "
+                f"p95 {result['p95_ms']:>6.2f} ms  {result['chunks_per_second']:>7.1f} chunks/s  "
+                f"RSS loaded {result['loaded_mb']:>6.0f} MB  peak {result['peak_mb']:>6.0f} MB")
+        reference = results.get("torch")
+        if backend != "torch" and reference and "error" not in reference:
+            cosine = (_unit(reference["queries"]) * _unit(result["queries"])).sum(axis=1)
+            cosine = np.concatenate([cosine, (_unit(reference["chunks"]) * _unit(result["chunks"])).sum(axis=1)])
+            expected = top_k(reference["queries"], reference["chunks"], args.k)
+            found = top_k(result["queries"], result["chunks"], args.k)
+            overlap = sum(len(a & b) for a, b in zip(expected, found)) / (args.k * len(expected))
+            line += f"  vs torch: cosine min {cosine.min():.4f} mean {cosine.mean():.4f}, top-{args.k} overlap {overlap:.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_embedding_batcher.py
+
+"""
+Compares per-request query encoding (`encode([query])` from every request
+thread) with the micro-batching EmbeddingBatcher, at several concurrency levels,
+reporting throughput (queries/s) and per-query latency. Run on the CPU-only
+deployment hardware for representative numbers.
+
+    python -m benchmarks.bench_embedding_batcher --queries 512 --concurrency 1 8 32
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import REPO_ROOT, percentile
+from medical_assistant_app.llm_rag import MODEL_NAME, EmbeddingBatcher
+from sentence_transformers import SentenceTransformer
+
+QUERY_LOG = os.path.join(REPO_ROOT, "benchmarks", "data", "query_log.txt")
+
+
+def load_queries(count: int) -> list[str]:
+    with open(QUERY_LOG, encoding="utf-8") as f:
+        base = [line.strip() for line in f if line.strip()]
+    # Distinct strings, so nothing downstream can short-circuit repeats.
+    return [f"{base[i % len(base)]} (case {i})" for i in range(count)]
+
+
+def run(encode_one, queries: list[str], concurrency: int) -> tuple[float, list[float]]:
+    def timed(query):
+        start = time.perf_counter()
+        encode_one(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, queries))
+    return len(queries) / (time.perf_counter() - start), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_NAME)
+    queries = load_queries(args.queries)
+    model.encode(queries[:8])  # warm up
+
+    batcher = EmbeddingBatcher(model.encode, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    modes = {
+        "per-request": lambda query: model.encode([query])[0],
+        "batched": batcher.encode,
+    }
+    print(f"{args.queries} distinct queries, batch size <= {args.max_batch_size}, max wait {args.max_wait_ms} ms")
+    for concurrency in args.concurrency:
+        for label, encode_one in modes.items():
+            batches_before, items_before = batcher.batches, batcher.items
+            qps, latencies = run(encode_one, queries, concurrency)
+            mean_batch = ""
+            if label == "batched":
+                mean_batch = f"  mean batch {(batcher.items - items_before) / max(batcher.batches - batches_before, 1):>5.1f}"
+            print(
+                f"concurrency {concurrency:>3}  {label:<12} {qps:>8.1f} q/s  "
+                f"p50 {percentile(latencies, 50) * 1000:>7.2f} ms  p99 {percentile(latencies, 99) * 1000:>7.2f} ms{mean_batch}"
+            )
+
+
+if __name__ == "__main__":
+    main()
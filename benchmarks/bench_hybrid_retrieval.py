@@ -0,0 +1,165 @@
+# benchmarks/bench_hybrid_retrieval.py
+
+"""
+Hybrid (BM25 + vector, reciprocal-rank fusion) versus pure-vector retrieval.
+
+Quality: a synthetic knowledge base in which every chunk carries a unique
+ICD-10-style code and drug name is ingested with `load_data_to_vectordb` into a
+temporary ChromaDB. Exact-term questions are then run through `_retrieve_context`
+with hybrid retrieval off and on. The benchmark reports recall@N_RESULTS, MRR and
+retrieval latency.
+
+Latency: BM25 build time, on-disk size, load time and lookup latency on a larger
+corpus (100k chunks by default). This part needs no embedding model.
+
+    python -m benchmarks.bench_hybrid_retrieval --chunks 2000 --latency-chunks 100000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_ingestion import WORDS
+from benchmarks.common import percentile, quiet
+
+from medical_assistant_app import llm_rag
+from medical_assistant_app.bm25 import BM25Builder, BM25Index
+
+import load_data_to_vectordb as ingest
+
+CONDITIONS = [
+    "type 2 diabetes", "essential hypertension", "asthma", "migraine", "atopic dermatitis",
+    "obstructive sleep apnea", "major depressive disorder", "gastro-oesophageal reflux",
+    "generalized anxiety disorder", "hypercholesterolaemia", "community-acquired pneumonia",
+    "urinary tract infection", "iron deficiency anaemia", "hypothyroidism", "osteoarthritis",
+]
+SYLLABLES = "zol var tri pex amo lin cor dex mab vir sta fen pra lo ne qui tan bra dol cef".split()
+SUFFIXES = ["ine", "ol", "mab", "pril"]
+
+
+def make_chunks(count: int, seed: int = 7) -> list[dict]:
+    """Synthetic chunks, each with a unique code and drug name buried in Zipf-distributed filler."""
+    rng = random.Random(seed)
+    filler_words = WORDS + [rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + "osis" for _ in range(3000)]
+    weights = [1 / rank for rank in range(1, len(filler_words) + 1)]
+    codes = rng.sample(range(26 * 100 * 100), count)
+    drugs = rng.sample(range(len(SYLLABLES) ** 4 * len(SUFFIXES)), count)
+    chunks = []
+    for index, (code_number, drug_number) in enumerate(zip(codes, drugs)):
+        code = f"{chr(65 + code_number % 26)}{code_number // 26 % 100:02d}.{code_number // 2600}"
+        parts = []
+        for _ in range(4):
+            parts.append(SYLLABLES[drug_number % len(SYLLABLES)])
+            drug_number //= len(SYLLABLES)
+        drug = "".join(parts) + SUFFIXES[drug_number % len(SUFFIXES)]
+        condition = rng.choice(CONDITIONS)
+        filler = " ".join(rng.choices(filler_words, weights=weights, k=60))
+        chunks.append({
+            "text": f"Guideline {index}: {filler}. The ICD-10 code for {condition} in this guideline is {code}; "
+                    f"first-line therapy is {drug}.",
+            "code": code,
+            "drug": drug,
+            "condition": condition,
+        })
+    return chunks
+
+
+def make_queries(chunks: list[dict], count: int, seed: int = 11) -> list[tuple[str, str, int]]:
+    """(kind, question, index of the chunk that answers it)."""
+    rng = random.Random(seed)
+    queries = []
+    for index in rng.sample(range(len(chunks)), min(count, len(chunks))):
+        chunk = chunks[index]
+        queries.append(("code", f"What does ICD-10 code {chunk['code']} mean?", index))
+        queries.append(("drug", f"What is {chunk['drug']} prescribed for in {chunk['condition']}?", index))
+    return queries
+
+
+def bench_lookup_latency(count: int, queries: int):
+    chunks = make_chunks(count)
+    builder = BM25Builder()
+    start = time.perf_counter()
+    for index, chunk in enumerate(chunks):
+        builder.add(f"chunk_{index}", chunk["text"])
+    index = builder.build()
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bm25_index.npz")
+        index.save(path)
+        size_mb = os.path.getsize(path) / 2**20
+        start = time.perf_counter()
+        index = BM25Index.load(path)
+        load_seconds = time.perf_counter() - start
+
+    print(f"BM25 on {count} chunks: build {build_seconds:.2f} s, {len(index.terms)} terms, "
+          f"{size_mb:.1f} MB on disk, load {load_seconds * 1000:.0f} ms")
+    for kind, question, _ in make_queries(chunks, 5):
+        index.search(question, llm_rag.HYBRID_CANDIDATES)  # warm-up
+    by_kind = {}
+    for kind, question, _ in make_queries(chunks, queries):
+        start = time.perf_counter()
+        index.search(question, llm_rag.HYBRID_CANDIDATES)
+        by_kind.setdefault(kind, []).append(time.perf_counter() - start)
+    for kind, latencies in by_kind.items():
+        print(f"  {kind:<6} queries  p50 {percentile(latencies, 50) * 1e6:>7.1f} us  "
+              f"p99 {percentile(latencies, 99) * 1e6:>7.1f} us")
+
+
+def bench_quality(count: int, queries: int):
+    chunks = make_chunks(count)
+    with tempfile.TemporaryDirectory() as workdir:
+        ingest.DATA_FILE = os.path.join(workdir, "corpus.txt")
+        ingest.CHROMA_DB_PATH = os.path.join(workdir, "chroma_db")
+        ingest.MANIFEST_PATH = os.path.join(ingest.CHROMA_DB_PATH, "ingest_manifest.json")
+        ingest.BM25_INDEX_PATH = os.path.join(ingest.CHROMA_DB_PATH, "bm25_index.npz")
+        ingest.VECTOR_INDEX_PATH = os.path.join(ingest.CHROMA_DB_PATH, "vector_index")
+        with open(ingest.DATA_FILE, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(chunk["text"] for chunk in chunks) + "\n")
+        with quiet():
+            ingest.main()
+            llm_rag.CHROMA_DB_PATH = ingest.CHROMA_DB_PATH
+            llm_rag.BM25_INDEX_PATH = ingest.BM25_INDEX_PATH
+            llm_rag.VECTOR_INDEX_PATH = ingest.VECTOR_INDEX_PATH
+            llm_rag.ANSWER_CACHE_ENABLED = False
+            if not llm_rag._initialize_rag_components():
+                raise SystemExit("RAG components failed to initialize.")
+
+        questions = make_queries(chunks, queries)
+        embeddings = llm_rag._embedding_model.encode([question for _, question, _ in questions])
+        print(f"Retrieval quality on {count} chunks, {len(questions)} exact-term questions, top {llm_rag.N_RESULTS}:")
+        for hybrid in (False, True):
+            llm_rag.HYBRID_RETRIEVAL_ENABLED = hybrid
+            latencies, hits, reciprocal_ranks = [], {}, {}
+            for (kind, question, answer), embedding in zip(questions, embeddings):
+                start = time.perf_counter()
+                with quiet():
+                    retrieved = llm_rag._retrieve_context(question, embedding)
+                latencies.append(time.perf_counter() - start)
+                rank = retrieved.index(chunks[answer]["text"]) + 1 if chunks[answer]["text"] in retrieved else None
+                hits.setdefault(kind, []).append(rank is not None)
+                reciprocal_ranks.setdefault(kind, []).append(1 / rank if rank else 0.0)
+            label = "hybrid (BM25 + vector)" if hybrid else "vector only"
+            quality = "  ".join(
+                f"{kind} recall {sum(hits[kind]) / len(hits[kind]):.2f} MRR {sum(reciprocal_ranks[kind]) / len(reciprocal_ranks[kind]):.2f}"
+                for kind in hits
+            )
+            print(f"  {label:<23} {quality}  p50 {percentile(latencies, 50) * 1000:>6.2f} ms  "
+                  f"p99 {percentile(latencies, 99) * 1000:>6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000, help="knowledge-base size for the quality comparison")
+    parser.add_argument("--latency-chunks", type=int, default=100000, help="corpus size for BM25 lookup latency")
+    parser.add_argument("--queries", type=int, default=200, help="chunks to ask about (two questions each)")
+    args = parser.parse_args()
+
+    bench_lookup_latency(args.latency_chunks, args.queries)
+    bench_quality(args.chunks, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_ingestion.py
+
+"""
+Ingests a synthetic corpus with the streaming pipeline in `load_data_to_vectordb`
+and with the previous whole-file approach (read everything, encode everything,
+`.tolist()`, one `collection.add`), each in a fresh child process, reporting
+peak RSS growth and docs/s.
+
+    python -m benchmarks.bench_ingestion --paragraphs 5000 20000
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import quiet
+
+import load_data_to_vectordb as ingest
+
+WORDS = (
+    "patient symptoms fever cough fatigue headache treatment dosage hypertension diabetes insulin "
+    "infection antibiotic inflammation chronic acute therapy diagnosis guideline screening vaccine "
+    "cardiac renal hepatic pulmonary clinical trial evidence recommendation adults children risk"
+).split()
+
+
+def write_corpus(path: str, paragraphs: int, words_per_paragraph: int = 80):
+    rng = random.Random(42)
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(paragraphs):
+            words = [rng.choice(WORDS) for _ in range(words_per_paragraph)]
+            f.write(f"Guideline {index}: " + " ".join(words) + ".\n\n")
+
+
+def _rss_kib(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def _reset_peak_rss():
+    with contextlib.suppress(OSError), open("/proc/self/clear_refs", "w") as f:
+        f.write("5")  # resets VmHWM to the current RSS (Linux)
+
+
+def legacy_ingest():
+    """The pre-streaming pipeline: whole file in memory, one encode, one add."""
+    with open(ingest.DATA_FILE, "r", encoding="utf-8") as f:
+        content = f.read()
+    documents = [chunk.strip() for chunk in content.split("\n\n") if chunk.strip()]
+    model = ingest.load_embedder(ingest.MODEL_NAME)
+    embeddings = model.encode(documents).tolist()
+    collection = ingest.chromadb.PersistentClient(path=ingest.CHROMA_DB_PATH).get_or_create_collection(ingest.COLLECTION_NAME)
+    for start in range(0, len(documents), 5000):  # ChromaDB caps the size of one add
+        collection.add(
+            ids=[f"doc_{i}" for i in range(start, min(start + 5000, len(documents)))],
+            documents=documents[start:start + 5000],
+            embeddings=embeddings[start:start + 5000],
+        )
+
+
+def _child(pipeline: str, data_file: str, db_path: str, results):
+    ingest.DATA_FILE = data_file
+    ingest.CHROMA_DB_PATH = db_path
+    ingest.MANIFEST_PATH = os.path.join(db_path, "ingest_manifest.json")
+    ingest.BM25_INDEX_PATH = os.path.join(db_path, "bm25_index.npz")
+    ingest.VECTOR_INDEX_PATH = os.path.join(db_path, "vector_index")
+    ingest.load_embedder(ingest.MODEL_NAME)  # warm the model files so both pipelines start equal
+    _reset_peak_rss()
+    baseline = _rss_kib("VmRSS")
+    start = time.perf_counter()
+    with quiet():
+        legacy_ingest() if pipeline == "whole-file" else ingest.main()
+    results.put((time.perf_counter() - start, _rss_kib("VmHWM") - baseline))
+
+
+def run(pipeline: str, data_file: str, paragraphs: int) -> tuple[float, int]:
+    context = multiprocessing.get_context("spawn")  # a clean interpreter per run
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as db_path:
+        process = context.Process(target=_child, args=(pipeline, data_file, db_path, results))
+        process.start()
+        elapsed, peak_kib = results.get()
+        process.join()
+    return paragraphs / elapsed, peak_kib
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--pipelines", nargs="+", default=["whole-file", "streaming"], choices=["whole-file", "streaming"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for paragraphs in args.paragraphs:
+            data_file = os.path.join(workdir, f"corpus_{paragraphs}.txt")
+            write_corpus(data_file, paragraphs)
+            size_mb = os.path.getsize(data_file) / 2**20
+            for pipeline in args.pipelines:
+                docs_per_second, peak_kib = run(pipeline, data_file, paragraphs)
+                print(
+                    f"{paragraphs:>8} paragraphs ({size_mb:>7.1f} MB)  {pipeline:<11} "
+                    f"{docs_per_second:>8.1f} docs/s  peak RSS +{peak_kib / 1024:>8.1f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/bench_intent.py
+
+"""
+Local intent fast-path: classification quality, cost per message, and the LLM calls it avoids.
+
+Fixture: benchmarks/data/intent_queries.jsonl, a labeled traffic mix of greetings
+and chitchat, off-topic requests and medical questions (including follow-ups,
+greetings followed by a question, and medical questions that mention off-topic
+words such as "football"). Needs the knowledge base loaded.
+
+- Confusion matrices (rows: labeled intent, columns: predicted) for the keyword
+  tier as shipped (chitchat only), with its opt-in off-topic requests, and with
+  the centroid tier at each --margins value. The cell that matters most is
+  medical -> off_topic: a question the user never gets an answer to.
+- Cost per message of the keyword tier (on the raw message) and of the centroid
+  tier (on an embedding the pipeline computes anyway).
+- The mix replayed through `get_rag_response` against a stub LLM (answer cache
+  off) with the fast-path off, as shipped (chitchat only), with keyword off-topic
+  requests, and with both off-topic tiers at INTENT_OFF_TOPIC_MARGIN: LLM calls
+  and latency by intent.
+
+    python -m benchmarks.bench_intent --margins 0 0.05 0.1 0.2 --latency 0.3
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+from medical_assistant_app.intent import GREETING, MEDICAL, OFF_TOPIC, classify_message  # noqa: E402
+
+INTENT_QUERIES = os.path.join(REPO_ROOT, "benchmarks", "data", "intent_queries.jsonl")
+INTENTS = (GREETING, OFF_TOPIC, MEDICAL)
+
+
+def load_labeled(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def predict(message: str, embedding, margin: float = None, off_topic: bool = False) -> str:
+    """The fast-path's verdict; `margin` None means the keyword tier only."""
+    intent, _ = classify_message(message, off_topic)
+    if intent == MEDICAL and margin is not None and llm_rag._intent_classifier.scores(embedding) > margin:
+        return OFF_TOPIC
+    return intent
+
+
+def print_confusion(label: str, labeled: list[dict], predicted: list[str]):
+    counts = {(true, pred): 0 for true in INTENTS for pred in INTENTS}
+    for item, pred in zip(labeled, predicted):
+        counts[item["intent"], pred] += 1
+    correct = sum(counts[intent, intent] for intent in INTENTS)
+    print(f"{label}: {correct}/{len(labeled)} correct, "
+          f"medical wrongly answered locally {counts[MEDICAL, GREETING] + counts[MEDICAL, OFF_TOPIC]}")
+    print("  " + "labeled / predicted".ljust(22) + "".join(f"{pred:>11}" for pred in INTENTS))
+    for true in INTENTS:
+        print(f"  {true:<22}" + "".join(f"{counts[true, pred]:>11}" for pred in INTENTS))
+
+
+def time_per_call(fn, args_list: list, loops: int) -> list[float]:
+    samples = []
+    for _ in range(loops):
+        for args in args_list:
+            start = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def replay(labeled: list[dict], stub) -> dict:
+    """Latencies by labeled intent and the number of LLM calls made."""
+    latencies = {intent: [] for intent in INTENTS}
+    calls = stub.request_count
+    for item in labeled:
+        start = time.perf_counter()
+        with quiet():
+            llm_rag.get_rag_response(item["message"])
+        latencies[item["intent"]].append(time.perf_counter() - start)
+    return {"latencies": latencies, "llm_calls": stub.request_count - calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=INTENT_QUERIES)
+    parser.add_argument("--margins", type=float, nargs="*", default=[0.0, 0.05, 0.1, 0.2], help="centroid margins to try")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub LLM latency in seconds")
+    parser.add_argument("--loops", type=int, default=200, help="passes over the mix when timing the classifiers")
+    args = parser.parse_args()
+
+    labeled = load_labeled(args.queries)
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    llm_rag.INTENT_FAST_PATH_ENABLED = True
+    llm_rag.INTENT_CENTROID_ENABLED = True
+    with quiet():
+        if not llm_rag.warm_up_rag_components() or llm_rag._intent_classifier is None:
+            raise SystemExit("RAG components or the intent classifier failed to load.")
+        embeddings = [llm_rag._embed_query(item["message"]) for item in labeled]
+
+    mix = ", ".join(f"{sum(item['intent'] == intent for item in labeled)} {intent}" for intent in INTENTS)
+    print(f"{len(labeled)} messages ({mix}), embedding model {llm_rag.MODEL_NAME}")
+    print_confusion("keyword tier, chitchat only (default)", labeled, [predict(item["message"], None) for item in labeled])
+    print_confusion("keyword tier with off-topic requests", labeled,
+                    [predict(item["message"], None, off_topic=True) for item in labeled])
+    for margin in args.margins:
+        predicted = [predict(item["message"], embedding, margin) for item, embedding in zip(labeled, embeddings)]
+        print_confusion(f"chitchat + centroid, margin {margin:g}", labeled, predicted)
+
+    keyword = time_per_call(classify_message, [(item["message"], True) for item in labeled], args.loops)
+    centroid = time_per_call(llm_rag._intent_classifier.scores, [(embedding,) for embedding in embeddings], args.loops)
+    print(f"Cost per message: keyword tier p50 {percentile(keyword, 50) * 1e6:.1f} us, p99 {percentile(keyword, 99) * 1e6:.1f} us; "
+          f"centroid tier p50 {percentile(centroid, 50) * 1e6:.1f} us, p99 {percentile(centroid, 99) * 1e6:.1f} us")
+
+    print(f"Replay through get_rag_response, stub LLM {args.latency * 1000:.0f} ms, "
+          f"centroid margin {llm_rag.INTENT_OFF_TOPIC_MARGIN:g}:")
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        modes = (("fast-path off", False, False, False), ("default", True, False, False),
+                 ("keyword", True, True, False), ("both tiers", True, True, True))
+        for label, enabled, keyword_off_topic, centroid in modes:
+            llm_rag.INTENT_FAST_PATH_ENABLED = enabled
+            llm_rag.INTENT_KEYWORD_OFF_TOPIC_ENABLED = keyword_off_topic
+            llm_rag.INTENT_CENTROID_ENABLED = centroid
+            run = replay(labeled, stub)
+            everything = [latency for latencies in run["latencies"].values() for latency in latencies]
+            print(f"  {label:<14} LLM calls {run['llm_calls']:>4}/{len(labeled)}  "
+                  f"total {sum(everything):>6.1f} s  p50 {percentile(everything, 50) * 1000:>7.1f} ms")
+            for intent in INTENTS:
+                latencies = run["latencies"][intent]
+                print(f"    {intent:<12} p50 {percentile(latencies, 50) * 1000:>8.2f} ms  "
+                      f"p95 {percentile(latencies, 95) * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
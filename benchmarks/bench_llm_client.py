@@ -0,0 +1,82 @@
+# benchmarks/bench_llm_client.py
+
+"""
+Exercises LLMClient against the local stub LLM server:
+
+1. connection reuse: per-call `requests.post` vs the pooled client,
+2. injected transient errors: success rate without and with retries,
+3. a full outage: time spent per call without and with the circuit breaker.
+
+    python -m benchmarks.bench_llm_client --calls 200 --error-rate 0.3
+"""
+
+import argparse
+import json
+import time
+
+import requests
+
+from benchmarks.common import percentile
+from benchmarks.stub_llm import StubLLMServer
+from medical_assistant_app.llm_client import CircuitBreaker, LLMClient, LLMClientError
+
+PAYLOAD = {"contents": [{"role": "user", "parts": [{"text": "What are the symptoms of a common cold?"}]}]}
+
+
+def timed_calls(call, count: int) -> tuple[list[float], int]:
+    """Runs `call` `count` times; returns per-call latencies and the number of failures."""
+    latencies, failures = [], 0
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            call()
+        except (LLMClientError, requests.exceptions.RequestException):
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, failures
+
+
+def report(label: str, latencies: list[float], failures: int):
+    print(
+        f"{label:<34} ok {len(latencies) - failures:>4}/{len(latencies):<4} "
+        f"mean {sum(latencies) / len(latencies) * 1000:>8.2f} ms  p99 {percentile(latencies, 99) * 1000:>8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.3, help="fraction of injected 503s in scenario 2")
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=0.0) as stub:
+        print("1. Connection reuse (stub latency 0 ms)")
+
+        def fresh_connection():
+            response = requests.post(f"{stub.url}?key=bench", data=json.dumps(PAYLOAD),
+                                     headers={"Content-Type": "application/json"}, timeout=60)
+            response.raise_for_status()
+
+        report("requests.post per call", *timed_calls(fresh_connection, args.calls))
+        pooled = LLMClient(stub.url, "bench")
+        report("LLMClient (pooled)", *timed_calls(lambda: pooled.generate(PAYLOAD), args.calls))
+
+        print(f"\n2. Transient errors ({args.error_rate:.0%} injected 503s)")
+        stub.error_rate = args.error_rate
+        no_retry = LLMClient(stub.url, "bench", max_retries=0, breaker=CircuitBreaker(failure_threshold=10**9))
+        report("no retries", *timed_calls(lambda: no_retry.generate(PAYLOAD), args.calls))
+        retrying = LLMClient(stub.url, "bench", max_retries=3, backoff_base=0.01, breaker=CircuitBreaker(failure_threshold=10**9))
+        report("3 retries, jittered backoff", *timed_calls(lambda: retrying.generate(PAYLOAD), args.calls))
+
+        print("\n3. Outage (every request fails after 200 ms)")
+        stub.error_rate, stub.latency = 1.0, 0.2
+        calls = max(args.calls // 10, 10)
+        unguarded = LLMClient(stub.url, "bench", max_retries=3, backoff_base=0.05, breaker=CircuitBreaker(failure_threshold=10**9))
+        report("retries, no circuit breaker", *timed_calls(lambda: unguarded.generate(PAYLOAD), calls))
+        guarded = LLMClient(stub.url, "bench", max_retries=3, backoff_base=0.05, breaker=CircuitBreaker(failure_threshold=5))
+        report("retries + circuit breaker", *timed_calls(lambda: guarded.generate(PAYLOAD), calls))
+        print(f"{'':<34} breaker state after outage: {guarded.breaker.state}")
+
+
+if __name__ == "__main__":
+    main()
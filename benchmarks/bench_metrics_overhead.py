@@ -0,0 +1,103 @@
+# benchmarks/bench_metrics_overhead.py
+
+"""
+Overhead of the per-stage timing spans behind /metrics and the Server-Timing header.
+
+1. Cost of one `span()` (timer, histogram update and per-request timings) against
+   an empty context manager, from one thread and from several contending threads.
+2. Cost of rendering /metrics.
+3. `aget_rag_response` end to end, with spans as shipped and with spans replaced
+   by a no-op. The stub LLM answers instantly and the answer cache is off, so the
+   difference is as large a share of a request as it can be.
+
+    python -m benchmarks.bench_metrics_overhead --spans 200000 --requests 600
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag, metrics  # noqa: E402
+
+
+def _null_span(stage: str):
+    return contextlib.nullcontext()
+
+
+def time_spans(span_fn, count: int, threads: int) -> float:
+    """Nanoseconds per span when `threads` threads each run `count` spans."""
+    def loop(_):
+        for _ in range(count):
+            with span_fn("embed"):
+                pass
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(loop, range(threads)))
+    return (time.perf_counter() - start) / (count * threads) * 1e9
+
+
+def time_requests(total: int) -> list[float]:
+    async def run():
+        latencies = []
+        for index in range(total):
+            metrics.start_request_timings()
+            start = time.perf_counter()
+            await llm_rag.aget_rag_response(f"What are the symptoms of a common cold? (case {index})")
+            latencies.append(time.perf_counter() - start)
+        await llm_rag._get_llm_client().aclose()
+        return latencies
+
+    with quiet():
+        return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=200000, help="spans per thread in the micro-benchmark")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--rounds", type=int, default=6, help="alternations between spans off and on")
+    args = parser.parse_args()
+
+    for threads in (1, args.threads):
+        baseline = time_spans(_null_span, args.spans // threads, threads)
+        timed = time_spans(metrics.span, args.spans // threads, threads)
+        print(f"span, {threads} thread(s): {timed:>7.0f} ns  (empty context manager {baseline:.0f} ns, "
+              f"overhead {timed - baseline:.0f} ns)")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        text = metrics.REGISTRY.render()
+    print(f"/metrics render: {(time.perf_counter() - start) * 10:.2f} ms for {len(text.splitlines())} lines")
+
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    with quiet():
+        if not llm_rag.warm_up_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+    with StubLLMServer(latency=0.0) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        time_requests(20)  # warm-up
+        results = {"spans off": [], "spans on": []}
+        for _ in range(args.rounds):  # alternate, so drift affects both alike
+            for label, span_fn in (("spans off", _null_span), ("spans on", metrics.span)):
+                llm_rag.span = span_fn
+                results[label] += time_requests(args.requests // args.rounds)
+        llm_rag.span = metrics.span
+    for label, latencies in results.items():
+        print(f"aget_rag_response, {label:<9}  p50 {percentile(latencies, 50) * 1000:>7.3f} ms  "
+              f"p99 {percentile(latencies, 99) * 1000:>7.3f} ms")
+    off, on = (percentile(results[label], 50) for label in ("spans off", "spans on"))
+    print(f"p50 difference: {(on - off) * 1e6:+.0f} us ({(on - off) / off * 100:+.2f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# benchmarks/bench_parallel_embedding.py
+
+"""
+Scaling benchmark for multi-process ingestion: ingests the same synthetic corpus
+into a fresh ChromaDB directory with 1..N embedding workers and reports docs/s.
+Worker start-up (each worker loads the model) is included in the totals.
+
+    python -m benchmarks.bench_parallel_embedding --paragraphs 20000 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.bench_ingestion import write_corpus
+from benchmarks.common import quiet
+
+import load_data_to_vectordb as ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ingest.DATA_FILE = os.path.join(workdir, "corpus.txt")
+        write_corpus(ingest.DATA_FILE, args.paragraphs)
+        print(f"{args.paragraphs} paragraphs, {os.cpu_count()} CPUs")
+
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            ingest.CHROMA_DB_PATH = tempfile.mkdtemp(dir=workdir)
+            ingest.MANIFEST_PATH = os.path.join(ingest.CHROMA_DB_PATH, "ingest_manifest.json")
+            ingest.BM25_INDEX_PATH = os.path.join(ingest.CHROMA_DB_PATH, "bm25_index.npz")
+            ingest.VECTOR_INDEX_PATH = os.path.join(ingest.CHROMA_DB_PATH, "vector_index")
+            with quiet():
+                timings = ingest.main(workers=workers)
+            docs_per_second = args.paragraphs / timings["total"]
+            baseline = baseline or docs_per_second
+            print(
+                f"workers {workers:>3}  {docs_per_second:>9.1f} docs/s  speed-up {docs_per_second / baseline:>5.2f}x  "
+                f"(waiting on embeddings {timings.get('embed', 0.0):>7.2f} s, upserts {timings.get('upsert', 0.0):>7.2f} s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
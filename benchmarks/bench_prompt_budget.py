@@ -0,0 +1,123 @@
+# benchmarks/bench_prompt_budget.py
+
+"""
+Prompt size and end-to-end LLM latency with and without the prompt context budget.
+
+Fixture: the questions in benchmarks/data/query_log.txt against the paragraphs of
+medical_data.txt. Three knowledge-base shapes are tried: one paragraph per chunk
+(as ingested today), --paragraphs-per-chunk paragraphs per chunk (longer
+documents), and the long chunks plus a near-duplicate of each (e.g. a fact
+regenerated with slightly different wording). For each question, the top
+N_RESULTS chunks come from a BM25 search, so no embedding model is needed.
+
+Prompts are built without a budget (what every request sent before) and with
+each --budgets value, then sent to a stub LLM whose time to first token grows
+by --prompt-token-delay per prompt token, modelling prefill cost.
+
+    python -m benchmarks.bench_prompt_budget --budgets 200 400 --prompt-token-delay 0.0002
+"""
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+from medical_assistant_app.bm25 import BM25Builder  # noqa: E402
+from medical_assistant_app.prompt_builder import estimate_tokens, split_sentences  # noqa: E402
+
+QUERY_LOG = os.path.join(REPO_ROOT, "benchmarks", "data", "query_log.txt")
+DATA_FILE = os.path.join(REPO_ROOT, "medical_data.txt")
+
+
+def load_fixture() -> tuple[list[str], list[str]]:
+    with open(QUERY_LOG, encoding="utf-8") as f:
+        queries = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    with open(DATA_FILE, encoding="utf-8") as f:
+        paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", f.read()) if paragraph.strip()]
+    return queries, paragraphs
+
+
+def near_duplicate(chunk: str) -> str:
+    """The chunk reworded slightly: last sentence dropped, a short note added."""
+    sentences = split_sentences(chunk)
+    return " ".join(sentences[:-1] if len(sentences) > 1 else sentences) + " Reviewed for the current edition."
+
+
+def retrieved_documents(queries: list[str], chunks: list[str]) -> list[list[str]]:
+    builder = BM25Builder()
+    for index, chunk in enumerate(chunks):
+        builder.add(str(index), chunk)
+    index = builder.build()
+    return [[chunks[int(cid)] for cid, _ in index.search(query, llm_rag.N_RESULTS)] for query in queries]
+
+
+def run(queries: list[str], documents: list[list[str]], budget: int, similarity: float, workers: int) -> dict:
+    llm_rag.PROMPT_CONTEXT_TOKEN_BUDGET = budget
+    llm_rag.PROMPT_DUPLICATE_SIMILARITY = similarity
+    build_seconds, prompts = [], []
+    for query, docs in zip(queries, documents):
+        start = time.perf_counter()
+        prompts.append(llm_rag._build_prompt(query, docs))
+        build_seconds.append(time.perf_counter() - start)
+
+    def timed_call(prompt):
+        start = time.perf_counter()
+        llm_rag._call_gemini_api(prompt)
+        return time.perf_counter() - start
+
+    with quiet(), ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(timed_call, prompts))
+    tokens = [estimate_tokens(prompt) for prompt in prompts]
+    return {
+        "mean_tokens": sum(tokens) / len(tokens),
+        "max_tokens": max(tokens),
+        "build_us": percentile(build_seconds, 50) * 1e6,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[200, 400], help="context budgets in tokens")
+    parser.add_argument("--paragraphs-per-chunk", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM base latency in seconds")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0002, help="stub prefill seconds per prompt token")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent LLM calls")
+    args = parser.parse_args()
+
+    queries, paragraphs = load_fixture()
+    step = args.paragraphs_per_chunk
+    long_chunks = ["\n".join(paragraphs[start:start + step]) for start in range(0, len(paragraphs), step)]
+    shapes = [
+        ("1 paragraph per chunk", paragraphs),
+        (f"{step} paragraphs per chunk", long_chunks),
+        (f"{step} paragraphs + near-duplicates", [c for chunk in long_chunks for c in (chunk, near_duplicate(chunk))]),
+    ]
+    settings = [("no budget", 0, 1.01)] + [(f"budget {budget}", budget, 0.8) for budget in args.budgets]
+
+    with StubLLMServer(latency=args.latency, prompt_token_delay=args.prompt_token_delay) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"{len(queries)} questions, top {llm_rag.N_RESULTS} chunks, prompt prefix "
+              f"{estimate_tokens(llm_rag.PROMPT_PREFIX)} tokens, stub LLM {args.latency * 1000:.0f} ms + "
+              f"{args.prompt_token_delay * 1e6:.0f} us per prompt token")
+        for shape, chunks in shapes:
+            documents = retrieved_documents(queries, chunks)
+            print(shape)
+            for label, budget, similarity in settings:
+                stats = run(queries, documents, budget, similarity, args.workers)
+                print(
+                    f"  {label:<11} prompt {stats['mean_tokens']:>6.0f} tokens avg {stats['max_tokens']:>6} max  "
+                    f"build {stats['build_us']:>6.1f} us  LLM p50 {stats['p50_ms']:>7.1f} ms  p99 {stats['p99_ms']:>7.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_quantized_vectors.py
+
+"""
+Memory per worker, query latency and recall@k of the quantized NumPy vector
+index (int8 with per-vector scale, float16, each with and without a float32
+re-rank) against the float32 setups: ChromaDB and the exact float32 NumPy search.
+The exact search is the ground truth for recall.
+
+The corpus is clustered like real embeddings, so that near neighbours are close
+in score and quantization error can change the ranking. Each setup runs in a
+fresh child process. "private" memory is counted once per worker, while the
+memory-mapped index ("shared") is counted once per host. The per-worker column
+divides the shared part over --workers.
+
+    python -m benchmarks.bench_quantized_vectors --size 100000 --rerank 50 --workers 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_vector_backends import build_corpus, run, unit_vectors
+from benchmarks.common import percentile, quiet
+
+
+def clustered_vectors(clusters: int = 1000, spread: float = 0.35):
+    """Returns a `vectors(rng, count)` generator: unit vectors scattered around fixed random centres."""
+    centres = unit_vectors(np.random.default_rng(1), clusters)
+
+    def vectors(rng, count: int) -> np.ndarray:
+        points = centres[rng.integers(0, clusters, count)] + spread * unit_vectors(rng, count)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rerank", type=int, default=50, help="candidates rescored in float32")
+    parser.add_argument("--workers", type=int, default=4, help="workers per host sharing the memory-mapped index")
+    parser.add_argument("--no-chroma", action="store_true", help="skip building the ChromaDB collection")
+    args = parser.parse_args()
+
+    setups = [
+        ("numpy float32 (exact)", "numpy", {}),
+        ("numpy int8", "numpy", {"dtype": "int8"}),
+        (f"numpy int8 + rerank {args.rerank}", "numpy", {"dtype": "int8", "rerank_candidates": args.rerank}),
+        ("numpy float16", "numpy", {"dtype": "float16"}),
+        (f"numpy float16 + rerank {args.rerank}", "numpy", {"dtype": "float16", "rerank_candidates": args.rerank}),
+    ]
+    if not args.no_chroma:
+        setups.insert(1, ("chroma float32 (HNSW)", "chroma", {}))
+
+    vectors = clustered_vectors()
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        with quiet():
+            build_corpus(workdir, args.size, not args.no_chroma, vectors=vectors, quantizations=("int8", "float16"))
+        print(f"{args.size} chunks ({time.perf_counter() - start:.1f} s to build), {args.queries} queries, "
+              f"top {args.k}, memory per worker at {args.workers} workers")
+        queries_path = os.path.join(workdir, "queries.npy")
+        np.save(queries_path, vectors(np.random.default_rng(0), args.queries))
+
+        exact_ids = None
+        for label, backend, options in setups:
+            _, latencies, ids, memory = run(backend, workdir, queries_path, args.k, options)
+            if exact_ids is None:  # the first setup is the exact search
+                exact_ids = ids
+            recall = np.mean([len(set(found) & set(exact)) / args.k for found, exact in zip(ids, exact_ids)])
+            private_mb, shared_mb = memory["RssAnon"] / 1024, memory["RssFile"] / 1024
+            print(
+                f"  {label:<28} p50 {percentile(latencies, 50) * 1000:>8.3f} ms  p99 {percentile(latencies, 99) * 1000:>8.3f} ms  "
+                f"private +{private_mb:>7.1f} MB  shared +{shared_mb:>7.1f} MB  "
+                f"per worker {private_mb + shared_mb / args.workers:>7.1f} MB  recall@{args.k} {recall:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_reranking.py
+
+"""
+Retrieval quality, prompt size and latency with and without cross-encoder re-ranking.
+
+Fixture: benchmarks/data/labeled_queries.jsonl. Each line holds a question and
+the titles of the knowledge-base chunks that answer it (a chunk is relevant if it
+starts with one); off-topic questions have none. Needs the knowledge base loaded
+(python load_data_to_vectordb.py).
+
+For each question, context is retrieved as shipped (top N_RESULTS) and with
+re-ranking (RERANK_CANDIDATES over-fetched, the best N_RESULTS kept), then with
+each --min-scores cutoff applied to the re-ranked chunks. Reported per setting:
+
+- hit rate: on-topic questions with at least one relevant chunk in the context.
+- precision: share of context chunks (of on-topic questions) that are relevant.
+- off-topic skipped: off-topic questions sent with no context at all.
+- prompt tokens: mean estimated tokens of the built prompt, on- and off-topic.
+- retrieve p50/p95: time of `_retrieve_context`, i.e. the cost per request.
+
+    python -m benchmarks.bench_reranking --candidates 10 --min-scores -5 0 5
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+from medical_assistant_app.prompt_builder import estimate_tokens  # noqa: E402
+
+LABELED_QUERIES = os.path.join(REPO_ROOT, "benchmarks", "data", "labeled_queries.jsonl")
+
+
+def load_labeled_queries(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(document: str, titles: list[str]) -> bool:
+    return any(document.strip().startswith(title) for title in titles)
+
+
+def retrieve_all(labeled: list[dict], embeddings, repeats: int) -> tuple[list[list[str]], list[float]]:
+    """Context for every question, and the per-request retrieval times over `repeats` passes."""
+    contexts, timings = [], []
+    with quiet():
+        for _ in range(repeats):
+            contexts = []
+            for item, embedding in zip(labeled, embeddings):
+                start = time.perf_counter()
+                contexts.append(llm_rag._retrieve_context(item["query"], embedding))
+                timings.append(time.perf_counter() - start)
+    return contexts, timings
+
+
+def report(label: str, labeled: list[dict], contexts: list[list[str]], timings: list[float] = None):
+    on_topic = [(item, docs) for item, docs in zip(labeled, contexts) if item["relevant"]]
+    off_topic = [docs for item, docs in zip(labeled, contexts) if not item["relevant"]]
+    hits = sum(any(is_relevant(doc, item["relevant"]) for doc in docs) for item, docs in on_topic)
+    shown = sum(len(docs) for _, docs in on_topic)
+    relevant = sum(is_relevant(doc, item["relevant"]) for item, docs in on_topic for doc in docs)
+    with quiet():
+        tokens = [estimate_tokens(llm_rag._build_prompt(item["query"], docs)) for item, docs in zip(labeled, contexts)]
+    on_tokens = [t for item, t in zip(labeled, tokens) if item["relevant"]]
+    off_tokens = [t for item, t in zip(labeled, tokens) if not item["relevant"]]
+    line = (f"  {label:<22} hit rate {hits:>2}/{len(on_topic)}  precision {relevant / shown if shown else 0:>5.0%}  "
+            f"off-topic skipped {sum(not docs for docs in off_topic)}/{len(off_topic)}  "
+            f"prompt tokens {sum(on_tokens) / len(on_tokens):>6.0f} on / {sum(off_tokens) / max(1, len(off_tokens)):>6.0f} off")
+    if timings:
+        line += f"  retrieve p50 {percentile(timings, 50) * 1000:>6.1f} ms  p95 {percentile(timings, 95) * 1000:>6.1f} ms"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=LABELED_QUERIES)
+    parser.add_argument("--candidates", type=int, default=llm_rag.RERANK_CANDIDATES, help="chunks over-fetched for re-ranking")
+    parser.add_argument("--min-scores", type=float, nargs="*", default=[-5.0, 0.0, 5.0], help="score cutoffs to try")
+    parser.add_argument("--repeats", type=int, default=5, help="timed passes over the questions")
+    args = parser.parse_args()
+
+    labeled = load_labeled_queries(args.queries)
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    llm_rag.RERANK_ENABLED = True
+    llm_rag.RERANK_CANDIDATES = args.candidates
+    with quiet():
+        if not llm_rag.warm_up_rag_components() or llm_rag._reranker is None:
+            raise SystemExit("RAG components or the re-ranking model failed to load.")
+        embeddings = [llm_rag._embed_query(item["query"]) for item in labeled]
+
+    print(f"{len(labeled)} questions ({sum(not item['relevant'] for item in labeled)} off-topic), "
+          f"top {llm_rag.N_RESULTS} chunks, re-ranking {args.candidates} candidates with {llm_rag.RERANK_MODEL_NAME}")
+    llm_rag.RERANK_ENABLED = False
+    contexts, timings = retrieve_all(labeled, embeddings, args.repeats)
+    report("retrieval order", labeled, contexts, timings)
+
+    llm_rag.RERANK_ENABLED = True
+    llm_rag.RERANK_MIN_SCORE = None
+    reranked, rerank_timings = retrieve_all(labeled, embeddings, args.repeats)
+    report("re-ranked", labeled, reranked, rerank_timings)
+    print(f"  re-ranking adds {(percentile(rerank_timings, 50) - percentile(timings, 50)) * 1000:.1f} ms "
+          f"per request at p50")
+
+    # Cutoffs only drop chunks from the re-ranked lists, so they are applied to their scores.
+    scores = [
+        list(llm_rag._reranker.predict([(item["query"], doc) for doc in docs])) if docs else []
+        for item, docs in zip(labeled, reranked)
+    ]
+    relevant_scores = [s for item, docs, doc_scores in zip(labeled, reranked, scores)
+                       for doc, s in zip(docs, doc_scores) if is_relevant(doc, item["relevant"])]
+    other_scores = [s for item, docs, doc_scores in zip(labeled, reranked, scores)
+                    for doc, s in zip(docs, doc_scores) if not is_relevant(doc, item["relevant"])]
+    print(f"  scores: relevant chunks p50 {percentile(relevant_scores, 50):.2f} (min {min(relevant_scores, default=0):.2f}), "
+          f"other chunks p50 {percentile(other_scores, 50):.2f} (max {max(other_scores, default=0):.2f})")
+    for min_score in args.min_scores:
+        cut = [[doc for doc, s in zip(docs, doc_scores) if s >= min_score] for docs, doc_scores in zip(reranked, scores)]
+        report(f"re-ranked, min {min_score:g}", labeled, cut)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/bench_sharding.py
+
+"""
+Ingest throughput and query latency of the sharded ChromaDB knowledge base
+(VECTOR_SHARDS) against the shard count, for both shard layouts.
+
+For each shard count and layout, a fresh child process writes a corpus of
+random unit vectors through `load_data_to_vectordb._BatchWriter` (the
+shard-aware upsert path, in batches of UPSERT_BATCH_SIZE; embedding is left
+out, it costs the same however the chunks are stored, see
+bench_parallel_embedding), then queries it through `llm_rag.ShardedRetriever`
+(`llm_rag.ChromaRetriever` for one shard): single-query latency, throughput
+with --clients concurrent callers, and recall@k against an exact search, since
+each shard's HNSW graph is approximate on its own.
+
+Shards are searched and written on threads, so the gains depend on free cores.
+
+    python -m benchmarks.bench_sharding --size 100000 --shards 1 2 4 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_vector_backends import unit_vectors
+from benchmarks.common import percentile, quiet
+
+from medical_assistant_app.sharding import SHARD_LAYOUTS
+
+
+def _child(size: int, shards: int, layout: str, workdir: str, queries_path: str, args: dict, results):
+    import load_data_to_vectordb as ingest
+    from medical_assistant_app import llm_rag
+    from medical_assistant_app.sharding import shard_locations
+
+    ingest.CHROMA_DB_PATH = os.path.join(workdir, "chroma_db")
+    vectors = unit_vectors(np.random.default_rng(size), size)
+    queries = np.load(queries_path)
+
+    timings = {}
+    with quiet():
+        collections = ingest.open_shards(shards, layout)
+        writer = ingest._BatchWriter(collections, set(), timings)
+        start = time.perf_counter()
+        for offset in range(0, size, ingest.UPSERT_BATCH_SIZE):
+            rows = range(offset, min(offset + ingest.UPSERT_BATCH_SIZE, size))
+            writer._write([f"chunk_{row}" for row in rows], [f"Synthetic chunk {row}." for row in rows], vectors[offset:rows.stop])
+        ingest_seconds = time.perf_counter() - start
+        writer.close()
+
+    # The app's retriever, opened from the directories the ingest wrote.
+    retrievers = [
+        llm_rag.ChromaRetriever(ingest.chromadb.PersistentClient(path=path).get_collection(name), path)
+        for path, name in shard_locations(ingest.CHROMA_DB_PATH, llm_rag.COLLECTION_NAME, shards, layout)
+    ]
+    retriever = llm_rag.ShardedRetriever(retrievers) if shards > 1 else retrievers[0]
+    for query in queries[:10]:
+        retriever.query(query, args["k"])  # warm-up
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = retriever.query(query, args["k"])
+        latencies.append(time.perf_counter() - start)
+        found.append({int(cid.split("_")[1]) for cid in ids})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args["clients"]) as pool:
+        list(pool.map(lambda query: retriever.query(query, args["k"]), queries))
+    qps = len(queries) / (time.perf_counter() - start)
+
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args["k"]]
+    recall = np.mean([len(ids & set(row)) / args["k"] for ids, row in zip(found, exact)])
+    results.put({
+        "docs_per_second": size / ingest_seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "qps": qps,
+        "recall": recall,
+    })
+
+
+def run(size: int, shards: int, layout: str, queries_path: str, args: dict) -> dict:
+    context = multiprocessing.get_context("spawn")  # a clean interpreter per configuration
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as workdir:
+        process = context.Process(target=_child, args=(size, shards, layout, workdir, queries_path, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="chunks in the corpus")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--layouts", nargs="+", choices=SHARD_LAYOUTS, default=list(SHARD_LAYOUTS))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent callers for the throughput run")
+    parser.add_argument("--k", type=int, default=10, help="chunks per query (HYBRID_CANDIDATES by default)")
+    args = parser.parse_args()
+
+    settings = {"k": args.k, "clients": args.clients}
+    with tempfile.TemporaryDirectory() as workdir:
+        queries_path = os.path.join(workdir, "queries.npy")
+        np.save(queries_path, unit_vectors(np.random.default_rng(0), args.queries))
+        print(f"{args.size} chunks, {args.queries} queries, k={args.k}, {os.cpu_count()} CPUs")
+        for layout in args.layouts:
+            for shards in args.shards:
+                if shards == 1 and layout != args.layouts[0]:
+                    continue  # one shard is the unsharded collection whatever the layout
+                result = run(args.size, shards, layout, queries_path, settings)
+                label = "unsharded" if shards == 1 else f"{shards} shards, {layout}"
+                print(f"  {label:<24} ingest {result['docs_per_second']:>8.0f} docs/s  "
+                      f"query p50 {result['p50_ms']:>7.2f} ms  p99 {result['p99_ms']:>7.2f} ms  "
+                      f"{result['qps']:>7.0f} q/s ({args.clients} clients)  recall@{args.k} {result['recall']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_singleflight.py
+
+"""
+Fires N concurrent identical questions at `get_rag_response` (threads) and
+`aget_rag_response` (asyncio) with request coalescing off and on, and reports
+how many embeddings and LLM calls were made and the latency callers saw.
+The answer cache is disabled so that only coalescing is measured.
+
+    python -m benchmarks.bench_singleflight --concurrency 50 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+QUERY = "What are the symptoms of a common cold?"
+VARIANTS = [QUERY, QUERY.lower(), QUERY.upper(), "  what are the symptoms of a common  cold  "]
+
+
+class _EmbedCounter:
+    """Wraps the embedding model's `encode` to count the queries it embeds."""
+
+    def __init__(self, model):
+        self.count = 0
+        self._encode = model.encode
+
+    def __call__(self, texts, *args, **kwargs):
+        self.count += len(texts)
+        return self._encode(texts, *args, **kwargs)
+
+
+def run_threads(concurrency: int) -> list[float]:
+    def timed(index):
+        start = time.perf_counter()
+        llm_rag.get_rag_response(VARIANTS[index % len(VARIANTS)])
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(concurrency)))
+
+
+def run_asyncio(concurrency: int) -> list[float]:
+    async def timed(index):
+        start = time.perf_counter()
+        await llm_rag.aget_rag_response(VARIANTS[index % len(VARIANTS)])
+        return time.perf_counter() - start
+
+    async def run():
+        latencies = await asyncio.gather(*(timed(i) for i in range(concurrency)))
+        await llm_rag._get_llm_client().aclose()
+        return list(latencies)
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    args = parser.parse_args()
+
+    llm_rag.ANSWER_CACHE_ENABLED = False
+    llm_rag.RAG_EXECUTOR_WORKERS = max(llm_rag.RAG_EXECUTOR_WORKERS, args.concurrency)
+    with quiet():
+        if not llm_rag._initialize_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+    # Installed before the first query, so the embedding batcher picks it up too.
+    counter = llm_rag._embedding_model.encode = _EmbedCounter(llm_rag._embedding_model)
+
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"{args.concurrency} concurrent identical queries, stub LLM latency {args.latency * 1000:.0f} ms")
+        for runner in (run_threads, run_asyncio):
+            for enabled in (False, True):
+                llm_rag.SINGLE_FLIGHT_ENABLED = enabled
+                embeds_before, calls_before = counter.count, stub.request_count
+                start = time.perf_counter()
+                with quiet():
+                    latencies = runner(args.concurrency)
+                elapsed = time.perf_counter() - start
+                label = f"{runner.__name__[4:]}, coalescing {'on' if enabled else 'off'}"
+                print(
+                    f"{label:<24} embeddings {counter.count - embeds_before:>4}  LLM calls {stub.request_count - calls_before:>4}  "
+                    f"wall {elapsed * 1000:>8.1f} ms  p50 {percentile(latencies, 50) * 1000:>8.1f} ms  "
+                    f"p99 {percentile(latencies, 99) * 1000:>8.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# benchmarks/bench_startup.py
+
+"""
+Startup cost of the Django project: wall time, peak RSS and import-time breakdown.
+
+Each scenario runs in a fresh interpreter, --repeats times:
+
+- check: `manage.py check`, which loads the URLconf like every management command.
+- index: a worker started like an ASGI worker (the ASGI module, then the
+         lifespan startup), then GET / (the chat page).
+- chat:  the same worker, then the first POST /api/chat/ against a stub LLM.
+
+Every scenario runs under two configurations:
+
+- default: RAG_WARMUP_ON_STARTUP unset, as deployed. Workers load the RAG stack
+  (knowledge base, embedding model) in a background thread at startup; the run
+  waits for that thread after the request, so peak RSS is what the worker holds
+  once settled, and "warm-up" is how long it kept running after the request.
+- lazy: RAG_WARMUP_ON_STARTUP=0, so the RAG stack is only loaded by the first
+  chat request. This is what workers that serve no chats (the chat page, the
+  admin) should run with.
+
+Reported per scenario: median wall time of the whole process, median setup
+(django.setup() and URLconf) and request time, peak RSS, and which heavy modules
+ended up imported. One extra run per scenario under `python -X importtime` gives
+the slowest top-level packages (self time of all their modules, summed).
+
+To compare two trees, check the older one out elsewhere and point --repo at it:
+
+    git worktree add /tmp/before HEAD~1
+    python -m benchmarks.bench_startup --repo /tmp/before
+    python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.common import REPO_ROOT
+from benchmarks.stub_llm import StubLLMServer
+
+SCENARIOS = ("check", "index", "chat")
+CONFIGURATIONS = {"default": {}, "lazy": {"RAG_WARMUP_ON_STARTUP": "0"}}
+HEAVY_MODULES = ("medical_assistant_app.llm_rag", "numpy", "aiohttp", "requests", "chromadb", "torch", "sentence_transformers")
+RESULT_PREFIX = "BENCH_STARTUP_RESULT "
+
+# Runs in the child interpreter, from the root of the tree being measured.
+CHILD = r"""
+import json, os, resource, sys, threading, time
+start = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_assistant_project.settings')
+scenario = sys.argv[1]
+result = {}
+if scenario == 'check':
+    sys.argv = ['manage.py', 'check']
+    from django.core.management import execute_from_command_line
+    execute_from_command_line(sys.argv)
+    result['setup_ms'] = (time.perf_counter() - start) * 1000
+else:
+    import asyncio
+    from django.conf import settings
+    from django.urls import resolve
+    import medical_assistant_project.asgi  # django.setup(), as a server starts
+    from medical_assistant_app.lifecycle import start_rag_warmup
+    start_rag_warmup()  # what the lifespan startup event does in each worker
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    resolve('/')  # loads the URLconf, as a server's first request would
+    result['setup_ms'] = (time.perf_counter() - start) * 1000
+    from django.test import AsyncClient
+    client = AsyncClient()
+    request_start = time.perf_counter()
+    if scenario == 'index':
+        response = asyncio.run(client.get('/'))
+    else:
+        body = json.dumps({'message': 'What are the symptoms of diabetes?'})
+        response = asyncio.run(client.post('/api/chat/', body, content_type='application/json'))
+    result['request_ms'] = (time.perf_counter() - request_start) * 1000
+    result['status'] = response.status_code
+    settle_start = time.perf_counter()
+    for thread in threading.enumerate():
+        if thread.name == 'rag-warmup':
+            thread.join()
+            result['warmup_ms'] = (time.perf_counter() - settle_start) * 1000
+result['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+result['loaded'] = [name for name in json.loads(os.environ['BENCH_HEAVY_MODULES']) if name in sys.modules]
+print('BENCH_STARTUP_RESULT ' + json.dumps(result), flush=True)
+"""
+
+
+def run_child(scenario: str, repo: str, env: dict, importtime: bool = False) -> tuple[dict, float, str]:
+    """One fresh interpreter: its reported result, the wall time of the whole process and its stderr."""
+    argv = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", CHILD, scenario]
+    start = time.perf_counter()
+    completed = subprocess.run(argv, cwd=repo, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if completed.returncode != 0 or not lines:
+        raise SystemExit(f"{scenario} failed (exit {completed.returncode}):\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1][len(RESULT_PREFIX):]), wall, completed.stderr
+
+
+def import_breakdown(stderr: str, top: int) -> list[tuple[str, float]]:
+    """Seconds of import self time per top-level package, slowest first, from `-X importtime` output."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=REPO_ROOT, help="root of the tree to measure")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per scenario")
+    parser.add_argument("--top", type=int, default=8, help="packages shown in the import-time breakdown")
+    parser.add_argument("--configs", nargs="+", choices=CONFIGURATIONS, default=list(CONFIGURATIONS))
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=0.05) as stub:
+        base_env = {
+            **{name: value for name, value in os.environ.items() if name != "RAG_WARMUP_ON_STARTUP"},
+            "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark-key"),
+            "GEMINI_API_URL": stub.url,
+            "BENCH_HEAVY_MODULES": json.dumps(HEAVY_MODULES),
+        }
+        print(f"Startup cost of {os.path.abspath(args.repo)}, median of {args.repeats} runs")
+        for config in args.configs:
+            env = {**base_env, **CONFIGURATIONS[config]}
+            print(f"\n{config} ({', '.join(f'{k}={v}' for k, v in CONFIGURATIONS[config].items()) or 'warm-up on'})")
+            for scenario in args.scenarios:
+                runs = [run_child(scenario, args.repo, env) for _ in range(args.repeats)]
+                results = [result for result, _, _ in runs]
+                line = (f"{scenario:<6} wall {statistics.median(wall for _, wall, _ in runs):>6.2f} s  "
+                        f"setup {statistics.median(r['setup_ms'] for r in results) / 1000:>6.2f} s")
+                if "request_ms" in results[0]:
+                    line += (f"  request {statistics.median(r['request_ms'] for r in results) / 1000:>6.2f} s"
+                             f" (HTTP {results[0]['status']})")
+                if "warmup_ms" in results[0]:
+                    line += f"  warm-up +{statistics.median(r['warmup_ms'] for r in results) / 1000:.2f} s"
+                line += f"  peak RSS {max(r['max_rss_mb'] for r in results):>6.0f} MB"
+                print(line)
+                print(f"       imported: {', '.join(results[0]['loaded']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+                _, _, stderr = run_child(scenario, args.repo, env, importtime=True)
+                print("       slowest imports: " + ", ".join(
+                    f"{package} {seconds:.2f} s" for package, seconds in import_breakdown(stderr, args.top)
+                ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_streaming.py
+
+"""
+Measures time-to-first-token (TTFT) and total response time for the
+non-streaming and SSE streaming LLM paths against a local fake streaming server.
+
+    python -m benchmarks.bench_streaming --requests 50 --latency 0.3 --token-delay 0.03
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import percentile, quiet
+from benchmarks.stub_llm import StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+
+from medical_assistant_app import llm_rag  # noqa: E402
+
+PROMPT = llm_rag._build_prompt("What are the symptoms of a common cold?", [])
+
+
+async def _measure_blocking() -> tuple[float, float]:
+    start = time.perf_counter()
+    await llm_rag._acall_gemini_api(PROMPT)
+    total = time.perf_counter() - start
+    return total, total  # nothing is shown to the user until the whole body arrives
+
+
+async def _measure_streaming() -> tuple[float, float]:
+    start = time.perf_counter()
+    first_token = None
+    async for _ in llm_rag._astream_gemini_api(PROMPT):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+
+async def _run(measure, total: int, concurrency: int) -> list[tuple[float, float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            return await measure()
+
+    results = await asyncio.gather(*(bounded() for _ in range(total)))
+    await llm_rag._get_llm_client().aclose()
+    return results
+
+
+def report(label: str, results: list[tuple[float, float]]):
+    ttft = [first for first, _ in results]
+    totals = [whole for _, whole in results]
+    print(
+        f"{label:<12} TTFT p50 {percentile(ttft, 50) * 1000:>7.1f} ms  p99 {percentile(ttft, 99) * 1000:>7.1f} ms   "
+        f"total p50 {percentile(totals, 50) * 1000:>7.1f} ms  p99 {percentile(totals, 99) * 1000:>7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub time to first token in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub delay between tokens in seconds")
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=args.latency, token_delay=args.token_delay) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        print(f"Stub LLM at {stub.url} (first token {args.latency * 1000:.0f} ms, {args.token_delay * 1000:.0f} ms/token)")
+        with quiet():
+            blocking = asyncio.run(_run(_measure_blocking, args.requests, args.concurrency))
+            streaming = asyncio.run(_run(_measure_streaming, args.requests, args.concurrency))
+        report("blocking", blocking)
+        report("streaming", streaming)
+
+
+if __name__ == "__main__":
+    main()
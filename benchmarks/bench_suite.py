@@ -0,0 +1,270 @@
+# benchmarks/bench_suite.py
+
+"""
+Reproducible end-to-end performance suite, for comparing commits.
+
+`run` replays a query corpus (benchmarks/data/query_log.txt by default, in an
+order fixed by --seed) against a local stub LLM through two entry points:
+
+- rag: `get_rag_response` from a pool of --concurrency threads.
+- http: POST /api/chat/ through Django's in-process ASGI handler (middleware,
+  view and JSON included), from --concurrency asyncio tasks.
+
+For each entry point and concurrency it records throughput, p50/p95/p99 of the
+request latency and of every pipeline stage (taken from the same spans that feed
+/metrics and Server-Timing), errors, and process memory. The results, with the
+commit and settings they were measured at, are written as JSON.
+
+`compare` checks a run against a baseline. A latency percentile or peak memory
+that grew, or throughput that fell, by more than --threshold (relative) counts
+as a regression. Changes smaller than --min-delta-ms (or --min-delta-mb) are
+ignored as noise. Exits with status 1 if any regression is found.
+
+    python -m benchmarks.bench_suite run --output baseline.json --concurrency 1 8 --latency 0.2
+    python -m benchmarks.bench_suite run --output current.json --concurrency 1 8 --latency 0.2
+    python -m benchmarks.bench_suite compare baseline.json current.json --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import REPO_ROOT, percentile, quiet
+from benchmarks.stub_llm import STUB_ANSWER, StubLLMServer
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_assistant_project.settings")
+
+from medical_assistant_app import llm_rag, metrics  # noqa: E402
+
+QUERY_LOG = os.path.join(REPO_ROOT, "benchmarks", "data", "query_log.txt")
+# llm_rag settings that change what is measured; recorded with every run.
+SETTINGS = [
+    "N_RESULTS", "VECTOR_BACKEND", "VECTOR_INDEX_DTYPE", "HYBRID_RETRIEVAL_ENABLED", "EMBED_BATCH_ENABLED",
+    "SINGLE_FLIGHT_ENABLED", "ANSWER_CACHE_ENABLED", "PROMPT_CONTEXT_TOKEN_BUDGET", "RAG_EXECUTOR_WORKERS",
+]
+PERCENTILES = (50, 95, 99)
+
+
+def load_queries(path: str, count: int, seed: int) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    queries = [corpus[index % len(corpus)] for index in range(count)]
+    random.Random(seed).shuffle(queries)
+    return queries
+
+
+def memory_mb() -> dict:
+    """Current and peak resident set size of this process (Linux; empty elsewhere)."""
+    fields = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    fields[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return {}
+    return {"rss": round(fields.get("VmRSS", 0.0), 1), "peak": round(fields.get("VmHWM", 0.0), 1)}
+
+
+def parse_server_timing(header: str) -> dict:
+    """Stage durations in seconds from a Server-Timing header value."""
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        if duration:
+            timings[name] = float(duration) / 1000
+    return timings
+
+
+def run_rag(queries: list[str], concurrency: int) -> list[tuple[float, dict, bool]]:
+    def timed(query):
+        timings = metrics.start_request_timings()
+        start = time.perf_counter()
+        answer = llm_rag.get_rag_response(query)
+        return time.perf_counter() - start, dict(timings), answer == STUB_ANSWER
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, queries))
+
+
+def run_http(queries: list[str], concurrency: int) -> list[tuple[float, dict, bool]]:
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+
+    async def timed(query, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/chat/", data=json.dumps({"message": query}), content_type="application/json")
+            elapsed = time.perf_counter() - start
+        ok = response.status_code == 200 and json.loads(response.content).get("response") == STUB_ANSWER
+        return elapsed, parse_server_timing(response.get("Server-Timing", "")), ok
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(timed(query, semaphore) for query in queries))
+        await llm_rag._get_llm_client().aclose()
+        return list(results)
+
+    return asyncio.run(run())
+
+
+def measure(runner, queries: list[str], concurrency: int) -> dict:
+    memory_before = memory_mb()
+    start = time.perf_counter()
+    with quiet():
+        samples = runner(queries, concurrency)
+    elapsed = time.perf_counter() - start
+    stages = {}
+    for _, timings, _ in samples:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    latencies = [latency for latency, _, _ in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(not ok for _, _, ok in samples),
+        "rps": round(len(samples) / elapsed, 2),
+        "latency_ms": {f"p{pct}": round(percentile(latencies, pct) * 1000, 3) for pct in PERCENTILES},
+        "stages_ms": {
+            stage: {f"p{pct}": round(percentile(values, pct) * 1000, 3) for pct in PERCENTILES}
+            for stage, values in sorted(stages.items())
+        },
+        "memory_mb": {"rss_before": memory_before.get("rss"), **memory_mb()},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_suite(args) -> dict:
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]  # the test client's host, as in Django's test runner
+    llm_rag.ANSWER_CACHE_ENABLED = args.answer_cache
+    queries = load_queries(args.queries, args.requests, args.seed)
+    with quiet():
+        if not llm_rag.warm_up_rag_components():
+            raise SystemExit("RAG components failed to initialize.")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stub_latency_s": args.latency,
+            "requests": args.requests,
+            "seed": args.seed,
+            "settings": {name: getattr(llm_rag, name) for name in SETTINGS},
+        },
+        "results": {},
+    }
+    runners = {"rag": run_rag, "http": run_http}
+    with StubLLMServer(latency=args.latency) as stub:
+        llm_rag.GEMINI_API_URL = stub.url
+        for entry_point in args.entry_points:
+            with quiet():
+                runners[entry_point](queries[:args.warmup], 1)
+            for concurrency in args.concurrency:
+                name = f"{entry_point}@c{concurrency}"
+                report["results"][name] = result = measure(runners[entry_point], queries, concurrency)
+                print(f"{name:<10} {result['rps']:>8.1f} req/s  p50 {result['latency_ms']['p50']:>8.1f} ms  "
+                      f"p95 {result['latency_ms']['p95']:>8.1f} ms  p99 {result['latency_ms']['p99']:>8.1f} ms  "
+                      f"errors {result['errors']}  peak RSS {result['memory_mb'].get('peak')} MB")
+    return report
+
+
+def _latency_metrics(result: dict):
+    for pct, value in result["latency_ms"].items():
+        yield f"latency {pct}", value
+    for stage, values in result["stages_ms"].items():
+        for pct, value in values.items():
+            yield f"{stage} {pct}", value
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_delta_ms: float, min_delta_mb: float) -> list[str]:
+    """Prints the changes between two reports; returns the regressions found."""
+    regressions = []
+
+    def check(scenario, metric, old, new, higher_is_worse, min_delta, unit):
+        if old is None or new is None:
+            return
+        change = (new - old) / old if old else 0.0
+        worse = (new - old) if higher_is_worse else (old - new)
+        regressed = worse > min_delta and worse / old > threshold if old else False
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {scenario:<10} {metric:<22} {old:>10.2f} -> {new:>10.2f} {unit:<5} {change * 100:>+7.1f}%{flag}")
+        if regressed:
+            regressions.append(f"{scenario} {metric}: {old:.2f} -> {new:.2f} {unit}")
+
+    print(f"baseline {baseline['meta'].get('commit', '')[:12]}  current {current['meta'].get('commit', '')[:12]}")
+    for scenario in sorted(set(baseline["results"]) & set(current["results"])):
+        old, new = baseline["results"][scenario], current["results"][scenario]
+        check(scenario, "throughput", old["rps"], new["rps"], False, 0.0, "req/s")
+        new_latencies = dict(_latency_metrics(new))
+        for metric, value in _latency_metrics(old):
+            check(scenario, metric, value, new_latencies.get(metric), True, min_delta_ms, "ms")
+        check(scenario, "peak memory", old["memory_mb"].get("peak"), new["memory_mb"].get("peak"), True, min_delta_mb, "MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite and write a JSON report")
+    run.add_argument("--output", required=True)
+    run.add_argument("--queries", default=QUERY_LOG, help="query corpus, one query per line")
+    run.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    run.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    run.add_argument("--entry-points", nargs="+", choices=["rag", "http"], default=["rag", "http"])
+    run.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    run.add_argument("--seed", type=int, default=0, help="seed for the query order")
+    run.add_argument("--warmup", type=int, default=10, help="unmeasured requests per entry point")
+    run.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (off by default)")
+
+    check = commands.add_parser("compare", help="compare a report with a baseline")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    check.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+    check.add_argument("--min-delta-mb", type=float, default=10.0, help="ignore memory changes smaller than this")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_suite(args)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.min_delta_ms, args.min_delta_mb)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
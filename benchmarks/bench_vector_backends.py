@@ -0,0 +1,152 @@
+# benchmarks/bench_vector_backends.py
+
+"""
+Query latency and memory of the two vector search backends behind
+`llm_rag.VectorRetriever`: the ChromaDB collection and the memory-mapped NumPy
+index. Corpora range from 100 to 1M chunks of random unit vectors.
+
+Each backend is opened in a fresh child process. Memory is the RSS growth
+after opening the backend and running the queries, split into anonymous memory
+(private to each worker) and file-backed pages (the memory-mapped index, shared
+by all workers on a host). ChromaDB's approximate (HNSW) results are scored
+against the exact NumPy search as recall@k.
+
+Building a ChromaDB collection of 1M chunks takes very long, so ChromaDB is
+skipped above --chroma-max chunks.
+
+    python -m benchmarks.bench_vector_backends --sizes 100 1000 10000 100000 1000000
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import percentile, quiet
+
+from medical_assistant_app.vector_index import NumpyVectorIndex, write_vector_index
+
+DIMENSIONS = 384  # all-MiniLM-L6-v2
+BATCH_SIZE = 5000  # ChromaDB caps the size of one add
+
+
+def unit_vectors(rng, count: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, DIMENSIONS), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_corpus(workdir: str, size: int, with_chroma: bool, vectors=unit_vectors, quantizations=()):
+    """
+    Writes `size` chunks to a NumPy index and, optionally, a ChromaDB collection.
+    `vectors(rng, count)` generates the embeddings (random unit vectors by default).
+    """
+    rng = np.random.default_rng(size)
+
+    def batches():
+        for start in range(0, size, BATCH_SIZE):
+            rows = range(start, min(start + BATCH_SIZE, size))
+            yield [f"chunk_{row}" for row in rows], [f"Synthetic chunk {row}." for row in rows], vectors(rng, len(rows))
+
+    write_vector_index(os.path.join(workdir, "vector_index"), batches(), size, quantizations=quantizations)
+    if with_chroma:
+        import chromadb
+        from medical_assistant_app import llm_rag
+
+        index = NumpyVectorIndex.load(os.path.join(workdir, "vector_index"))
+        collection = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_db")).get_or_create_collection(llm_rag.COLLECTION_NAME)
+        for start in range(0, size, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, size)
+            collection.add(
+                ids=[index.chunk_id(row) for row in range(start, end)],
+                documents=[index.document(row) for row in range(start, end)],
+                embeddings=np.asarray(index.embeddings[start:end]),
+            )
+
+
+def _memory_kib() -> dict:
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                fields[name] = int(value.split()[0])
+    return fields
+
+
+def _child(backend: str, workdir: str, queries_path: str, k: int, results, options: dict):
+    import chromadb
+    from medical_assistant_app import llm_rag
+
+    queries = np.load(queries_path)
+    before = _memory_kib()
+    start = time.perf_counter()
+    if backend == "numpy":
+        retriever = llm_rag.NumpyRetriever(os.path.join(workdir, "vector_index"), **options)
+    else:
+        db_path = os.path.join(workdir, "chroma_db")
+        collection = chromadb.PersistentClient(path=db_path).get_collection(llm_rag.COLLECTION_NAME)
+        retriever = llm_rag.ChromaRetriever(collection, db_path)
+    open_seconds = time.perf_counter() - start
+
+    for query in queries[:5]:
+        retriever.query(query, k)  # warm-up
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_ids, _ = retriever.query(query, k)
+        latencies.append(time.perf_counter() - start)
+        ids.append(query_ids)
+    after = _memory_kib()
+    results.put((open_seconds, latencies, ids, {name: after[name] - before[name] for name in after}))
+
+
+def run(backend: str, workdir: str, queries_path: str, k: int, options: dict = None):
+    """Opens `backend` in a fresh process (`options` go to NumpyRetriever) and runs the queries."""
+    context = multiprocessing.get_context("spawn")  # a clean interpreter per backend
+    results = context.Queue()
+    process = context.Process(target=_child, args=(backend, workdir, queries_path, k, results, options or {}))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--chroma-max", type=int, default=100000, help="largest corpus to build in ChromaDB")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            with_chroma = size <= args.chroma_max
+            start = time.perf_counter()
+            with quiet():
+                build_corpus(workdir, size, with_chroma)
+            print(f"{size} chunks ({time.perf_counter() - start:.1f} s to build)")
+            queries_path = os.path.join(workdir, "queries.npy")
+            np.save(queries_path, unit_vectors(np.random.default_rng(0), args.queries))
+
+            exact_ids = None
+            for backend in ("numpy", "chroma") if with_chroma else ("numpy",):
+                open_seconds, latencies, ids, memory = run(backend, workdir, queries_path, args.k)
+                if backend == "numpy":
+                    exact_ids = ids
+                recall = np.mean([len(set(found) & set(exact)) / args.k for found, exact in zip(ids, exact_ids)])
+                print(
+                    f"  {backend:<7} open {open_seconds * 1000:>8.1f} ms  p50 {percentile(latencies, 50) * 1000:>8.3f} ms  "
+                    f"p99 {percentile(latencies, 99) * 1000:>8.3f} ms  RSS +{memory['VmRSS'] / 1024:>7.1f} MB "
+                    f"(private +{memory['RssAnon'] / 1024:>7.1f} MB, shared file-backed +{memory['RssFile'] / 1024:>7.1f} MB)  "
+                    f"recall@{args.k} {recall:.3f}"
+                )
+            if not with_chroma:
+                print(f"  chroma  skipped (more than --chroma-max {args.chroma_max} chunks)")
+
+
+if __name__ == "__main__":
+    main()
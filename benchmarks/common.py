@@ -0,0 +1,49 @@
+# benchmarks/common.py
+
+"""Small helpers shared by the benchmark scripts."""
+
+import contextlib
+import io
+import math
+import os
+import sys
+
+# Benchmarks are run from the repository root (`python -m benchmarks.<name>`);
+# make the Django app importable when they are launched from elsewhere.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """Throughput and latency percentiles (in milliseconds) for one run."""
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def format_row(label: str, stats: dict) -> str:
+    return (
+        f"{label:<28} {stats['requests']:>6} req  {stats['rps']:>9.1f} req/s  "
+        f"p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms"
+    )
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the pipeline's progress `print`s while a benchmark runs."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
@@ -0,0 +1,168 @@
+# benchmarks/stub_llm.py
+
+"""
+A local, Gemini-compatible HTTP server used by the benchmarks in place of the
+real API. It answers `generateContent` requests after a configurable delay and
+`streamGenerateContent?alt=sse` requests with one SSE chunk per token.
+
+Timing model: the first token is ready after `latency` seconds plus
+`prompt_token_delay` per prompt token (prefill, estimated at 4 bytes of request
+body per token), and every further token after `token_delay`. A non-streaming
+reply takes the full generation time, while a streaming one delivers its first
+token as soon as it is ready.
+
+Failure injection: a fraction `error_rate` of requests is answered with
+`error_status` (503 by default) instead. The knobs live in shared memory, so they
+can be changed on a running server, e.g. to simulate an outage and a recovery.
+
+Capacity: with `max_concurrency` set, at most that many requests are worked on
+at once and the rest wait their turn, like an upstream that slows down under load.
+"""
+
+import json
+import multiprocessing
+import contextlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = (
+    "Common cold symptoms include a runny nose, sore throat and cough. "
+    "Please remember, this information is for educational purposes only and is not "
+    "a substitute for professional medical advice."
+)
+
+
+def _tokens(text: str) -> list[str]:
+    """Splits the canned answer into word-sized 'tokens', keeping the spacing."""
+    words = text.split(" ")
+    return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+
+def _chunk(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client-side pooling is measurable
+    # Headers and body go out in separate writes; without TCP_NODELAY, Nagle plus the
+    # client's delayed ACK add ~40 ms to every response on a reused connection.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        stub = self.server.stub
+        stub._record_request()
+        with stub._capacity:
+            self._answer(stub, length)
+
+    def _answer(self, stub, length: int):
+        first_token_delay = stub.latency + stub.prompt_token_delay * length / 4
+
+        if random.random() < stub.error_rate:
+            self._send_error(stub)
+            return
+
+        if ":streamGenerateContent" in self.path:
+            self._stream_answer(stub, first_token_delay)
+            return
+
+        tokens = _tokens(STUB_ANSWER)
+        time.sleep(first_token_delay + stub.token_delay * (len(tokens) - 1))
+        body = json.dumps(_chunk(STUB_ANSWER)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, stub):
+        time.sleep(stub.latency)
+        body = json.dumps({"error": {"code": stub.error_status, "message": "Injected stub failure."}}).encode("utf-8")
+        self.send_response(stub.error_status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_answer(self, stub, first_token_delay: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")  # the stream is delimited by closing the socket
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(first_token_delay)
+        for index, token in enumerate(_tokens(STUB_ANSWER)):
+            if index:
+                time.sleep(stub.token_delay)
+            self.wfile.write(f"data: {json.dumps(_chunk(token))}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output readable
+
+
+class StubLLMServer:
+    """
+    Runs the stub server in a forked child process, so that serving requests
+    does not compete for the GIL with the client being measured. Use as a
+    context manager.
+    """
+
+    def __init__(self, latency: float = 0.2, token_delay: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, prompt_token_delay: float = 0.0, max_concurrency: int = 0, host: str = "127.0.0.1", port: int = 0):
+        self._context = multiprocessing.get_context("fork")
+        self._request_count = self._context.Value("i", 0)
+        self._latency = self._context.Value("d", latency, lock=False)
+        self._token_delay = self._context.Value("d", token_delay, lock=False)
+        self._prompt_token_delay = self._context.Value("d", prompt_token_delay, lock=False)
+        self._error_rate = self._context.Value("d", error_rate, lock=False)
+        self._error_status = self._context.Value("i", error_status, lock=False)
+        # Only the server process takes it, so a plain thread semaphore is enough.
+        self._capacity = threading.BoundedSemaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+        ThreadingHTTPServer.request_queue_size = 1024
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._process = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1beta/models/stub-model:generateContent"
+
+    latency = property(lambda self: self._latency.value, lambda self, value: setattr(self._latency, "value", value))
+    token_delay = property(lambda self: self._token_delay.value, lambda self, value: setattr(self._token_delay, "value", value))
+    prompt_token_delay = property(
+        lambda self: self._prompt_token_delay.value, lambda self, value: setattr(self._prompt_token_delay, "value", value)
+    )
+    error_rate = property(lambda self: self._error_rate.value, lambda self, value: setattr(self._error_rate, "value", value))
+    error_status = property(lambda self: self._error_status.value, lambda self, value: setattr(self._error_status, "value", value))
+
+    @property
+    def request_count(self) -> int:
+        """Number of LLM requests the stub has served so far."""
+        return self._request_count.value
+
+    def _record_request(self):
+        with self._request_count.get_lock():
+            self._request_count.value += 1
+
+    def start(self):
+        self._process = self._context.Process(target=self._server.serve_forever, daemon=True)
+        self._process.start()
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,117 +1,420 @@
 # load_data_to_vectordb.py
 
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
-from sentence_transformers import SentenceTransformer
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import chromadb
 import numpy as np
+from medical_assistant_app.bm25 import BM25Builder
+from medical_assistant_app.onnx_embedder import export_fingerprint, load_embedder
+from medical_assistant_app.sharding import SHARD_LAYOUTS, shard_locations, shard_of
+from medical_assistant_app.vector_index import write_vector_index
 
 # --- Configuration ---
 DATA_FILE = 'medical_data.txt'
 CHROMA_DB_PATH = 'chroma_db' # Directory where ChromaDB will store its data
 COLLECTION_NAME = 'medical_knowledge'
 MODEL_NAME = 'all-MiniLM-L6-v2' # A good general-purpose embedding model
+# Record of the chunk ids already embedded into the collection (and with which model, backend and ONNX export)
+MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, 'ingest_manifest.json')
+# BM25 index over the same chunks, queried by the app next to the vector search
+BM25_INDEX_PATH = os.path.join(CHROMA_DB_PATH, 'bm25_index.npz')
+# Memory-mapped export of the collection, searched by the app when VECTOR_BACKEND=numpy
+VECTOR_INDEX_PATH = os.path.join(CHROMA_DB_PATH, 'vector_index')
+VECTOR_INDEX_QUANTIZATIONS = ('int8', 'float16') # Compact copies written next to the float32 vectors
+EXPORT_BATCH_SIZE = 5000 # Chunks read back from ChromaDB per call when exporting
+UPSERT_BATCH_SIZE = 256 # Chunks embedded and written to ChromaDB per call
+EMBED_WORKERS = 1 # Processes encoding batches in parallel (1 = encode in this process)
+# 'torch', or 'onnx' / 'onnx-int8' to embed with the export of `python manage.py export_embedding_onnx`
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_PATH = os.getenv('EMBEDDING_ONNX_PATH', 'embedding_onnx')
+# Shards the chunks are spread over, and how (see medical_assistant_app/sharding.py);
+# the app must run with the same VECTOR_SHARDS / VECTOR_SHARD_LAYOUT
+VECTOR_SHARDS = int(os.getenv('VECTOR_SHARDS', '1'))
+VECTOR_SHARD_LAYOUT = os.getenv('VECTOR_SHARD_LAYOUT', 'collections')
+
+class ChunkReader:
+    """
+    Streams chunks from a text file without loading it into memory. A chunk is a
+    paragraph: consecutive non-empty lines, separated from the next by a blank line.
+    `bytes_read` / `total_bytes` can be used to report progress while iterating.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.total_bytes = os.path.getsize(file_path)
+        self.bytes_read = 0
+
+    def __iter__(self):
+        paragraph = []
+        with open(self.file_path, 'rb') as f:
+            for raw_line in f:
+                self.bytes_read += len(raw_line)
+                line = raw_line.decode('utf-8')
+                if line.strip():
+                    paragraph.append(line)
+                elif paragraph:
+                    yield ''.join(paragraph).strip()
+                    paragraph = []
+        if paragraph:
+            yield ''.join(paragraph).strip()
 
 def load_and_chunk_data(file_path: str) -> list[str]:
     """
-    Loads text from a file and chunks it by lines.
-    Each non-empty line or a paragraph separated by double newlines
-    can be considered a chunk. For simplicity, we'll treat each
-    distinct paragraph as a chunk.
+    Loads text from a file and chunks it into paragraphs (see ChunkReader).
+    Convenience for small files; the ingestion pipeline iterates ChunkReader directly.
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    # Split content by double newlines to get paragraphs
-    chunks = [chunk.strip() for chunk in content.split('\n\n') if chunk.strip()]
+    chunks = list(ChunkReader(file_path))
     print(f"Loaded {len(chunks)} chunks from {file_path}")
     return chunks
 
-def main():
+def chunk_id(text: str) -> str:
+    """
+    Content-addressed id: the hash of the chunk text with whitespace normalized.
+    Editing a chunk changes its id; inserting or moving paragraphs does not
+    change the ids of the others.
+    """
+    normalized = ' '.join(text.split())
+    return 'chunk_' + hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:32]
+
+def open_shards(shards: int = VECTOR_SHARDS, layout: str = VECTOR_SHARD_LAYOUT) -> list:
+    """The collection of each shard, created if missing (one collection when unsharded)."""
+    clients, collections = {}, []
+    for path, name in shard_locations(CHROMA_DB_PATH, COLLECTION_NAME, shards, layout):
+        if path not in clients:
+            clients[path] = chromadb.PersistentClient(path=path)
+        collections.append(clients[path].get_or_create_collection(name=name))
+    return collections
+
+def embedding_key(backend: str = EMBEDDING_BACKEND) -> dict:
+    """
+    What new chunks are embedded with: the model, the backend load_embedder will
+    actually use (PyTorch when there is no ONNX export that passed its check) and
+    the fingerprint of that export. Chunks embedded under another key are
+    embedded again.
+    """
+    fingerprint = export_fingerprint(EMBEDDING_ONNX_PATH, backend) if backend != 'torch' else None
+    return {'model': MODEL_NAME, 'embedding_backend': backend if fingerprint else 'torch', 'onnx_export': fingerprint}
+
+def load_manifest(collections, layout: str = VECTOR_SHARD_LAYOUT, embedding: dict = None) -> tuple[set[str], set[str]]:
+    """
+    Returns the ids in the shards' collections and, of those, the ids embedded
+    with `embedding` (see embedding_key), which need no new embedding. If the
+    manifest was written with another model, embedding backend or ONNX export,
+    none do: every chunk is embedded again. Falls back to listing the
+    collections when the manifest is missing, was written for another shard
+    layout, or is out of sync; then only listed ids the manifest also records
+    count as embedded (all of them, without a manifest).
+    """
+    embedding = embedding or embedding_key()
+    manifest = None
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        stored = {key: manifest.get(key) for key in embedding}
+        stored['embedding_backend'] = stored['embedding_backend'] or 'torch'  # manifests older than the key
+        current = stored == embedding
+        if not current:
+            print(f"Chunks were embedded with {stored}; embedding them all again with {embedding}.")
+        if (manifest.get('shards', 1) == len(collections)
+                and (len(collections) == 1 or manifest.get('shard_layout') == layout)
+                and len(manifest.get('ids', [])) == sum(collection.count() for collection in collections)):
+            ids = set(manifest['ids'])
+            return ids, (set(ids) if current else set())
+        print("Ingest manifest is stale. Rebuilding it from the collection.")
+    except FileNotFoundError:
+        print("No ingest manifest found. Building it from the collection.")
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Could not read ingest manifest ({e}). Building it from the collection.")
+        manifest = None
+    ids = {cid for collection in collections for cid in collection.get(include=[])['ids']}
+    if manifest is None:
+        return ids, set(ids)
+    return ids, (ids.intersection(manifest.get('ids', [])) if current else set())
+
+def export_vector_index(collections):
+    """Copies the shards' ids, documents and embeddings into the NumPy vector index, page by page."""
+    count = sum(collection.count() for collection in collections)
+
+    def pages():
+        for collection in collections:
+            for offset in range(0, collection.count(), EXPORT_BATCH_SIZE):
+                page = collection.get(include=['documents', 'embeddings'], limit=EXPORT_BATCH_SIZE, offset=offset)
+                yield page['ids'], page['documents'], page['embeddings']
+
+    write_vector_index(VECTOR_INDEX_PATH, pages(), count, quantizations=VECTOR_INDEX_QUANTIZATIONS)
+    return count
+
+def save_manifest(ids: set[str], shards: int = 1, layout: str = VECTOR_SHARD_LAYOUT, embedding: dict = None):
+    """Records `ids` as embedded with `embedding` (see embedding_key)."""
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({**(embedding or embedding_key()), 'shards': shards, 'shard_layout': layout, 'ids': sorted(ids)}, f)
+    os.replace(tmp_path, MANIFEST_PATH)  # atomic, so a crash never leaves a half-written manifest
+
+# --- Embedding worker processes ---
+_worker_model = None
+
+def _init_embedding_worker(model_name: str, backend: str, threads: int):
+    """Loads the model once per worker; threads are split so workers don't oversubscribe the CPU."""
+    global _worker_model
+    if backend == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+    _worker_model = load_embedder(model_name, backend, EMBEDDING_ONNX_PATH, threads)
+
+def _encode_in_worker(docs: list[str]) -> np.ndarray:
+    return _worker_model.encode(docs, batch_size=64, convert_to_numpy=True).astype(np.float32)
+
+class _BatchWriter:
+    """
+    Embeds and upserts chunks one fixed-size batch at a time, loading the model on first use.
+
+    With `workers` > 1, batches are encoded by a process pool while this process
+    keeps reading; results are written back in submission order by this process
+    alone (ChromaDB has a single writer). At most 2 batches per worker are in
+    flight, so memory stays bounded.
+
+    With several shards, each batch is split by `shard_of` and the per-shard
+    upserts run concurrently on a thread pool.
+    """
+
+    def __init__(self, collections, indexed_ids: set[str], timings: dict, workers: int = 1, backend: str = 'torch'):
+        self.collections = collections
+        self.shard_pool = ThreadPoolExecutor(max_workers=len(collections)) if len(collections) > 1 else None
+        self.indexed_ids = indexed_ids
+        self.timings = timings
+        self.workers = workers
+        self.backend = backend
+        self.model = None
+        self.pool = None
+        self.in_flight = deque()  # (ids, docs, future) in submission order
+        self.ids = []
+        self.docs = []
+        self.written = 0
+
+    def add(self, cid: str, doc: str):
+        self.ids.append(cid)
+        self.docs.append(doc)
+        if len(self.ids) >= UPSERT_BATCH_SIZE:
+            self._dispatch()
+
+    def flush(self):
+        """Sends the partial batch and waits until every batch has been written."""
+        self._dispatch()
+        while self.in_flight:
+            self._write_oldest()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.shard_pool is not None:
+            self.shard_pool.shutdown()
+            self.shard_pool = None
+
+    def _start_encoder(self):
+        stage = time.perf_counter()
+        print(f"Loading Sentence Transformer model: {MODEL_NAME} ({self.backend})...")
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"Starting {self.workers} embedding worker processes ({threads} threads each)...")
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),  # fork is unsafe once torch has started threads
+                initializer=_init_embedding_worker,
+                initargs=(MODEL_NAME, self.backend, threads),
+            )
+        else:
+            try:
+                # Download the model if not already present
+                self.model = load_embedder(MODEL_NAME, self.backend, EMBEDDING_ONNX_PATH)
+            except Exception:
+                print("Please check your internet connection or model name.")
+                raise
+        print("Model loaded successfully.")
+        self.timings['model_load'] = time.perf_counter() - stage
+
+    def _dispatch(self):
+        if not self.ids:
+            return
+        if self.model is None and self.pool is None:
+            self._start_encoder()
+        ids, docs = self.ids, self.docs
+        self.ids, self.docs = [], []
+
+        if self.pool is None:
+            stage = time.perf_counter()
+            embeddings = self.model.encode(docs, batch_size=64, convert_to_numpy=True).astype(np.float32)
+            self.timings['embed'] = self.timings.get('embed', 0.0) + time.perf_counter() - stage
+            self._write(ids, docs, embeddings)
+            return
+
+        self.in_flight.append((ids, docs, self.pool.submit(_encode_in_worker, docs)))
+        while len(self.in_flight) > 2 * self.workers:
+            self._write_oldest()
+
+    def _write_oldest(self):
+        ids, docs, future = self.in_flight.popleft()
+        stage = time.perf_counter()
+        embeddings = future.result()
+        # Time spent waiting on workers; the encoding itself overlaps with reading.
+        self.timings['embed'] = self.timings.get('embed', 0.0) + time.perf_counter() - stage
+        self._write(ids, docs, embeddings)
+
+    def _write(self, ids: list[str], docs: list[str], embeddings: np.ndarray):
+        stage = time.perf_counter()
+        if self.shard_pool is None:
+            self.collections[0].upsert(ids=ids, documents=docs, embeddings=embeddings)
+        else:
+            rows_by_shard = {}
+            for row, cid in enumerate(ids):
+                rows_by_shard.setdefault(shard_of(cid, len(self.collections)), []).append(row)
+            upserts = [
+                self.shard_pool.submit(
+                    self.collections[shard].upsert,
+                    ids=[ids[row] for row in rows], documents=[docs[row] for row in rows], embeddings=embeddings[rows],
+                )
+                for shard, rows in rows_by_shard.items()
+            ]
+            for upsert in upserts:
+                upsert.result()
+        self.timings['upsert'] = self.timings.get('upsert', 0.0) + time.perf_counter() - stage
+        self.indexed_ids.update(ids)
+        self.written += len(ids)
+
+def main(workers: int = EMBED_WORKERS, backend: str = EMBEDDING_BACKEND,
+         shards: int = VECTOR_SHARDS, layout: str = VECTOR_SHARD_LAYOUT) -> dict:
     """
     Main function to load data, generate embeddings, and populate ChromaDB.
+    Returns the per-stage timings in seconds (None if nothing could be loaded).
+    The data file is streamed: chunks are read, embedded and written in batches of
+    UPSERT_BATCH_SIZE, so the chunk text and embeddings held in memory do not grow
+    with the corpus. Memory for the following does grow, O(corpus): the id of every
+    chunk (the ids seen in this run, the ids already indexed, and the manifest
+    written from them), and the BM25 builder's postings, from which the BM25 index
+    is built in memory at the end. For chunks of ~60 terms that is about 1 KB per
+    chunk while streaming and 2.5 KB at the peak of the BM25 build, i.e. a few GB
+    for millions of chunks; the app holds the built BM25 index in memory as well.
+    Only chunks that are new or changed since the last run are embedded (all of
+    them after a change of model, embedding backend or ONNX export), and chunks
+    that disappeared from the data file are deleted from the collection. The BM25
+    index used for hybrid retrieval and the NumPy vector index are rebuilt from
+    the same chunks. With `shards` > 1, chunks are spread over that many
+    collections or directories (`layout`), as read by the app with VECTOR_SHARDS.
     """
     print("Starting data loading and embedding process...")
+    timings = {}
+    started = time.perf_counter()
+
+    if not os.path.exists(DATA_FILE):
+        print(f"Error: {DATA_FILE} not found. Please create it with medical information.")
+        return None
 
     # Ensure ChromaDB directory exists
     if not os.path.exists(CHROMA_DB_PATH):
         os.makedirs(CHROMA_DB_PATH)
 
-    # 1. Load data
-    try:
-        documents = load_and_chunk_data(DATA_FILE)
-        if not documents:
-            print(f"No documents found in {DATA_FILE}. Exiting.")
-            return
-    except FileNotFoundError:
-        print(f"Error: {DATA_FILE} not found. Please create it with medical information.")
-        return
+    # 1. Initialize ChromaDB client and load what is already indexed
+    stage = time.perf_counter()
+    print(f"Initializing ChromaDB at {CHROMA_DB_PATH}...")
+    collections = open_shards(shards, layout)
+    if len(collections) > 1:
+        print(f"ChromaDB collection '{COLLECTION_NAME}' ready, in {len(collections)} shards ({layout}).")
+    else:
+        print(f"ChromaDB collection '{COLLECTION_NAME}' ready.")
+    embedding = embedding_key(backend)
+    stored_ids, indexed_ids = load_manifest(collections, layout, embedding)
+    timings['open_index'] = time.perf_counter() - stage
 
-    # 2. Initialize embedding model
-    print(f"Loading Sentence Transformer model: {MODEL_NAME}...")
+    reader = ChunkReader(DATA_FILE)
+    writer = _BatchWriter(collections, indexed_ids, timings, workers=workers, backend=backend)
+    bm25_builder = BM25Builder()  # indexes every chunk, changed or not; O(corpus) postings
+    seen_ids = set()  # O(corpus) ids, to skip duplicates and find the chunks to delete
     try:
-        # Download the model if not already present
-        model = SentenceTransformer(MODEL_NAME)
-    except Exception as e:
-        print(f"Error loading Sentence Transformer model: {e}")
-        print("Please check your internet connection or model name.")
-        return
-    print("Model loaded successfully.")
+        # 2. Stream chunks; embed and upsert only the new/changed ones, batch by batch
+        stage = time.perf_counter()
+        for doc in reader:
+            cid = chunk_id(doc)
+            if cid in seen_ids:
+                continue  # identical paragraphs collapse onto one id
+            seen_ids.add(cid)
+            bm25_builder.add(cid, doc)
+            if cid in indexed_ids:
+                continue
+            written_before = writer.written
+            writer.add(cid, doc)
+            if writer.written > written_before:
+                elapsed = time.perf_counter() - stage
+                print(f"Embedded {writer.written} new chunks, scanned {len(seen_ids)} "
+                      f"({reader.bytes_read / max(reader.total_bytes, 1):.0%} of {DATA_FILE}, "
+                      f"{writer.written / elapsed:.1f} docs/s).")
+        writer.flush()
+        timings['stream'] = time.perf_counter() - stage
 
-    # 3. Initialize ChromaDB client
-    print(f"Initializing ChromaDB at {CHROMA_DB_PATH}...")
-    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-
-    # Get or create the collection
-    # If the collection already exists and has data, this will reuse it.
-    # To clear existing data, you might want to uncomment client.delete_collection()
-    # client.delete_collection(name=COLLECTION_NAME) # Uncomment to clear existing data before loading
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
-    print(f"ChromaDB collection '{COLLECTION_NAME}' ready.")
+        if not seen_ids:
+            print(f"No documents found in {DATA_FILE}. Exiting.")
+            return None
+        print(f"{len(seen_ids)} unique chunks: {writer.written} new or changed, "
+              f"{len(seen_ids) - writer.written} unchanged.")
+        if not writer.written:
+            print("No new documents to add. ChromaDB is up to date.")
 
-    # 4. Generate embeddings and add to ChromaDB
-    print("Generating embeddings and adding to ChromaDB...")
-    # Generate unique IDs for each document
-    ids = [f"doc_{i}" for i in range(len(documents))]
+        # 3. Delete chunks that are no longer in the data file (including legacy doc_{i} ids)
+        removed_ids = sorted(stored_ids - seen_ids)
+        if removed_ids:
+            stage = time.perf_counter()
+            ids_by_shard = {}
+            for cid in removed_ids:
+                ids_by_shard.setdefault(shard_of(cid, len(collections)), []).append(cid)
+            for shard, shard_ids in ids_by_shard.items():
+                for start in range(0, len(shard_ids), UPSERT_BATCH_SIZE):
+                    collections[shard].delete(ids=shard_ids[start:start + UPSERT_BATCH_SIZE])
+            indexed_ids.difference_update(removed_ids)
+            timings['delete'] = time.perf_counter() - stage
+            print(f"Deleted {len(removed_ids)} stale chunks from ChromaDB.")
 
-    # Generate embeddings for all documents
-    embeddings = model.encode(documents).tolist() # Convert numpy array to list of lists for ChromaDB
+        # 4. Rewrite the BM25 index when the chunk set changed (or it does not exist yet)
+        if writer.written or removed_ids or not os.path.exists(BM25_INDEX_PATH):
+            stage = time.perf_counter()
+            bm25_index = bm25_builder.build()
+            bm25_index.save(BM25_INDEX_PATH)
+            timings['bm25'] = time.perf_counter() - stage
+            print(f"BM25 index written to {BM25_INDEX_PATH} ({len(bm25_index)} chunks, {len(bm25_index.terms)} terms).")
 
-    # Add to collection in batches if you have a very large dataset
-    # For this small example, we can add all at once
-    try:
-        if collection.count() > 0:
-            print("Collection already contains data. Appending new data if any.")
-            # You might want more sophisticated logic here for updates/deduplication
-            existing_ids = collection.get(ids=[f"doc_{i}" for i in range(collection.count())])['ids']
-            new_documents = []
-            new_embeddings = []
-            new_ids = []
-            for i, doc in enumerate(documents):
-                if f"doc_{i}" not in existing_ids:
-                    new_documents.append(doc)
-                    new_embeddings.append(embeddings[i])
-                    new_ids.append(f"doc_{i}")
-            if new_documents:
-                collection.add(
-                    documents=new_documents,
-                    embeddings=new_embeddings,
-                    ids=new_ids
-                )
-                print(f"Added {len(new_documents)} new documents to ChromaDB.")
-            else:
-                print("No new documents to add. ChromaDB is up to date.")
-        else:
-            collection.add(
-                documents=documents,
-                embeddings=embeddings,
-                ids=ids
-            )
-            print(f"Added {len(documents)} documents to ChromaDB.")
+        # 5. Re-export the NumPy vector index the same way
+        if writer.written or removed_ids or not os.path.exists(VECTOR_INDEX_PATH):
+            stage = time.perf_counter()
+            exported = export_vector_index(collections)
+            timings['vector_index'] = time.perf_counter() - stage
+            print(f"NumPy vector index written to {VECTOR_INDEX_PATH} ({exported} chunks).")
 
-        print(f"Total documents in ChromaDB: {collection.count()}")
+        print(f"Total documents in ChromaDB: {sum(collection.count() for collection in collections)}")
     except Exception as e:
-        print(f"Error adding documents to ChromaDB: {e}")
+        print(f"Error updating ChromaDB: {e}")
+    finally:
+        writer.close()
+        save_manifest(indexed_ids, len(collections), layout, embedding)
 
+    timings['total'] = time.perf_counter() - started
+    print("Stage timings: " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items()))
     print("Data loading and embedding process finished.")
+    return timings
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Embed medical_data.txt into the ChromaDB knowledge base.")
+    parser.add_argument('--workers', type=int, default=EMBED_WORKERS,
+                        help="embedding processes to run in parallel (default: %(default)s, i.e. in-process)")
+    parser.add_argument('--embedding-backend', choices=('torch', 'onnx', 'onnx-int8'), default=EMBEDDING_BACKEND,
+                        help="runtime of the embedding model (default: %(default)s)")
+    parser.add_argument('--shards', type=int, default=VECTOR_SHARDS,
+                        help="shards to spread the chunks over (default: %(default)s); run the app with the same VECTOR_SHARDS")
+    parser.add_argument('--shard-layout', choices=SHARD_LAYOUTS, default=VECTOR_SHARD_LAYOUT,
+                        help="a collection per shard in one ChromaDB directory, or a directory per shard (default: %(default)s)")
+    args = parser.parse_args()
+    main(workers=args.workers, backend=args.embedding_backend, shards=args.shards, layout=args.shard_layout)
@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChatLog
+
+
+@admin.register(ChatLog)
+class ChatLogAdmin(admin.ModelAdmin):
+    """Read-only: the chat log is an audit trail."""
+    list_display = ('created_at', 'view', 'outcome', 'status_code', 'prompt_tokens', 'total_ms', 'query')
+    list_filter = ('view', 'outcome', 'status_code')
+    search_fields = ('query', 'conversation_id')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
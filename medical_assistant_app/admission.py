@@ -0,0 +1,145 @@
+# medical_assistant_app/admission.py
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away; `retry_after` is a hint in whole seconds for the client."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Bounds how many requests run at once. Up to `max_concurrent` requests hold a
+    slot; the next `max_queue` wait for one in arrival order, each for at most
+    `queue_timeout` seconds, and anything beyond that is rejected immediately,
+    so an overloaded process answers fast instead of piling up work it cannot
+    finish in time. `max_concurrent=0` admits everything.
+
+    Use as `async with controller:`. State is guarded by a thread lock and a
+    freed slot is handed straight to the oldest waiter through its own event
+    loop, so one controller serves every loop in the process (under WSGI each
+    async view runs on a loop of its own).
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 0, queue_timeout: float = 5.0, retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+
+    @property
+    def in_flight(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """Waits for a slot; returns the seconds spent queued. Raises AdmissionRejected."""
+        if not self.max_concurrent:
+            return 0.0
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                raise AdmissionRejected("queue_full", self.retry_after)
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except BaseException as e:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+            if waiter.granted:  # the slot arrived as the wait ended
+                if isinstance(e, asyncio.TimeoutError):
+                    return time.perf_counter() - start
+                self.release()
+                raise
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("queue_timeout", self.retry_after) from None
+            raise
+        return time.perf_counter() - start
+
+    def release(self):
+        if not self.max_concurrent:
+            return
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                except RuntimeError:  # its loop has closed; nobody is waiting any more
+                    continue
+                waiter.granted = True  # the slot passes to the waiter, so _active is unchanged
+                return
+            self._active -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+
+class RateLimiter:
+    """
+    Per-client token buckets: each client may make `burst` requests at once and
+    `rate_per_minute` a minute after that. Buckets of the `max_clients` most
+    recently seen clients are kept; a client evicted before it was idle long
+    enough to refill simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_clients: int = 10000):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self._rate = rate_per_minute / 60
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # client -> (tokens, updated at), in LRU order
+
+    def acquire(self, client: str):
+        """Takes a token for `client`; raises AdmissionRejected if it has none left."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self._rate)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise AdmissionRejected("rate_limited", max(1, math.ceil((1 - tokens) / self._rate)))
@@ -0,0 +1,155 @@
+# medical_assistant_app/answer_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Words and numbers that change a medical question's answer while barely moving
+# its embedding ("type 1" / "type 2", "with" / "without food"). A near-hit is only
+# served when both questions have the same of these.
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_WORD = re.compile(r"[a-z']+")
+_NEGATIONS = frozenset(
+    "no not never none nor without cannot can't don't doesn't didn't isn't aren't wasn't "
+    "weren't won't shouldn't wouldn't mustn't haven't hasn't".split()
+)
+
+
+def _qualifiers(key: str) -> tuple:
+    return sorted(_NUMBER.findall(key)), sorted(word for word in _WORD.findall(key.lower()) if word in _NEGATIONS)
+
+
+class SemanticAnswerCache:
+    """
+    Caches LLM answers keyed on the normalized query text.
+
+    A query with the same key is served straight from an LRU map. With
+    `near_hits`, a differently-worded query is also compared (cosine similarity)
+    against every cached embedding, held in one preallocated matrix, and the
+    closest entry is served when it scores at or above `similarity_threshold` and
+    has the same numbers and negations as the query. Embeddings of general-purpose
+    models do not separate questions that differ in one critical word ("children"
+    / "adults"), so near-hits are off unless enabled. Entries expire after
+    `ttl_seconds`, the least recently used entry is evicted once `max_entries` is
+    reached, and everything is dropped when `fingerprint_fn` reports that the
+    knowledge base changed.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.97, near_hits: bool = False, fingerprint_fn=None,
+                 fingerprint_check_seconds: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.near_hits = near_hits
+        self._fingerprint_fn = fingerprint_fn
+        self._fingerprint_check_seconds = fingerprint_check_seconds
+        self._fingerprint = fingerprint_fn() if fingerprint_fn else None
+        self._last_fingerprint_check = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (slot, answer, stored_at), in LRU order
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._matrix = None  # (max_entries, dim) normalized embeddings, allocated on first store
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._counters = {"hits": 0, "near_hits": 0, "near_hits_refused": 0, "misses": 0,
+                          "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, key: str, embedding):
+        """Returns the cached answer for this query (`key` is its normalized text), or None on a miss."""
+        with self._lock:
+            self._check_fingerprint()
+            now = time.monotonic()
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry[1]
+                self._remove(key)
+                self._counters["expirations"] += 1
+
+            if self.near_hits and self._matrix is not None and self._valid.any():
+                similarities = self._matrix @ self._normalize(embedding)
+                similarities[~self._valid] = -np.inf
+                slot = int(np.argmax(similarities))
+                if similarities[slot] >= self.similarity_threshold:
+                    near_key = self._slot_keys[slot]
+                    _, answer, stored_at = self._entries[near_key]
+                    if _qualifiers(near_key) != _qualifiers(key):
+                        self._counters["near_hits_refused"] += 1
+                    elif now - stored_at <= self.ttl_seconds:
+                        self._entries.move_to_end(near_key)
+                        self._counters["near_hits"] += 1
+                        return answer
+                    else:
+                        self._remove(near_key)
+                        self._counters["expirations"] += 1
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: str, embedding, answer: str):
+        """Stores an answer for this query (`key` is its normalized text), evicting the LRU entry if full."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._counters["evictions"] += 1
+            slot = self._free_slots.pop()
+            if self.near_hits:
+                vector = self._normalize(embedding)
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._matrix[slot] = vector
+                self._valid[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, answer, time.monotonic())
+
+    def clear(self):
+        """Drops every cached answer (counters are kept)."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters plus the current number of entries."""
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries)}
+
+    def _remove(self, key: str):
+        slot, _, _ = self._entries.pop(key)
+        self._valid[slot] = False
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _clear(self):
+        for key in list(self._entries):
+            self._remove(key)
+
+    def _check_fingerprint(self):
+        """Clears the cache if the knowledge base changed since the last check (rate limited)."""
+        if self._fingerprint_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._last_fingerprint_check < self._fingerprint_check_seconds:
+            return
+        self._last_fingerprint_check = now
+        fingerprint = self._fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            if self._entries:
+                self._clear()
+                self._counters["invalidations"] += 1
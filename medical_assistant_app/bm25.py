@@ -0,0 +1,170 @@
+# medical_assistant_app/bm25.py
+
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Keeps dotted codes ("E11.9", "0.5") together as one token.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it its my of on or "
+    "should that the their there these this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word and code tokens of `text`, without stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """
+    Merges several rankings of ids into one: each id scores the sum of
+    1 / (k + rank) over the rankings it appears in. Ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """
+    Read-only BM25 index over the knowledge-base chunks, in compressed sparse row
+    form: for each term, the rows of the chunks containing it and the chunk's
+    precomputed BM25 weight for that term. Scoring a query is a vectorized add
+    over the posting lists of its terms, followed by a partial sort.
+    """
+
+    def __init__(self, ids: list[str], terms: list[str], offsets, postings, weights):
+        self.ids = list(ids)
+        self.terms = list(terms)
+        self.vocabulary = {term: index for index, term in enumerate(self.terms)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.postings = np.asarray(postings, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """The `k` best-scoring chunk ids for `query` with their scores, best first."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or k <= 0:
+            return []
+        slices = [slice(self.offsets[term], self.offsets[term + 1]) for term in term_ids]
+        if len(slices) == 1:
+            candidates, scores = self.postings[slices[0]], self.weights[slices[0]]
+        else:
+            candidates = np.concatenate([self.postings[span] for span in slices])
+            weights = np.concatenate([self.weights[span] for span in slices])
+            scores = np.bincount(candidates, weights=weights, minlength=len(self.ids))[candidates]
+
+        # Ties go to the earlier chunk. Besides making results deterministic this keeps
+        # argpartition fast: it degrades badly on long runs of equal scores, which BM25
+        # produces for chunks of similar length.
+        keys = candidates * 1e-12 - scores
+        # A chunk appears at most once per query term, so the best k * terms
+        # candidates always contain the k best distinct chunks.
+        limit = k * len(slices)
+        if len(candidates) > limit:
+            top = np.argpartition(keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(keys[top])]
+
+        results, seen = [], set()
+        for position in top:
+            row = int(candidates[position])
+            if row not in seen:
+                seen.add(row)
+                results.append((self.ids[row], float(scores[position])))
+                if len(results) == k:
+                    break
+        return results
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                ids=np.array(self.ids, dtype=str),
+                terms=np.array(self.terms, dtype=str),
+                offsets=self.offsets,
+                postings=self.postings,
+                weights=self.weights,
+            )
+        os.replace(tmp_path, path)  # atomic, so a running server never loads a half-written index
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['ids'].tolist(), data['terms'].tolist(), data['offsets'], data['postings'], data['weights'])
+
+
+class BM25Builder:
+    """
+    Accumulates chunks one at a time (so it can sit in a streaming ingestion loop)
+    and builds a BM25Index from them. Term/chunk/frequency triples are kept in
+    compact arrays rather than Python objects, but all of them are kept until
+    `build`: memory grows with the corpus (12 bytes per distinct term of each
+    chunk, plus the ids), and `build` briefly needs a few times that.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self._vocabulary = {}
+        self._terms = array('i')
+        self._rows = array('i')
+        self._frequencies = array('i')
+        self._lengths = array('i')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, doc_id: str, text: str):
+        tokens = tokenize(text)
+        row = len(self.ids)
+        self.ids.append(doc_id)
+        self._lengths.append(len(tokens))
+        for token, frequency in Counter(tokens).items():
+            self._terms.append(self._vocabulary.setdefault(token, len(self._vocabulary)))
+            self._rows.append(row)
+            self._frequencies.append(frequency)
+
+    def build(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5) -> BM25Index:
+        """
+        Terms found in more than `max_df` of the chunks are left out: they add
+        almost nothing to the ranking (their idf is at most log 2) but have the
+        longest posting lists, i.e. they would dominate query time.
+        """
+        n_docs = len(self.ids)
+        terms = np.array(self._terms, dtype=np.int32)
+        rows = np.array(self._rows, dtype=np.int32)
+        frequencies = np.array(self._frequencies, dtype=np.float32)
+        lengths = np.array(self._lengths, dtype=np.float32)
+        average_length = max(float(lengths.mean()), 1.0) if n_docs else 1.0
+
+        df = np.bincount(terms, minlength=len(self._vocabulary))
+        kept = df <= max(max_df * n_docs, 1)
+        kept_terms = np.flatnonzero(kept)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        order = np.argsort(terms, kind='stable')  # group postings by term, rows stay ascending
+        terms, rows, frequencies = terms[order], rows[order], frequencies[order]
+        keep = kept[terms]
+        terms, rows, frequencies = terms[keep], rows[keep], frequencies[keep]
+
+        norms = k1 * (1 - b + b * lengths[rows] / average_length)
+        weights = idf[terms] * frequencies * (k1 + 1) / (frequencies + norms)
+
+        offsets = np.zeros(len(kept_terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(df[kept_terms])
+        names = [None] * len(self._vocabulary)
+        for token, index in self._vocabulary.items():
+            names[index] = token
+        return BM25Index(self.ids, [names[index] for index in kept_terms], offsets, rows, weights)
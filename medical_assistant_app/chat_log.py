@@ -0,0 +1,179 @@
+# medical_assistant_app/chat_log.py
+
+import atexit
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .metrics import REGISTRY, Gauge
+from .models import ChatLog
+
+# Outcome of a request the pipeline noted nothing about, by status code. A 200
+# without an outcome shared the answer of an identical in-flight request (only
+# the single-flight leader runs, and notes, the pipeline).
+_OUTCOME_BY_STATUS = {
+    400: ChatLog.Outcome.INVALID,
+    405: ChatLog.Outcome.INVALID,
+    429: ChatLog.Outcome.RATE_LIMITED,
+    503: ChatLog.Outcome.REJECTED,
+}
+
+
+class WriteBehindLog:
+    """
+    Buffers records in memory and hands them to `write_batch` in batches from a
+    background thread, so the request path only appends to a deque. A batch is
+    written once `batch_size` records are waiting or `flush_interval` seconds
+    after the last write, whichever comes first.
+
+    Memory is bounded: past `max_pending` waiting records (the database is down
+    or too slow), new records are dropped and counted rather than blocking
+    requests. A batch that fails to write is counted and dropped. `close`, run
+    at interpreter exit, writes out everything still buffered.
+    """
+
+    def __init__(self, write_batch, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._writing = 0  # records of the batch being written
+        self._flush_waiters = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, record) -> bool:
+        """Queues `record` for writing; False if it was dropped (buffer full or log closed)."""
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(record)
+            self.submitted += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            elif len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._writing
+
+    def flush(self, timeout: float = None) -> bool:
+        """Writes out everything submitted so far; False if that took longer than `timeout`."""
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+            finally:
+                self._flush_waiters -= 1
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """Stops accepting records and waits for the buffered ones to be written; False on timeout."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return self.pending() == 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed and not (self._flush_waiters and self._pending):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch and self._closed:
+                    return
+                self._writing = len(batch)
+            if batch:
+                try:
+                    self.write_batch(batch)
+                    self.written += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    print(f"Could not write {len(batch)} chat log records: {e}")
+            with self._cond:
+                self._writing = 0
+                self._cond.notify_all()
+
+
+def _insert_chat_logs(records: list[dict]):
+    """Inserts a batch of ChatLog rows in one transaction (SQLite: one fsync per batch, not per row)."""
+    try:
+        with transaction.atomic():
+            ChatLog.objects.bulk_create([ChatLog(**record) for record in records])
+    except Exception:
+        connection.close()  # the next batch starts on a fresh connection
+        raise
+
+
+_chat_log = None
+_chat_log_lock = threading.Lock()
+
+
+def get_chat_log():
+    """The process's chat log writer, created on first use; None when CHAT_LOG_ENABLED is off."""
+    global _chat_log
+    if not settings.CHAT_LOG_ENABLED:
+        return None
+    if _chat_log is None:
+        with _chat_log_lock:
+            if _chat_log is None:
+                _chat_log = WriteBehindLog(
+                    _insert_chat_logs,
+                    batch_size=settings.CHAT_LOG_BATCH_SIZE,
+                    flush_interval=settings.CHAT_LOG_FLUSH_INTERVAL_SECONDS,
+                    max_pending=settings.CHAT_LOG_MAX_PENDING,
+                )
+    return _chat_log
+
+
+REGISTRY.register(Gauge(
+    "medical_assistant_chat_log_pending", "Chat log records buffered and not yet written.",
+    lambda: _chat_log.pending() if _chat_log is not None else 0,
+))
+REGISTRY.register(Gauge(
+    "medical_assistant_chat_log_lost", "Chat log records dropped (buffer full) or that failed to write since start-up.",
+    lambda: _chat_log.dropped + _chat_log.failed if _chat_log is not None else 0,
+))
+
+
+def log_chat(view: str, record: dict, timings: dict, status_code: int, total_seconds: float):
+    """
+    Queues the ChatLog rows of one request: `record` holds the view's and the
+    pipeline's notes (see metrics.note_chat), or a 'batch' list of per-message
+    notes; `timings` the request's stage durations.
+    """
+    chat_log = get_chat_log()
+    if chat_log is None:
+        return
+    common = {
+        'created_at': timezone.now(),
+        'view': view,
+        'status_code': status_code,
+        'stage_ms': {stage: round(seconds * 1000, 2) for stage, seconds in (timings or {}).items() if stage != 'total'},
+        'total_ms': round(total_seconds * 1000, 2),
+    }
+    default_outcome = _OUTCOME_BY_STATUS.get(status_code, ChatLog.Outcome.ERROR if status_code >= 500 else ChatLog.Outcome.COALESCED)
+    for notes in record.pop('batch', None) or [record]:
+        chat_log.submit({**common, 'outcome': default_outcome, **notes})
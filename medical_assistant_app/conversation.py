@@ -0,0 +1,155 @@
+# medical_assistant_app/conversation.py
+
+import re
+import secrets
+import threading
+from collections import deque
+
+from .bm25 import tokenize
+from .prompt_builder import estimate_tokens, split_sentences, trim_to_relevant_sentences
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+# Words that refer back to an earlier turn ("is it contagious?", "what about for children?").
+REFERRING_WORDS = frozenset("it its they them their this that these those he she him her about also else same".split())
+# A message with fewer content words than this leans on the conversation for its topic.
+MIN_STANDALONE_TERMS = 2
+# Content words of the last standalone question carried into the retrieval query of follow-ups.
+MAX_TOPIC_TERMS = 8
+# Conversation ids as issued (secrets.token_urlsafe); anything else is treated as unknown.
+CONVERSATION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def is_follow_up(message: str) -> bool:
+    """Whether `message` depends on earlier turns to be understood: it refers back, or is too short to stand alone."""
+    if REFERRING_WORDS.intersection(WORD_PATTERN.findall(message.lower())):
+        return True
+    return len(tokenize(message)) < MIN_STANDALONE_TERMS
+
+
+class _Turn:
+    __slots__ = ("user", "assistant", "tokens")
+
+    def __init__(self, user: str, assistant: str):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = estimate_tokens(user) + estimate_tokens(assistant) + 4  # the "User: " / "Assistant: " labels
+
+
+class Conversation:
+    """
+    Server-side history of one chat. The most recent turns are kept verbatim, in
+    a ring buffer holding at most `history_token_budget` estimated tokens; older
+    turns are folded, one line each, into a rolling summary of at most
+    `summary_token_budget` tokens, whose oldest lines drop off in turn. Token
+    counts are kept as running totals, so adding a turn costs O(1) amortized
+    however long the conversation gets, and so does the history in the prompt.
+
+    Follow-up questions are rewritten for retrieval by prefixing the content
+    words of the last standalone question (the topic), so "what about for
+    children?" retrieves what the question it follows up on did.
+    """
+
+    def __init__(self, conversation_id: str, history_token_budget: int = 300, summary_token_budget: int = 150):
+        self.id = conversation_id
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.topic = ""
+        self.turn_count = 0
+        self._lock = threading.Lock()
+        self._turns = deque()
+        self._turn_tokens = 0
+        self._summary = deque()  # (line, tokens), oldest first
+        self._summary_tokens = 0
+
+    def retrieval_query(self, message: str) -> str:
+        """The text to embed and search for `message`: follow-ups carry the conversation's topic."""
+        topic = self.topic
+        return f"{topic} {message}" if topic and is_follow_up(message) else message
+
+    def add_turn(self, message: str, answer: str):
+        """Records an answered message, folding the oldest turns into the summary once over budget."""
+        # No single turn may take more than half the budget, so recent turns never vanish all at once.
+        query_terms = set(tokenize(message))
+        turn = _Turn(
+            trim_to_relevant_sentences(message, query_terms, self.history_token_budget // 4) or message[:200],
+            trim_to_relevant_sentences(answer, query_terms, self.history_token_budget // 4),
+        )
+        with self._lock:
+            self.turn_count += 1
+            if not is_follow_up(message) or not self.topic:
+                self.topic = " ".join(tokenize(message)[:MAX_TOPIC_TERMS])
+            self._turns.append(turn)
+            self._turn_tokens += turn.tokens
+            while self._turn_tokens > self.history_token_budget and len(self._turns) > 1:
+                self._fold(self._turns.popleft())
+
+    def _fold(self, turn: _Turn):
+        self._turn_tokens -= turn.tokens
+        answer = split_sentences(turn.assistant)
+        line = f"- Asked: {turn.user[:160]} Answered: {answer[0][:160] if answer else ''}"
+        tokens = estimate_tokens(line) + 1
+        self._summary.append((line, tokens))
+        self._summary_tokens += tokens
+        while self._summary_tokens > self.summary_token_budget and self._summary:
+            self._summary_tokens -= self._summary.popleft()[1]
+
+    @property
+    def history_tokens(self) -> int:
+        return self._turn_tokens + self._summary_tokens
+
+    def render(self) -> str:
+        """The history for the prompt ('' before the first turn)."""
+        with self._lock:
+            lines = []
+            if self._summary:
+                lines.append("Summary of earlier turns:")
+                lines.extend(line for line, _ in self._summary)
+            for turn in self._turns:
+                lines.append(f"User: {turn.user}")
+                lines.append(f"Assistant: {turn.assistant}")
+        return "\n".join(lines)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class ConversationStore:
+    """
+    Conversations by id, kept in a Django cache (`cache`) that every worker
+    process shares, so a follow-up finds its history whichever worker serves it.
+    A conversation is stored for `ttl_seconds` after its last `save`; which
+    others the cache evicts when full is up to its backend.
+
+    A request works on its own copy: two requests of one conversation served at
+    the same time each add their turn to the history they loaded, and the later
+    `save` wins.
+    """
+
+    def __init__(self, cache, ttl_seconds: float = 3600, history_token_budget: int = 300, summary_token_budget: int = 150):
+        self.cache = cache
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conversation:{conversation_id}"
+
+    def get_or_create(self, conversation_id: str = None) -> Conversation:
+        """The stored conversation with this id, or a new one (with a new id) if it is unknown or expired."""
+        conversation = None
+        if conversation_id and CONVERSATION_ID_PATTERN.fullmatch(conversation_id):
+            conversation = self.cache.get(self._key(conversation_id))
+        if conversation is None:
+            conversation = Conversation(secrets.token_urlsafe(16), self.history_token_budget, self.summary_token_budget)
+        return conversation
+
+    def save(self, conversation: Conversation):
+        """Stores `conversation` as it is now, restarting its time to live."""
+        self.cache.set(self._key(conversation.id), conversation, self.ttl_seconds)
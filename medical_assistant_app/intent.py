@@ -0,0 +1,175 @@
+# medical_assistant_app/intent.py
+
+import re
+
+import numpy as np
+
+GREETING = "greeting"
+OFF_TOPIC = "off_topic"
+MEDICAL = "medical"
+
+# Rule 2 of the prompt, word for word, so a locally rejected question reads exactly like one the LLM rejected.
+OFF_TOPIC_RESPONSE = (
+    "I apologize, but as a medical information assistant, I can only provide information related "
+    "to health topics. How can I help you with a health question?"
+)
+
+# Chitchat is recognised only when the whole message is made of these phrases,
+# after normalization ("hey, how's it going?"), so "hi, I have a rash" still goes
+# to the pipeline. The reply is that of the first phrase. Messages longer than
+# CHITCHAT_MAX_LENGTH are never chitchat.
+CHITCHAT_MAX_LENGTH = 60
+_CHITCHAT = [
+    (r"(hi|hello|hey|hiya|greetings|good (morning|afternoon|evening|day))( there| again| everyone| doc| doctor)?",
+     "Hello! I'm a medical information assistant. How can I help you with a health question today?"),
+    (r"(thanks|thank you|thank u|thx|ty|cheers)( (so|very) much| a lot| again)?( for (the|your) (help|answer|info|information))?",
+     "You're welcome! Let me know if you have any other health questions."),
+    (r"(bye|goodbye|see you|see ya|good night|take care)( later| soon)?",
+     "Take care! Feel free to come back whenever you have a health question."),
+    (r"(how are you|how are you doing|how is it going|how's it going|hows it going|what's up|whats up|sup)( today)?",
+     "I'm doing well, thank you for asking! What health question can I help you with?"),
+    (r"(can you help me|can you help|are you there|is anyone there|anyone there)",
+     "Hello! I'm a medical information assistant. How can I help you with a health question today?"),
+    (r"(ok|okay|cool|great|nice|got it|i see|alright|perfect|awesome)",
+     "Glad I could help! Is there anything else about your health you'd like to know?"),
+]
+_CHITCHAT_PHRASES = [(re.compile(pattern + r"\b"), reply) for pattern, reply in _CHITCHAT]
+_CHITCHAT_PATTERNS = [re.compile(pattern) for pattern, _ in _CHITCHAT]
+_NON_WORD = re.compile(r"[^a-z' ]+")
+
+# Requests that are plainly not about health, recognised (like chitchat) only when
+# the whole message is one of these requests: a single off-topic word proves
+# nothing ("Does the weather affect arthritis?", "I was bitten by a python").
+# Even then, a message with a word (or its singular) in MEDICAL_HINTS goes
+# through, so "a recipe for a diabetic dessert" is answered.
+_OFF_TOPIC_REQUESTS = re.compile("|".join(f"(?:{pattern})" for pattern in (
+    r"(please )?(tell|give) me (a|another) (joke|riddle)( about [a-z' ]+)?",
+    r"(please )?(write|compose) (me )?an? (poem|song|story|limerick)( about [a-z' ]+)?",
+    r"what('s| is| will be) the weather( like| forecast)?( in [a-z ]+)?( today| tomorrow| tonight| this weekend)?",
+    r"what('s| is) the capital (city )?of [a-z ]+",
+    r"what('s| is) the (current )?stock price of [a-z ]+",
+    r"(is )?(bitcoin|ethereum|crypto) a good investment",
+    r"what('s| is) my horoscope( for)?( today| tomorrow| this week)?",
+    r"who won the [a-z ]+ (game|match|election)( last night| yesterday| today)?",
+    r"(recommend|suggest) (me )?(some |a )?(good )?(movies?|films?|tv shows?|songs?|books?)( like [a-z' ]+| to watch( tonight)?)?",
+    r"(give me |what's |what is )?(a |the )?(good |best |easy )?recipe for [a-z' ]+",
+)))
+MEDICAL_HINTS = frozenset(
+    "health healthy medical medicine medication drug doctor nurse hospital clinic symptom pain painful "
+    "ache disease illness sick fever infection diet nutrition nutritious calorie vitamin allergy "
+    "allergies allergic diabetes diabetic blood heart cancer pregnant pregnancy injury injuries "
+    "treatment treat therapy dose dosage sleep stress anxiety depression exercise weight cough cold flu "
+    "virus vaccine headache rash skin mental wellness covid sugar cholesterol pressure body concussion "
+    "sinus stroke bone muscle joint breathing pulse contagious salt sodium protein fiber gluten "
+    "lactose keto low".split()
+)
+
+# Prototypes of each side of the embedding check. Their centroids, not the
+# sentences, are compared with the query embedding.
+MEDICAL_EXAMPLES = (
+    "What are the symptoms of a common cold?",
+    "How is type 2 diabetes treated?",
+    "What does ICD-10 code E11.9 mean?",
+    "Is it safe to take ibuprofen with high blood pressure?",
+    "What causes migraines and how can I prevent them?",
+    "How long does the flu last?",
+    "What are the side effects of metformin?",
+    "When should I see a doctor for chest pain?",
+    "How much sleep does a teenager need?",
+    "What foods help lower cholesterol?",
+    "Is a rash with fever a sign of measles?",
+    "What is the normal resting heart rate?",
+    "How do I know if a cut is infected?",
+    "What are early signs of depression?",
+    "Can stress cause stomach problems?",
+    "What vaccines do adults need?",
+)
+OFF_TOPIC_EXAMPLES = (
+    "What is the best lasagna recipe?",
+    "Who won the football match last night?",
+    "What will the weather be like tomorrow?",
+    "Write a Python function to sort a list.",
+    "What is the capital of Australia?",
+    "Should I buy bitcoin or stocks?",
+    "Recommend a good movie to watch tonight.",
+    "Translate this sentence into French.",
+    "How do I fix my car's flat tire?",
+    "Tell me a joke about cats.",
+    "What is the population of Tokyo?",
+    "How do I change my email password?",
+    "Who wrote Pride and Prejudice?",
+    "Plan a three-day trip to Rome.",
+    "What is the price of gold today?",
+    "How do I grow tomatoes on a balcony?",
+)
+
+
+def _normalize(message: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", message.lower().replace("’", "'")).split())
+
+
+def _is_chitchat(normalized: str) -> bool:
+    """
+    Whether `normalized` is a sequence of chitchat phrases. Scans left to right,
+    taking the longest run of words that is one phrase, and never goes back: one
+    regex over repeated, overlapping phrases backtracks exponentially.
+    """
+    if not normalized or len(normalized) > CHITCHAT_MAX_LENGTH:
+        return False
+    word_ends = [match.end() for match in re.finditer(r"[^ ]+", normalized)]
+    position = 0
+    while position < len(normalized):
+        end = next((end for end in reversed(word_ends) if end > position
+                    and any(pattern.fullmatch(normalized, position, end) for pattern in _CHITCHAT_PATTERNS)), None)
+        if end is None:
+            return False
+        position = end + 1  # past the space after the phrase
+    return True
+
+
+def _has_medical_hint(normalized: str) -> bool:
+    return any(word in MEDICAL_HINTS or word.rstrip("s") in MEDICAL_HINTS for word in normalized.split())
+
+
+def classify_message(message: str, off_topic: bool = False) -> tuple[str, str]:
+    """
+    The keyword tier: (intent, reply) for chitchat and, with `off_topic`, plainly
+    off-topic requests; (MEDICAL, '') for everything else. Costs a few regex
+    matches.
+    """
+    normalized = _normalize(message)
+    if _is_chitchat(normalized):
+        return GREETING, next(reply for pattern, reply in _CHITCHAT_PHRASES if pattern.match(normalized))
+    if off_topic and _OFF_TOPIC_REQUESTS.fullmatch(normalized) and not _has_medical_hint(normalized):
+        return OFF_TOPIC, OFF_TOPIC_RESPONSE
+    return MEDICAL, ""
+
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class CentroidIntentClassifier:
+    """
+    The embedding tier: a query is off-topic when its cosine similarity to the
+    centroid of OFF_TOPIC_EXAMPLES beats its similarity to the centroid of
+    MEDICAL_EXAMPLES by more than a margin. It reuses the query embedding the
+    pipeline computes anyway, so it costs two dot products. A positive margin
+    makes it err towards answering: a medical question wrongly rejected costs
+    more than an off-topic one sent to the LLM, which rule 2 still handles.
+    """
+
+    def __init__(self, encode):
+        embeddings = _unit(encode(list(MEDICAL_EXAMPLES + OFF_TOPIC_EXAMPLES)))
+        split = len(MEDICAL_EXAMPLES)
+        self._centroids = _unit([embeddings[:split].mean(axis=0), embeddings[split:].mean(axis=0)])
+
+    def scores(self, query_embeddings) -> np.ndarray:
+        """Off-topic minus medical centroid similarity, one per query embedding."""
+        similarities = _unit(query_embeddings) @ self._centroids.T
+        return similarities[..., 1] - similarities[..., 0]
+
+    def is_off_topic(self, query_embedding, margin: float = 0.1) -> bool:
+        return bool(self.scores(query_embedding) > margin)
@@ -0,0 +1,72 @@
+# medical_assistant_app/lifecycle.py
+
+import os
+import sys
+import threading
+
+# Process id of the process whose warm-up has started. The warm-up starts in the
+# process that serves, never at import time: a pre-fork server (gunicorn --preload)
+# imports the application in its master and forks workers from it, and a worker
+# forked while the master was loading the RAG stack would inherit its locks held
+# and its threads (embedding batcher, thread pools, torch) gone.
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+
+def start_rag_warmup():
+    """
+    Load the embedding model and ChromaDB in a background thread, so the first chat
+    request after a deploy or worker recycle does not pay for it. Runs once per
+    process; RAG_WARMUP_ON_STARTUP=0 keeps loading lazy.
+    """
+    global _warmup_pid
+    if os.getenv('RAG_WARMUP_ON_STARTUP', '1') != '1':
+        return
+    with _warmup_lock:
+        if _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+
+    def warm_up():
+        from .llm_rag import warm_up_rag_components
+        warm_up_rag_components()
+
+    threading.Thread(target=warm_up, name='rag-warmup', daemon=True).start()
+
+
+def asgi_application(django_application):
+    """
+    Wraps Django's ASGI handler. Each worker starts the warm-up when its server
+    sends the lifespan startup event (uvicorn, hypercorn), or on its first request
+    for servers without lifespan support, and closes the LLM client's connection
+    pools on the lifespan shutdown event (atexit does it otherwise).
+    """
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    start_rag_warmup()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    # Only if a request loaded it: importing the RAG stack to close
+                    # nothing would slow the shutdown down.
+                    llm_rag = sys.modules.get(f'{__package__}.llm_rag')
+                    if llm_rag is not None:
+                        await llm_rag.aclose_llm_client()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        start_rag_warmup()
+        await django_application(scope, receive, send)
+    return application
+
+
+def wsgi_application(django_application):
+    """
+    Wraps Django's WSGI handler: WSGI has no startup event, so each worker starts
+    the warm-up on its first request (a readiness probe on /api/ready/ will do).
+    """
+    def application(environ, start_response):
+        start_rag_warmup()
+        return django_application(environ, start_response)
+    return application
@@ -0,0 +1,417 @@
+# medical_assistant_app/llm_client.py
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import aiohttp
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Statuses worth retrying: rate limiting and transient upstream failures.
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Most bytes taken per read of a sync response body; the deadline is checked between reads.
+BODY_CHUNK_BYTES = 16 * 1024
+
+
+class LLMClientError(Exception):
+    """Base class for failures raised by LLMClient."""
+
+
+class LLMHTTPError(LLMClientError):
+    """The upstream answered with an error status (after any retries)."""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"HTTP Error: {status}" + (f" - {message}" if message else ""))
+        self.status = status
+        self.message = message
+
+
+class LLMTimeoutError(LLMClientError):
+    """The request deadline expired before a successful response."""
+
+
+class LLMConnectionError(LLMClientError):
+    """The upstream could not be reached (after any retries)."""
+
+
+class LLMResponseError(LLMClientError):
+    """The upstream answered with a success status but a body that could not be decoded."""
+
+
+class CircuitOpenError(LLMClientError):
+    """The circuit breaker is open, so the call was rejected without touching the network."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failed calls in a row the breaker opens and every
+    call fails fast. A call counts once, when it has failed for good: the
+    attempts it retries do not count on their own. Once `reset_timeout` seconds have passed a single trial call
+    is let through (half-open); its outcome closes or re-opens the breaker. A trial
+    that ends with neither outcome (cancelled, abandoned) must be released with
+    `release_trial`, or no further call would be let through.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        return self.admit() is not None
+
+    def admit(self):
+        """None if the call is rejected; otherwise whether it is the half-open trial call."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return None
+
+    def allows_retry(self, trial: bool) -> bool:
+        """
+        Whether an admitted call may try again: the breaker is still closed, or the
+        call is the half-open trial. Unlike `admit`, it never takes the trial slot.
+        """
+        with self._lock:
+            return self._state == self.CLOSED or (trial and self._state == self.HALF_OPEN)
+
+    def release_trial(self):
+        """Frees the half-open trial slot of a call that ended without an outcome; no-op once one was recorded."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class LLMClient:
+    """
+    HTTP client for a Gemini-style `generateContent` endpoint.
+
+    Sync calls share one `requests.Session` whose connection pool keeps up to
+    `pool_size` keep-alive connections; async calls share one aiohttp session per
+    event loop. Every call has an overall `deadline` covering all attempts,
+    including reading the response body.
+    Retryable failures are retried with exponential backoff and full jitter, and a
+    shared CircuitBreaker makes calls fail fast while the upstream is down.
+    """
+
+    def __init__(self, api_url: str, api_key: str, pool_size: int = 20,
+                 async_pool_size: int = 200, deadline: float = 30.0,
+                 connect_timeout: float = 5.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 breaker: CircuitBreaker = None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.async_pool_size = async_pool_size
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+
+        self._async_session = None
+        self._async_session_loop = None
+        self._closing = None
+
+    @property
+    def stream_url(self) -> str:
+        """Server-Sent Events variant of the configured endpoint."""
+        return self.api_url.replace(":generateContent", ":streamGenerateContent")
+
+    def _backoff_delay(self, attempt: int, retry_after: str = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _acquire(self) -> bool:
+        """Admits a call through the breaker; True if it is the half-open trial, which the caller must release."""
+        trial = self.breaker.admit()
+        if trial is None:
+            raise CircuitOpenError("LLM circuit breaker is open; upstream is failing.")
+        return trial
+
+    # --- Sync ---
+    def generate(self, payload: dict) -> dict:
+        """POSTs `payload` and returns the decoded JSON body."""
+        trial = self._acquire()
+        try:
+            return self._generate(payload, trial)
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    def _generate(self, payload: dict, trial: bool) -> dict:
+        expires_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise LLMTimeoutError(f"LLM request exceeded its {self.deadline:.0f}s deadline.")
+            try:
+                response = self._session.post(
+                    self.api_url, params={"key": self.api_key}, data=json.dumps(payload),
+                    timeout=(min(self.connect_timeout, remaining), remaining), stream=True,
+                )
+                body = self._read_body(response, expires_at)
+            except requests.exceptions.RequestException as e:
+                error, retry_after = e, None
+            except LLMTimeoutError:
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code < 400:
+                    try:
+                        result = json.loads(body)
+                    except ValueError as e:
+                        self.breaker.record_failure()
+                        raise LLMResponseError(f"LLM response is not valid JSON: {e}")
+                    self.breaker.record_success()
+                    return result
+                message = _error_message(body.decode("utf-8", "replace"))
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()  # the upstream is healthy; the request was rejected
+                    raise LLMHTTPError(response.status_code, message)
+                error, retry_after = LLMHTTPError(response.status_code, message), response.headers.get("Retry-After")
+
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= expires_at:
+                self.breaker.record_failure()
+                raise _as_client_error(error)
+            if not self.breaker.allows_retry(trial):
+                raise CircuitOpenError("LLM circuit breaker opened while retrying.")
+            attempt += 1
+            time.sleep(delay)
+
+    def _read_body(self, response: requests.Response, expires_at: float) -> bytes:
+        """
+        Reads a streamed response's body within the call's deadline. The read
+        timeout given to `post` bounds each wait for data, not the whole body, so
+        every read takes whatever data has arrived and is given only the time left.
+        """
+        chunks = []
+        try:
+            while True:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"LLM response body was not read within the {self.deadline:.0f}s deadline.")
+                _set_read_timeout(response, remaining)
+                chunk = response.raw.read1(BODY_CHUNK_BYTES, decode_content=True)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        except urllib3.exceptions.ReadTimeoutError as e:  # the time left ran out mid-read
+            raise LLMTimeoutError(f"LLM response body was not read within the {self.deadline:.0f}s deadline.") from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e) from e  # retried like any failed attempt
+        finally:
+            response.close()
+
+    def close(self):
+        """
+        Closes the sync pool, and the async pool on the event loop that opened it:
+        scheduled there if that loop is still running (in this thread or another),
+        skipped if it has stopped, as an aiohttp session cannot be closed without it.
+        """
+        self._session.close()
+        session, loop = self._async_session, self._async_session_loop
+        if session is None or session.closed or loop.is_closed() or not loop.is_running():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._closing = loop.create_task(session.close())  # referenced until done
+        else:
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    # --- Async ---
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """Returns the pooled aiohttp session bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_session_loop is not loop:
+            # A session cannot be shared across event loops, so a new pool is opened
+            # per loop. Callers on short-lived loops (each async_to_sync call under
+            # WSGI runs its own) should use the sync methods instead.
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.async_pool_size),
+                headers={"Content-Type": "application/json"},
+            )
+            self._async_session_loop = loop
+        return self._async_session
+
+    async def _apost(self, url: str, payload: dict, params: dict, expires_at: float, attempt_timeout, trial: bool):
+        """
+        Opens a POST with retries and returns the live response. The caller must
+        release it and record its outcome; a call that fails for good here is
+        recorded as one failure.
+        """
+        attempt = 0
+        while True:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise LLMTimeoutError(f"LLM request exceeded its {self.deadline:.0f}s deadline.")
+            try:
+                response = await self._get_async_session().post(
+                    url, params=params, data=json.dumps(payload), timeout=attempt_timeout(remaining),
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error, retry_after = e, None
+            else:
+                if response.status < 400:
+                    return response
+                body = await response.text()
+                response.release()
+                if response.status not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    raise LLMHTTPError(response.status, _error_message(body))
+                error, retry_after = LLMHTTPError(response.status, _error_message(body)), response.headers.get("Retry-After")
+
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= expires_at:
+                self.breaker.record_failure()
+                raise _as_client_error(error)
+            if not self.breaker.allows_retry(trial):
+                raise CircuitOpenError("LLM circuit breaker opened while retrying.")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def agenerate(self, payload: dict) -> dict:
+        """Async counterpart of `generate`."""
+        trial = self._acquire()
+        try:
+            return await self._agenerate(payload, trial)
+        finally:
+            if trial:
+                self.breaker.release_trial()  # e.g. the task was cancelled mid-call
+
+    async def _agenerate(self, payload: dict, trial: bool) -> dict:
+        expires_at = time.monotonic() + self.deadline
+        response = await self._apost(
+            self.api_url, payload, {"key": self.api_key}, expires_at,
+            lambda remaining: aiohttp.ClientTimeout(total=remaining, connect=self.connect_timeout), trial,
+        )
+        try:
+            result = json.loads(await response.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            raise _as_client_error(e)
+        except ValueError as e:
+            self.breaker.record_failure()
+            raise LLMResponseError(f"LLM response is not valid JSON: {e}")
+        finally:
+            response.release()
+        self.breaker.record_success()
+        return result
+
+    async def astream(self, payload: dict):
+        """
+        Async generator over the decoded `data:` chunks of a streaming response.
+        Only opening the stream is retried; the deadline bounds the wait for the
+        first byte and the gap between chunks, not the whole generation. A stream
+        closed early by the consumer records no outcome.
+        """
+        trial = self._acquire()
+        try:
+            expires_at = time.monotonic() + self.deadline
+            response = await self._apost(
+                self.stream_url, payload, {"alt": "sse", "key": self.api_key}, expires_at,
+                lambda remaining: aiohttp.ClientTimeout(total=None, connect=self.connect_timeout, sock_read=remaining),
+                trial,
+            )
+            try:
+                async for raw_line in response.content:
+                    try:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        chunk = json.loads(line[len("data:"):])
+                    except ValueError as e:  # UnicodeDecodeError or JSONDecodeError
+                        self.breaker.record_failure()
+                        raise LLMResponseError(f"LLM stream chunk could not be decoded: {e}")
+                    yield chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                raise _as_client_error(e)
+            finally:
+                response.release()
+            self.breaker.record_success()
+        finally:
+            if trial:
+                self.breaker.release_trial()  # cancelled, or the consumer stopped reading
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+
+
+def _error_message(body: str) -> str:
+    """Extracts `error.message` from a Gemini error body, if present."""
+    try:
+        return json.loads(body).get("error", {}).get("message", "")
+    except (json.JSONDecodeError, AttributeError):
+        return ""
+
+
+def _set_read_timeout(response: requests.Response, seconds: float):
+    """Shortens the socket timeout of the remaining reads of a streamed response (once read, it holds no socket)."""
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+def _as_client_error(error: Exception) -> LLMClientError:
+    if isinstance(error, LLMClientError):
+        return error
+    if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+        return LLMTimeoutError(f"LLM request timed out: {error}")
+    return LLMConnectionError(str(error) or type(error).__name__)
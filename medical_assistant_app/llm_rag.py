@@ -1,11 +1,26 @@
 # medical_assistant_app/llm_rag.py
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-import requests
-import json
+import asyncio
+import atexit
 import os
+import queue
+import threading
+import time
+from contextlib import aclosing
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
+from .admission import AdmissionController, RateLimiter
+from .answer_cache import SemanticAnswerCache
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .conversation import Conversation, ConversationStore
+from .intent import MEDICAL, OFF_TOPIC, OFF_TOPIC_RESPONSE, CentroidIntentClassifier, classify_message
+from .llm_client import CircuitBreaker, CircuitOpenError, LLMClient, LLMClientError, LLMHTTPError
+from .metrics import INTENT_FAST_PATH, REGISTRY, Gauge, note_chat, span
+from .onnx_embedder import OnnxEmbedder, load_embedder
+from .prompt_builder import PromptBuilder, estimate_tokens
+from .sharding import merge_nearest, shard_locations, shard_of
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .vector_index import EMBEDDINGS_FILE, NumpyVectorIndex
 
 # --- Configuration ---
 load_dotenv()
@@ -23,103 +38,702 @@ MODEL_NAME = 'all-MiniLM-L6-v2'
 N_RESULTS = 3
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent"
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent",
+)
+
+# --- LLM Client Configuration ---
+# Keep-alive connections pooled for sync calls (size to the worker thread count).
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+# Upper bound on pooled keep-alive connections held by the async HTTP client.
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "200"))
+# Overall budget for one LLM call, including retries.
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+# Consecutive failed calls (after their retries) that open the circuit breaker, and how long it stays open.
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# --- Async Configuration ---
+# Threads used to run blocking embedding/ChromaDB work off the event loop.
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "4"))
+
+# --- Answer Cache Configuration ---
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# By default only a query with the same normalized text (case, spacing and trailing
+# punctuation ignored) reuses a cached answer. Near-hits also serve a differently
+# worded query whose embedding is within ANSWER_CACHE_SIMILARITY (cosine) and whose
+# numbers and negations match; the embeddings cannot tell "dose for children" from
+# "dose for adults", so enable them only with a threshold checked on your traffic
+# (python -m benchmarks.bench_answer_cache --pairs).
+ANSWER_CACHE_NEAR_HITS_ENABLED = os.getenv("ANSWER_CACHE_NEAR_HITS_ENABLED", "0") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+# --- Request Coalescing ---
+# Concurrent identical queries (after normalization) share one pipeline run.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+# --- Embedding Batching ---
+# Query embeddings requested within EMBED_BATCH_MAX_WAIT_MS of each other are
+# encoded together in one model call (at most EMBED_BATCH_MAX_SIZE queries).
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "1") == "1"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+# --- Batch API ---
+# Most messages accepted by one /api/chat/batch/ request, and how many of a
+# batch's LLM calls run at the same time.
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# --- Admission Control ---
+# Chat API requests (single, batch or streamed) running the RAG pipeline at once
+# per process (0 = no limit). Up to ADMISSION_MAX_QUEUE more wait for a slot, each
+# for at most ADMISSION_QUEUE_TIMEOUT_SECONDS; the rest get 503 with a Retry-After
+# of ADMISSION_RETRY_AFTER_SECONDS straight away.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+# Per-client limit: RATE_LIMIT_PER_MINUTE chat API requests a minute after a burst
+# of RATE_LIMIT_BURST (0 = no limit); over it, 429 with Retry-After. Clients are
+# told apart by REMOTE_ADDR, or behind reverse proxies by RATE_LIMIT_CLIENT_HEADER
+# (e.g. X-Forwarded-For). Each proxy appends the address it was reached from, and
+# anything to their left came from the client, so the address used is the one
+# RATE_LIMIT_TRUSTED_PROXIES (the number of proxies in front of the app) places
+# from the right: the one the outermost trusted proxy saw.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "")
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+
+# --- Embedding Backend ---
+# 'torch' runs MODEL_NAME with sentence-transformers on PyTorch. 'onnx' and
+# 'onnx-int8' run the export written by `python manage.py export_embedding_onnx`
+# (float32, or with int8 dynamically quantized weights) on ONNX Runtime, with the
+# same tokenizer and pooling and without importing torch: less CPU per query and a
+# much smaller worker. Falls back to 'torch' while the export is missing.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", os.path.join(os.path.dirname(CHROMA_DB_PATH), 'embedding_onnx'))
+# ONNX Runtime threads per inference (0 = one per core).
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# --- Vector Search Backend ---
+# 'chroma' queries the ChromaDB collection. 'numpy' runs an exact search over the
+# memory-mapped export written by load_data_to_vectordb.py, which skips ChromaDB's
+# per-query SQLite/HNSW overhead; suited to small and mid-sized corpora.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_PATH = os.path.join(CHROMA_DB_PATH, 'vector_index')
+# The NumPy backend can scan an int8 (per-vector scale) or float16 copy of the
+# embeddings instead of float32: a quarter or half of the memory, shared by every
+# worker on the host. The best VECTOR_RERANK_CANDIDATES approximate matches are
+# then rescored with their float32 vectors (0 = no re-rank).
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+VECTOR_RERANK_CANDIDATES = int(os.getenv("VECTOR_RERANK_CANDIDATES", "50"))
+
+# --- Vector Sharding ---
+# With VECTOR_SHARDS > 1 the ChromaDB backend spreads the chunks over that many
+# shards (see sharding.py), as written by `load_data_to_vectordb.py --shards N`.
+# Every query goes to all shards at once and the per-shard nearest chunks are
+# merged; each shard's index stays small as corpora are added. The layout is
+# 'collections' (one ChromaDB directory) or 'directories' (one per shard).
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+VECTOR_SHARD_LAYOUT = os.getenv("VECTOR_SHARD_LAYOUT", "collections")
+
+# --- Hybrid Retrieval ---
+# A BM25 index over the same chunks (written by load_data_to_vectordb.py) is queried
+# alongside ChromaDB so exact terms such as ICD-10 codes and drug names are matched;
+# the two rankings are merged with reciprocal-rank fusion.
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "1") == "1"
+BM25_INDEX_PATH = os.path.join(CHROMA_DB_PATH, 'bm25_index.npz')
+# Candidates taken from each ranking before fusion, and the RRF rank constant.
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# --- Re-ranking ---
+# When enabled, RERANK_CANDIDATES chunks are retrieved per query and scored against
+# it by a small cross-encoder (one batched call per request); the best N_RESULTS are
+# kept. Chunks scoring below RERANK_MIN_SCORE (in the model's own units; unset = no
+# cutoff) are dropped, so an off-topic question is sent without any context.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE")) if os.getenv("RERANK_MIN_SCORE") else None
+
+# --- Prompt Budget ---
+# Retrieved context is fitted to about PROMPT_CONTEXT_TOKEN_BUDGET tokens (0 = no
+# limit): chunks nearly identical to a better-ranked one are dropped, and long chunks
+# keep only their sentences most relevant to the question.
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "400"))
+# Word-set (Jaccard) similarity at or above which a chunk counts as a near-duplicate
+# (above 1 keeps every chunk).
+PROMPT_DUPLICATE_SIMILARITY = float(os.getenv("PROMPT_DUPLICATE_SIMILARITY", "0.8"))
+
+# --- Conversation Memory ---
+# Chat requests carrying a "conversation_id" keep server-side history: recent turns
+# verbatim within CONVERSATION_HISTORY_TOKEN_BUDGET tokens and a rolling summary of
+# older ones within CONVERSATION_SUMMARY_TOKEN_BUDGET, so the prompt stops growing
+# however long the chat runs. Conversations are kept in the 'conversations' cache
+# of the Django settings, shared by all workers, and expire CONVERSATION_TTL_SECONDS
+# after their last turn.
+CONVERSATION_HISTORY_TOKEN_BUDGET = int(os.getenv("CONVERSATION_HISTORY_TOKEN_BUDGET", "300"))
+CONVERSATION_SUMMARY_TOKEN_BUDGET = int(os.getenv("CONVERSATION_SUMMARY_TOKEN_BUDGET", "150"))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+CONVERSATION_CACHE = "conversations"
+
+# --- Intent Fast-Path ---
+# Greetings and chitchat, and plainly off-topic requests, get the templated replies
+# of prompt rules 1 and 2 locally, with no retrieval and no LLM call: first by
+# keyword on the raw message, then (INTENT_CENTROID_ENABLED) by comparing the query
+# embedding with medical and off-topic centroids. A query is rejected only if it is
+# closer to the off-topic centroid by more than INTENT_OFF_TOPIC_MARGIN (cosine).
+# Only chitchat is answered locally by default. Both off-topic rules are opt-in:
+# check them on your traffic with benchmarks/bench_intent.py first, as a rejected
+# medical question goes unanswered.
+INTENT_FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH_ENABLED", "1") == "1"
+INTENT_KEYWORD_OFF_TOPIC_ENABLED = os.getenv("INTENT_KEYWORD_OFF_TOPIC_ENABLED", "0") == "1"
+INTENT_CENTROID_ENABLED = os.getenv("INTENT_CENTROID_ENABLED", "0") == "1"
+INTENT_OFF_TOPIC_MARGIN = float(os.getenv("INTENT_OFF_TOPIC_MARGIN", "0.1"))
 
 # --- Global Component Initialization ---
-# (This section is correct and remains unchanged)
+# chromadb and sentence_transformers (torch) are imported by the loaders below,
+# not at module level: together they cost seconds and ~800 MB, which processes
+# that import this module but never retrieve (management commands) should not pay.
+# With an ONNX embedding backend, torch is not imported at all (unless RERANK_ENABLED).
 _chroma_client = None
 _embedding_model = None
 _chroma_collection = None
+_retriever = None
+_answer_cache = None
+_bm25_index = None
+_bm25_index_mtime = None
+_bm25_lock = threading.Lock()
+_reranker = None
+_intent_classifier = None
+_llm_client = None
+_llm_client_lock = threading.Lock()
+_prompt_builder = None
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+_admission_controller = None
+_rate_limiter = None
+_embedding_batcher = None
+_embedding_batcher_lock = threading.Lock()
+_init_lock = threading.Lock()
+_component_timings = {}  # component -> load time in ms, for cold-start diagnostics
+_warmed_up = False
+_rag_flight = SingleFlight()
+_async_rag_flight = AsyncSingleFlight()
 
-def _initialize_rag_components():
-    """Initializes ChromaDB client and embedding model if not already initialized."""
-    global _chroma_client, _embedding_model, _chroma_collection
-    if _chroma_client is None:
-        try:
-            print(f"Initializing ChromaDB client at path: {CHROMA_DB_PATH}")
-            _chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-            _chroma_collection = _chroma_client.get_or_create_collection(name=COLLECTION_NAME)
-            print(f"ChromaDB client and collection '{COLLECTION_NAME}' initialized.")
-        except Exception as e:
-            print(f"Error initializing ChromaDB: {e}")
-            _chroma_client = None; _chroma_collection = None
-            return False
+class LLMCallError(Exception):
+    """Raised when the LLM could not produce an answer. The message is safe to show to the user."""
 
-    if _embedding_model is None:
-        try:
-            _embedding_model = SentenceTransformer(MODEL_NAME)
-            print(f"Embedding model '{MODEL_NAME}' loaded.")
-        except Exception as e:
-            print(f"Error loading embedding model: {e}")
-            _embedding_model = None
-            return False
-    return True
+class VectorRetriever:
+    """
+    The vector search behind the RAG pipeline, selected by VECTOR_BACKEND.
+    `query` returns the ids and documents of the chunks nearest to an embedding,
+    best first; `fingerprint` changes whenever the stored chunks are rewritten.
+    """
+    name = None
 
-def _call_gemini_api(prompt_text: str) -> str:
-    """Helper function to send a prompt to the Gemini API and return the response."""
-    # (This function is correct and remains unchanged)
-    if not GEMINI_API_KEY:
-        return "LLM API key is not configured. Please set GEMINI_API_KEY in your .env file."
+    def query(self, query_embedding, n_results: int) -> tuple[list[str], list[str]]:
+        raise NotImplementedError
 
-    payload = {"contents": [{"role": "user", "parts": [{"text": prompt_text}]}]}
-    headers = {'Content-Type': 'application/json'}
-    api_url_with_key = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
+    def query_many(self, query_embeddings, n_results: int) -> list[tuple[list[str], list[str]]]:
+        """`query` for several embeddings, in order; backends override it with one batched lookup."""
+        return [self.query(query_embedding, n_results) for query_embedding in query_embeddings]
 
-    print("--- Sending request to LLM ---")
-    
-    try:
-        response = requests.post(api_url_with_key, headers=headers, data=json.dumps(payload), timeout=60)
-        response.raise_for_status()
-        result = response.json()
+    def get_documents(self, ids: list[str]) -> dict[str, str]:
+        """Documents of the given ids (unknown ids are left out)."""
+        raise NotImplementedError
 
-        if result.get("candidates") and result["candidates"][0].get("content", {}).get("parts"):
-            return result["candidates"][0]["content"]["parts"][0]["text"].strip()
-        else:
-            print("LLM response structure unexpected or empty:", result)
-            return "I apologize, but I received an unusual response from the AI. This might be due to a content filter. Please try rephrasing."
-    except requests.exceptions.HTTPError as e:
-        error_details = f"HTTP Error: {e.response.status_code}"
+    def fingerprint(self):
+        raise NotImplementedError
+
+class ChromaRetriever(VectorRetriever):
+    name = 'chroma'
+
+    def __init__(self, collection, db_path: str):
+        self.collection = collection
+        self.db_path = db_path
+
+    def query(self, query_embedding, n_results: int) -> tuple[list[str], list[str]]:
+        return self.query_many([query_embedding], n_results)[0]
+
+    def query_many(self, query_embeddings, n_results: int) -> list[tuple[list[str], list[str]]]:
+        return [(ids, documents) for ids, documents, _ in self.query_many_with_distances(query_embeddings, n_results)]
+
+    def query_many_with_distances(self, query_embeddings, n_results: int) -> list[tuple[list[str], list[str], list[float]]]:
+        """`query_many` with each chunk's distance to its query, as ShardedRetriever merges them."""
+        results = self.collection.query(
+            query_embeddings=[query_embedding.tolist() for query_embedding in query_embeddings],
+            n_results=n_results,
+            include=['documents', 'distances']
+        )
+        ids = results.get('ids') or [[] for _ in query_embeddings]
+        documents = results.get('documents') or [[] for _ in query_embeddings]
+        distances = results.get('distances') or [[] for _ in query_embeddings]
+        return list(zip(ids, documents, distances))
+
+    def get_documents(self, ids: list[str]) -> dict[str, str]:
+        fetched = self.collection.get(ids=ids, include=['documents'])
+        return dict(zip(fetched['ids'], fetched['documents']))
+
+    def fingerprint(self):
+        sqlite_path = os.path.join(self.db_path, 'chroma.sqlite3')
+        mtimes = tuple(
+            os.path.getmtime(path) if os.path.exists(path) else None
+            for path in (sqlite_path, sqlite_path + '-wal')
+        )
+        return self.collection.count(), mtimes
+
+class ShardedRetriever(VectorRetriever):
+    """
+    Scatter-gather over the ChromaDB shards of a sharded knowledge base: a lookup
+    is sent to every shard at once on a thread pool, and each shard's nearest
+    chunks (sorted by distance) are merged into the overall nearest with a heap.
+    Chunks are placed by `shard_of` their id, so a document fetch asks only the
+    shards that hold the ids.
+    """
+    name = 'chroma-sharded'
+
+    def __init__(self, shards: list[ChromaRetriever]):
+        self.shards = shards
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="vector-shard")
+
+    def query(self, query_embedding, n_results: int) -> tuple[list[str], list[str]]:
+        return self.query_many([query_embedding], n_results)[0]
+
+    def query_many(self, query_embeddings, n_results: int) -> list[tuple[list[str], list[str]]]:
+        per_shard = list(self._pool.map(
+            lambda shard: shard.query_many_with_distances(query_embeddings, n_results), self.shards
+        ))
+        return [
+            merge_nearest([results[index] for results in per_shard], n_results)
+            for index in range(len(query_embeddings))
+        ]
+
+    def get_documents(self, ids: list[str]) -> dict[str, str]:
+        by_shard = {}
+        for cid in ids:
+            by_shard.setdefault(shard_of(cid, len(self.shards)), []).append(cid)
+        documents = {}
+        for fetched in self._pool.map(lambda item: self.shards[item[0]].get_documents(item[1]), by_shard.items()):
+            documents.update(fetched)
+        return documents
+
+    def fingerprint(self):
+        return tuple(shard.fingerprint() for shard in self.shards)
+
+class NumpyRetriever(VectorRetriever):
+    """
+    Serves a NumpyVectorIndex, reloading it when load_data_to_vectordb.py writes
+    a new export. Raises FileNotFoundError if no export exists yet.
+    """
+    name = 'numpy'
+
+    def __init__(self, index_path: str, dtype: str = 'float32', rerank_candidates: int = 0):
+        self.index_path = index_path
+        self.dtype = dtype
+        self.rerank_candidates = rerank_candidates
+        self._lock = threading.Lock()
+        self._index = None
+        self._mtime = None
+        self._current()
+
+    def _current(self) -> NumpyVectorIndex:
         try:
-            error_message = e.response.json().get("error", {}).get("message", "No details.")
-            error_details += f" - {error_message}"
-        except json.JSONDecodeError:
-            pass
-        print(f"Error communicating with LLM API: {error_details}")
-        return "There was an issue connecting to the AI. Please check the API key and model name."
-    except requests.exceptions.RequestException as e:
-        print(f"Error communicating with LLM API: {e}")
-        return f"There was an issue connecting to the AI. Error: {e}"
+            mtime = os.path.getmtime(os.path.join(self.index_path, EMBEDDINGS_FILE))
+        except OSError:
+            if self._index is None:
+                raise
+            return self._index  # mid-swap: keep serving the index already mapped
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = NumpyVectorIndex.load(self.index_path, self.dtype, self.rerank_candidates)
+                    self._mtime = mtime
+        return self._index
+
+    def __len__(self):
+        return len(self._current())
+
+    def query(self, query_embedding, n_results: int) -> tuple[list[str], list[str]]:
+        return self._current().query(query_embedding, n_results)
+
+    def query_many(self, query_embeddings, n_results: int) -> list[tuple[list[str], list[str]]]:
+        return self._current().query_many(query_embeddings, n_results)
+
+    def get_documents(self, ids: list[str]) -> dict[str, str]:
+        return self._current().get_documents(ids)
+
+    def fingerprint(self):
+        index = self._current()
+        return len(index), self._mtime
+
+def _collection_fingerprint():
+    """Changes whenever the knowledge base is written to; used to invalidate cached answers."""
+    return _retriever.fingerprint()
+
+def _components_loaded() -> bool:
+    return _retriever is not None and _embedding_model is not None and (
+        not ANSWER_CACHE_ENABLED or _answer_cache is not None
+    )
+
+def _initialize_rag_components():
+    """
+    Initializes the vector search backend, embedding model and answer cache if not
+    already initialized. Thread-safe: concurrent first requests wait for a single initialization.
+    """
+    global _chroma_client, _embedding_model, _chroma_collection, _retriever, _answer_cache
+    if _components_loaded():
+        return True
+
+    with _init_lock:
+        if _retriever is None and VECTOR_BACKEND == 'numpy':
+            try:
+                start = time.perf_counter()
+                _retriever = NumpyRetriever(VECTOR_INDEX_PATH, VECTOR_INDEX_DTYPE, VECTOR_RERANK_CANDIDATES)
+                _component_timings['vector_index'] = (time.perf_counter() - start) * 1000
+                print(f"NumPy vector index loaded from {VECTOR_INDEX_PATH} ({len(_retriever)} chunks, {VECTOR_INDEX_DTYPE}).")
+            except FileNotFoundError as e:
+                print(f"NumPy vector index file {e.filename} not found; using ChromaDB until load_data_to_vectordb.py builds it.")
+            except Exception as e:
+                print(f"Error loading NumPy vector index: {e}. Using ChromaDB.")
+
+        if _retriever is None:
+            try:
+                print(f"Initializing ChromaDB client at path: {CHROMA_DB_PATH}")
+                start = time.perf_counter()
+                import chromadb
+                if VECTOR_SHARDS > 1:
+                    clients, shards = {}, []
+                    for path, name in shard_locations(CHROMA_DB_PATH, COLLECTION_NAME, VECTOR_SHARDS, VECTOR_SHARD_LAYOUT):
+                        if path not in clients:
+                            clients[path] = chromadb.PersistentClient(path=path)
+                        shards.append(ChromaRetriever(clients[path].get_or_create_collection(name=name), path))
+                    _retriever = ShardedRetriever(shards)
+                    print(f"ChromaDB initialized with {VECTOR_SHARDS} shards ({VECTOR_SHARD_LAYOUT}).")
+                else:
+                    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+                    _chroma_collection = client.get_or_create_collection(name=COLLECTION_NAME)
+                    _chroma_client = client
+                    _retriever = ChromaRetriever(_chroma_collection, CHROMA_DB_PATH)
+                    print(f"ChromaDB client and collection '{COLLECTION_NAME}' initialized.")
+                _component_timings['chromadb'] = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                print(f"Error initializing ChromaDB: {e}")
+                _chroma_client = None; _chroma_collection = None
+                return False
+
+        if _embedding_model is None:
+            try:
+                start = time.perf_counter()
+                _embedding_model = load_embedder(MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_ONNX_PATH, EMBEDDING_THREADS)
+                _component_timings['embedding_model'] = (time.perf_counter() - start) * 1000
+                print(f"Embedding model '{MODEL_NAME}' loaded ({_embedding_backend_name()}).")
+            except Exception as e:
+                print(f"Error loading embedding model: {e}")
+                _embedding_model = None
+                return False
+
+        if HYBRID_RETRIEVAL_ENABLED and _bm25_index is None:
+            start = time.perf_counter()
+            if _get_bm25_index() is not None:
+                _component_timings['bm25_index'] = (time.perf_counter() - start) * 1000
+            else:
+                print(f"No BM25 index at {BM25_INDEX_PATH}; retrieval is vector-only until load_data_to_vectordb.py builds it.")
+
+        if RERANK_ENABLED and _reranker is None:
+            _load_reranker()
+
+        if INTENT_FAST_PATH_ENABLED and INTENT_CENTROID_ENABLED and _intent_classifier is None:
+            _load_intent_classifier()
+
+        if ANSWER_CACHE_ENABLED and _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                similarity_threshold=ANSWER_CACHE_SIMILARITY,
+                near_hits=ANSWER_CACHE_NEAR_HITS_ENABLED,
+                fingerprint_fn=_collection_fingerprint,
+            )
+    return True
+
+def _load_reranker():
+    """Loads the cross-encoder; if it cannot be loaded, chunks are used in retrieval order."""
+    global _reranker
+    try:
+        start = time.perf_counter()
+        from sentence_transformers import CrossEncoder
+        _reranker = CrossEncoder(RERANK_MODEL_NAME)
+        _component_timings['reranker'] = (time.perf_counter() - start) * 1000
+        print(f"Re-ranking model '{RERANK_MODEL_NAME}' loaded.")
     except Exception as e:
-        print(f"An unexpected error occurred during AI call: {e}")
-        return "An internal error occurred with the AI. Please try again later."
+        print(f"Error loading re-ranking model: {e}. Re-ranking is disabled.")
 
+def _load_intent_classifier():
+    """Embeds the intent prototypes; if that fails, only the keyword tier of the fast-path runs."""
+    global _intent_classifier
+    try:
+        start = time.perf_counter()
+        _intent_classifier = CentroidIntentClassifier(_embedding_model.encode)
+        _component_timings['intent_classifier'] = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        print(f"Error building the intent classifier: {e}. Off-topic queries are only detected by keyword.")
 
-def get_rag_response(user_query: str) -> str:
+def warm_up_rag_components() -> bool:
     """
-    Handles all user queries by building a single, intelligent prompt that instructs
-    the LLM to prioritize local context but seamlessly fall back to general knowledge.
+    Eagerly loads every RAG component and runs one throwaway embedding (the first
+    `encode` call pays one-off setup costs), so the first chat request is fast.
     """
+    global _warmed_up
+    start = time.perf_counter()
     if not _initialize_rag_components():
-        return "Error: RAG components failed to initialize. Please check server logs."
+        return False
+    encode_start = time.perf_counter()
+    _embed_query("warm-up")
+    _component_timings['first_encode'] = (time.perf_counter() - encode_start) * 1000
+    _component_timings['total'] = (time.perf_counter() - start) * 1000
+    _warmed_up = True
+    print(f"RAG components warmed up in {_component_timings['total']:.0f} ms.")
+    return True
+
+def _embedding_backend_name():
+    """The backend actually running the embedding model, which differs from EMBEDDING_BACKEND after a fallback."""
+    if _embedding_model is None:
+        return None
+    return _embedding_model.backend if isinstance(_embedding_model, OnnxEmbedder) else 'torch'
 
+def get_rag_readiness() -> dict:
+    """Which RAG components are loaded, whether warm-up finished, and per-component load times."""
+    return {
+        'ready': _components_loaded(),
+        'warmed_up': _warmed_up,
+        'vector_backend': _retriever.name if _retriever is not None else None,
+        'embedding_backend': _embedding_backend_name(),
+        'vector_shards': len(_retriever.shards) if isinstance(_retriever, ShardedRetriever) else 1,
+        'components': {
+            'chromadb': isinstance(_retriever, (ChromaRetriever, ShardedRetriever)),
+            'vector_index': isinstance(_retriever, NumpyRetriever),
+            'embedding_model': _embedding_model is not None,
+            'answer_cache': _answer_cache is not None,
+            'bm25_index': _bm25_index is not None,
+            'reranker': _reranker is not None,
+            'intent_classifier': _intent_classifier is not None,
+        },
+        'timings_ms': {name: round(ms, 1) for name, ms in _component_timings.items()},
+    }
+
+def _get_bm25_index():
+    """
+    Returns the BM25 index, loading it on first use and reloading it after
+    load_data_to_vectordb.py rewrites it. None if no index has been built yet,
+    in which case retrieval is vector-only.
+    """
+    global _bm25_index, _bm25_index_mtime
     try:
-        # Step 1: Always retrieve context to inform the LLM.
-        query_embedding = _embedding_model.encode([user_query]).tolist()
-        results = _chroma_collection.query(
-            query_embeddings=query_embedding,
-            n_results=N_RESULTS,
-            include=['documents']
-        )
-        retrieved_docs = results['documents'][0] if results.get('documents') else []
-        context_str = "\n".join(retrieved_docs)
-        
+        mtime = os.path.getmtime(BM25_INDEX_PATH)
+    except OSError:
+        return _bm25_index
+    if mtime == _bm25_index_mtime:
+        return _bm25_index
+    with _bm25_lock:
+        if mtime != _bm25_index_mtime:
+            try:
+                _bm25_index = BM25Index.load(BM25_INDEX_PATH)
+                print(f"BM25 index loaded from {BM25_INDEX_PATH} ({len(_bm25_index)} chunks).")
+            except Exception as e:
+                print(f"Error loading BM25 index: {e}. Retrieval stays vector-only.")
+            _bm25_index_mtime = mtime
+    return _bm25_index
+
+def get_answer_cache_stats() -> dict:
+    """Hit/near-hit/miss counters of the answer cache (empty if the cache is disabled or not yet created)."""
+    return _answer_cache.stats() if _answer_cache is not None else {}
+
+class EmbeddingBatcher:
+    """
+    Micro-batches embedding requests from concurrent callers.
+
+    A background thread takes the first pending query, keeps collecting until
+    `max_batch_size` queries are waiting or `max_wait_ms` has passed, encodes the
+    batch with one `encode_fn` call and resolves each caller's Future with its row.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self._encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = queue.SimpleQueue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queues `text` for embedding; the Future resolves to its vector."""
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def encode(self, text: str):
+        """Blocking helper: embeds one query as part of whatever batch it lands in."""
+        return self.submit(text).result()
+
+    def _collect(self) -> list:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self._encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+def _get_embedding_batcher() -> EmbeddingBatcher:
+    global _embedding_batcher
+    with _embedding_batcher_lock:
+        if _embedding_batcher is None:
+            _embedding_batcher = EmbeddingBatcher(
+                _embedding_model.encode,
+                max_batch_size=EMBED_BATCH_MAX_SIZE,
+                max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+            )
+    return _embedding_batcher
+
+def _embed_query(user_query: str):
+    """Returns the embedding vector of a single query."""
+    if EMBED_BATCH_ENABLED:
+        return _get_embedding_batcher().encode(user_query)
+    return _embedding_model.encode([user_query])[0]
+
+async def _aembed_query(user_query: str):
+    """Async `_embed_query`; a batched request is awaited without holding an executor thread."""
+    if EMBED_BATCH_ENABLED:
+        return await asyncio.wrap_future(_get_embedding_batcher().submit(user_query))
+    return await asyncio.get_running_loop().run_in_executor(_get_rag_executor(), _embed_query, user_query)
+
+def _cached_answer(user_query: str, query_embedding):
+    """Returns a cached answer for the same (or, with near-hits, a near-identical) earlier query, if any."""
+    if _answer_cache is None:
+        return None
+    answer = _answer_cache.get(_normalize_query(user_query), query_embedding)
+    if answer is not None:
+        print(f"Answer cache hit for query: '{user_query}'")
+    return answer
+
+def _cache_answer(user_query: str, query_embedding, answer: str):
+    if _answer_cache is not None:
+        _answer_cache.put(_normalize_query(user_query), query_embedding, answer)
+
+def _retrieve_context(user_query: str, query_embedding) -> list[str]:
+    """
+    Fetches the chunks most relevant to the query, best first.
+    With hybrid retrieval, the closest chunks by embedding and the best BM25 matches
+    are merged by reciprocal-rank fusion; otherwise only the vector search is used.
+    """
+    return _retrieve_sources([user_query], [query_embedding])[0][1]
+
+def _retrieve_context_with_ids(user_query: str, query_embedding) -> tuple[list[str], list[str]]:
+    """`_retrieve_context` with the ids of the chunks, as the chat log records them: (ids, documents)."""
+    return _retrieve_sources([user_query], [query_embedding])[0]
+
+def _retrieve_contexts(user_queries: list[str], query_embeddings) -> list[list[str]]:
+    """
+    `_retrieve_context` for several queries with one vector lookup, one document
+    fetch and, when re-ranking, one cross-encoder call.
+    """
+    return [documents for _, documents in _retrieve_sources(user_queries, query_embeddings)]
+
+def _retrieve_sources(user_queries: list[str], query_embeddings) -> list[tuple[list[str], list[str]]]:
+    """`_retrieve_contexts` returning (chunk ids, documents) per query."""
+    reranker = _reranker if RERANK_ENABLED else None
+    n_keep = max(N_RESULTS, RERANK_CANDIDATES) if reranker is not None else N_RESULTS
+    bm25_index = _get_bm25_index() if HYBRID_RETRIEVAL_ENABLED else None
+    n_candidates = max(n_keep, HYBRID_CANDIDATES) if bm25_index is not None else n_keep
+    vector_results = _retriever.query_many(query_embeddings, n_candidates)
+    documents = {cid: doc for ids, docs in vector_results for cid, doc in zip(ids, docs)}
+
+    if bm25_index is None:
+        ranked_ids = [ids[:n_keep] for ids, _ in vector_results]
+    else:
+        ranked_ids = []
+        for user_query, (vector_ids, _) in zip(user_queries, vector_results):
+            lexical_ids = [cid for cid, _ in bm25_index.search(user_query, n_candidates)]
+            ranked_ids.append(reciprocal_rank_fusion([vector_ids, lexical_ids], k=RRF_K)[:n_keep])
+        missing_ids = list(dict.fromkeys(cid for ids in ranked_ids for cid in ids if cid not in documents))
+        if missing_ids:  # lexical-only hits: fetch their text
+            documents.update(_retriever.get_documents(missing_ids))
+
+    # Ids deleted from the knowledge base since the BM25 index was written are skipped.
+    ranked_ids = [[cid for cid in ids if cid in documents] for ids in ranked_ids]
+    candidates = [[documents[cid] for cid in ids] for ids in ranked_ids]
+    if reranker is not None:
+        with span('rerank'):
+            candidates = _rerank(reranker, user_queries, candidates)
+        reranked_ids = []
+        for ids, docs in zip(ranked_ids, candidates):
+            id_by_document = {documents[cid]: cid for cid in ids}
+            reranked_ids.append([id_by_document[doc] for doc in docs])
+        ranked_ids = reranked_ids
+
+    contexts = []
+    for user_query, ids, retrieved_docs in zip(user_queries, ranked_ids, candidates):
         if retrieved_docs:
             print(f"Retrieved {len(retrieved_docs)} documents for query: '{user_query}'")
         else:
             print(f"No relevant documents found for query: '{user_query}'. Will rely on general knowledge.")
+        contexts.append((ids, retrieved_docs))
+    return contexts
 
-        # <<< CORRECTION: The prompt is refined to be extremely direct about the fallback, preventing "I don't know" responses. >>>
-        prompt = f"""### Persona
+def _rerank(reranker, user_queries: list[str], candidates: list[list[str]]) -> list[list[str]]:
+    """
+    Scores every (query, candidate) pair with the cross-encoder in one batched
+    call and keeps each query's N_RESULTS best candidates scoring at least RERANK_MIN_SCORE.
+    """
+    pairs = [(user_query, doc) for user_query, docs in zip(user_queries, candidates) for doc in docs]
+    if not pairs:
+        return candidates
+    scores = reranker.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+    reranked, offset = [], 0
+    for docs in candidates:
+        doc_scores = scores[offset:offset + len(docs)]
+        offset += len(docs)
+        best = sorted(range(len(docs)), key=lambda index: -doc_scores[index])[:N_RESULTS]  # ties keep retrieval order
+        reranked.append([
+            docs[index] for index in best
+            if RERANK_MIN_SCORE is None or doc_scores[index] >= RERANK_MIN_SCORE
+        ])
+    return reranked
+
+# <<< CORRECTION: The prompt is refined to be extremely direct about the fallback, preventing "I don't know" responses. >>>
+# The persona and rules never change, so they are kept as one prebuilt prefix.
+PROMPT_PREFIX = """### Persona
 You are a knowledgeable, friendly, and helpful medical information assistant.
 
 ### Core Task
@@ -136,20 +750,620 @@ Your goal is to answer the user's message accurately by following these rules in
     c. **Disclaimer:** Always end any medical-related answer with this disclaimer: "Please remember, this information is for educational purposes only and is not a substitute for professional medical advice."
 
 ### Provided Medical Information
-{context_str}
+"""
+PROMPT_SUFFIX_TEMPLATE = """
 
 ### User's Message
 "{user_query}"
 
 ### Your Answer:"""
-        
-        # Step 3: Call the LLM with the single, powerful prompt
-        return _call_gemini_api(prompt)
 
+def _get_prompt_builder() -> PromptBuilder:
+    """Returns the shared prompt builder, recreating it if the budget settings changed."""
+    global _prompt_builder
+    settings = (PROMPT_CONTEXT_TOKEN_BUDGET, PROMPT_DUPLICATE_SIMILARITY)
+    if _prompt_builder is None or (_prompt_builder.context_token_budget, _prompt_builder.duplicate_similarity) != settings:
+        _prompt_builder = PromptBuilder(PROMPT_PREFIX, PROMPT_SUFFIX_TEMPLATE, *settings)
+    return _prompt_builder
+
+def _build_prompt(user_query: str, documents: list[str], history: str = "") -> str:
+    """
+    Builds the single instruction prompt sent to the LLM, with the retrieved
+    documents fitted to the context budget and the conversation history, if any.
+    """
+    return _get_prompt_builder().build(user_query, documents, history)
+
+def _parse_gemini_result(result: dict) -> str:
+    """Extracts the answer text from a generateContent response body."""
+    if result.get("candidates") and result["candidates"][0].get("content", {}).get("parts"):
+        return result["candidates"][0]["content"]["parts"][0]["text"].strip()
+    print("LLM response structure unexpected or empty:", result)
+    raise LLMCallError("I apologize, but I received an unusual response from the AI. This might be due to a content filter. Please try rephrasing.")
+
+def _get_llm_client() -> LLMClient:
+    """
+    Returns the shared LLM client, (re)creating it if the endpoint or key changed.
+    A replaced client is closed; calls still running on it may fail.
+    """
+    global _llm_client
+    client = _llm_client
+    if client is not None and (client.api_url, client.api_key) == (GEMINI_API_URL, GEMINI_API_KEY):
+        return client
+    with _llm_client_lock:
+        replaced = _llm_client
+        if replaced is None or (replaced.api_url, replaced.api_key) != (GEMINI_API_URL, GEMINI_API_KEY):
+            _llm_client = LLMClient(
+                GEMINI_API_URL, GEMINI_API_KEY,
+                pool_size=LLM_POOL_SIZE,
+                async_pool_size=ASYNC_HTTP_MAX_CONNECTIONS,
+                deadline=LLM_DEADLINE_SECONDS,
+                connect_timeout=LLM_CONNECT_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                backoff_base=LLM_BACKOFF_BASE_SECONDS,
+                backoff_max=LLM_BACKOFF_MAX_SECONDS,
+                breaker=CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SECONDS),
+            )
+            if replaced is not None:
+                replaced.close()
+        return _llm_client
+
+def close_llm_client():
+    """Closes the shared LLM client's connection pools; the next call opens new ones."""
+    global _llm_client
+    with _llm_client_lock:
+        client, _llm_client = _llm_client, None
+    if client is not None:
+        client.close()
+
+atexit.register(close_llm_client)
+
+async def aclose_llm_client():
+    """close_llm_client for the event loop that served the async calls (ASGI lifespan shutdown)."""
+    global _llm_client
+    with _llm_client_lock:
+        client, _llm_client = _llm_client, None
+    if client is not None:
+        await client.aclose()
+        client.close()
+
+def _gemini_payload(prompt_text: str) -> dict:
+    return {"contents": [{"role": "user", "parts": [{"text": prompt_text}]}]}
+
+def _llm_call_error(error: LLMClientError) -> LLMCallError:
+    """Logs an LLMClient failure and converts it to the message shown to the user."""
+    if isinstance(error, CircuitOpenError):
+        print(f"LLM call rejected: {error}")
+        return LLMCallError("The AI service is temporarily unavailable. Please try again in a moment.")
+    print(f"Error communicating with LLM API: {error}")
+    if isinstance(error, LLMHTTPError):
+        return LLMCallError("There was an issue connecting to the AI. Please check the API key and model name.")
+    return LLMCallError(f"There was an issue connecting to the AI. Error: {error}")
+
+def _call_gemini_api(prompt_text: str) -> str:
+    """Helper function to send a prompt to the Gemini API and return the response. Raises LLMCallError on failure."""
+    if not GEMINI_API_KEY:
+        raise LLMCallError("LLM API key is not configured. Please set GEMINI_API_KEY in your .env file.")
+
+    print("--- Sending request to LLM ---")
+
+    try:
+        result = _get_llm_client().generate(_gemini_payload(prompt_text))
+    except LLMClientError as e:
+        raise _llm_call_error(e)
+    except Exception as e:
+        print(f"An unexpected error occurred during AI call: {e}")
+        raise LLMCallError("An internal error occurred with the AI. Please try again later.")
+    return _parse_gemini_result(result)
+
+
+def _get_conversation_store() -> ConversationStore:
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            from django.core.cache import caches
+            _conversation_store = ConversationStore(
+                caches[CONVERSATION_CACHE], CONVERSATION_TTL_SECONDS,
+                CONVERSATION_HISTORY_TOKEN_BUDGET, CONVERSATION_SUMMARY_TOKEN_BUDGET,
+            )
+    return _conversation_store
+
+def get_conversation(conversation_id: str = None) -> Conversation:
+    """The conversation with this id, or a new one if it is unknown or has expired."""
+    return _get_conversation_store().get_or_create(conversation_id)
+
+def save_conversation(conversation: Conversation):
+    """Stores the conversation, with the turns added since it was loaded, for its next request."""
+    _get_conversation_store().save(conversation)
+
+async def aget_conversation(conversation_id: str = None) -> Conversation:
+    """Async `get_conversation`: the cache lookup runs on the RAG executor."""
+    return await asyncio.get_running_loop().run_in_executor(_get_rag_executor(), get_conversation, conversation_id)
+
+async def asave_conversation(conversation: Conversation):
+    """Async `save_conversation`."""
+    await asyncio.get_running_loop().run_in_executor(_get_rag_executor(), save_conversation, conversation)
+
+def _local_reply(user_query: str):
+    """The templated reply for chitchat and plainly off-topic messages (keyword tier), or None."""
+    if not INTENT_FAST_PATH_ENABLED:
+        return None
+    with span('intent'):
+        intent, reply = classify_message(user_query, INTENT_KEYWORD_OFF_TOPIC_ENABLED)
+    if intent == MEDICAL:
+        return None
+    INTENT_FAST_PATH.inc(intent, 'keyword')
+    note_chat(outcome='local')
+    return reply
+
+def _is_off_topic(query_embedding) -> bool:
+    """Whether the embedding tier rejects a query (always False until the classifier is built)."""
+    if not (INTENT_FAST_PATH_ENABLED and INTENT_CENTROID_ENABLED) or _intent_classifier is None:
+        return False
+    if not _intent_classifier.is_off_topic(query_embedding, INTENT_OFF_TOPIC_MARGIN):
+        return False
+    INTENT_FAST_PATH.inc(OFF_TOPIC, 'embedding')
+    note_chat(outcome='local')
+    return True
+
+def _normalize_query(user_query: str) -> str:
+    """Key under which concurrent queries are coalesced: case, spacing and trailing punctuation are ignored."""
+    return " ".join(user_query.lower().split()).rstrip("?!. ")
+
+def get_rag_response(user_query: str, conversation: Conversation = None) -> str:
+    """
+    Handles all user queries by building a single, intelligent prompt that instructs
+    the LLM to prioritize local context but seamlessly fall back to general knowledge.
+    Concurrent identical queries are coalesced into one pipeline run. With a
+    `conversation`, its history informs retrieval and the prompt, and the turn is
+    added to it.
+    """
+    if conversation is not None:
+        return _compute_rag_response(user_query, conversation)
+    if not SINGLE_FLIGHT_ENABLED:
+        return _compute_rag_response(user_query)
+    return _rag_flight.do(_normalize_query(user_query), _compute_rag_response, user_query)
+
+def _compute_rag_response(user_query: str, conversation: Conversation = None) -> str:
+    """
+    Runs the full RAG pipeline for one query. Each stage is timed (see metrics.span).
+    Messages answered by the intent fast-path are not added to the conversation.
+    """
+    reply = _local_reply(user_query)
+    if reply is not None:
+        return reply
+
+    with span('init'):
+        initialized = _initialize_rag_components()
+    if not initialized:
+        note_chat(outcome='error')
+        return "Error: RAG components failed to initialize. Please check server logs."
+
+    try:
+        # Follow-ups are searched with the conversation's topic. Answers that
+        # depend on history are neither served from nor stored in the cache.
+        history = conversation.render() if conversation is not None else ""
+        search_query = conversation.retrieval_query(user_query) if conversation is not None else user_query
+
+        # Step 1: Embed the query; repeated questions are served from the cache.
+        with span('embed'):
+            query_embedding = _embed_query(search_query)
+        if _is_off_topic(query_embedding):
+            return OFF_TOPIC_RESPONSE
+        if not history:
+            with span('cache'):
+                cached_answer = _cached_answer(user_query, query_embedding)
+            if cached_answer is not None:
+                note_chat(outcome='cached')
+                if conversation is not None:
+                    conversation.add_turn(user_query, cached_answer)
+                return cached_answer
+
+        # Step 2: Always retrieve context to inform the LLM.
+        with span('retrieve'):
+            chunk_ids, documents = _retrieve_context_with_ids(search_query, query_embedding)
+        note_chat(retrieved_ids=chunk_ids)
+
+        # Step 3: Build the single, powerful prompt
+        with span('prompt_build'):
+            prompt = _build_prompt(user_query, documents, history)
+        note_chat(prompt_tokens=estimate_tokens(prompt))
+
+        # Step 4: Call the LLM with the single, powerful prompt
+        with span('llm'):
+            answer = _call_gemini_api(prompt)
+        note_chat(outcome='answered')
+        if not history:
+            _cache_answer(user_query, query_embedding, answer)
+        if conversation is not None:
+            conversation.add_turn(user_query, answer)
+        return answer
+
+    except LLMCallError as e:
+        note_chat(outcome='llm_error')
+        return str(e)
+    except Exception as e:
+        note_chat(outcome='error')
+        print(f"An unexpected error occurred during RAG process: {e}")
+        return "An internal error occurred. Please try again later."
+
+# --- Admission Control ---
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Returns the shared admission controller, recreating it if its settings changed.
+    Callers release the slot on the instance they acquired it from.
+    """
+    global _admission_controller
+    settings = (ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS, ADMISSION_RETRY_AFTER_SECONDS)
+    controller = _admission_controller
+    if controller is None or (controller.max_concurrent, controller.max_queue, controller.queue_timeout, controller.retry_after) != settings:
+        controller = _admission_controller = AdmissionController(*settings)
+    return controller
+
+def get_rate_limiter():
+    """Returns the shared per-client rate limiter, or None if rate limiting is off."""
+    global _rate_limiter
+    if not RATE_LIMIT_PER_MINUTE:
+        return None
+    if _rate_limiter is None or (_rate_limiter.rate_per_minute, _rate_limiter.burst) != (RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST):
+        _rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+    return _rate_limiter
+
+REGISTRY.register(Gauge(
+    "medical_assistant_admission_in_flight", "Chat API requests holding an admission slot.",
+    lambda: _admission_controller.in_flight if _admission_controller is not None else 0,
+))
+REGISTRY.register(Gauge(
+    "medical_assistant_admission_queued", "Chat API requests waiting for an admission slot.",
+    lambda: _admission_controller.queued if _admission_controller is not None else 0,
+))
+
+# --- Async Pipeline ---
+# Used by the async `chat_api` view under ASGI: the LLM round-trip is awaited on a
+# pooled connection instead of blocking a worker, while the CPU/disk-bound
+# embedding and ChromaDB work runs on a small bounded thread pool.
+_rag_executor = None
+
+def _get_rag_executor() -> ThreadPoolExecutor:
+    """Returns the shared executor for blocking RAG work, creating it on first use."""
+    global _rag_executor
+    if _rag_executor is None:
+        _rag_executor = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+    return _rag_executor
+
+async def _acall_gemini_api(prompt_text: str) -> str:
+    """Async counterpart of `_call_gemini_api` using the client's pooled aiohttp session. Raises LLMCallError on failure."""
+    if not GEMINI_API_KEY:
+        raise LLMCallError("LLM API key is not configured. Please set GEMINI_API_KEY in your .env file.")
+
+    print("--- Sending async request to LLM ---")
+
+    try:
+        result = await _get_llm_client().agenerate(_gemini_payload(prompt_text))
+    except LLMClientError as e:
+        raise _llm_call_error(e)
+    except Exception as e:
+        print(f"An unexpected error occurred during AI call: {e}")
+        raise LLMCallError("An internal error occurred with the AI. Please try again later.")
+    return _parse_gemini_result(result)
+
+async def aget_rag_response(user_query: str, conversation: Conversation = None) -> str:
+    """
+    Async version of `get_rag_response`. Blocking retrieval runs on the bounded
+    RAG executor and the LLM call is awaited, so a single process can hold many
+    in-flight requests. Concurrent identical queries on the loop are coalesced.
+    """
+    if conversation is not None:
+        return await _acompute_rag_response(user_query, conversation)
+    if not SINGLE_FLIGHT_ENABLED:
+        return await _acompute_rag_response(user_query)
+    return await _async_rag_flight.do(_normalize_query(user_query), _acompute_rag_response, user_query)
+
+async def _acompute_rag_response(user_query: str, conversation: Conversation = None) -> str:
+    """
+    Runs the full async RAG pipeline for one query. Stages handed to the executor
+    are timed from the event loop, so their time includes waiting for a thread.
+    """
+    reply = _local_reply(user_query)
+    if reply is not None:
+        return reply
+
+    loop = asyncio.get_running_loop()
+    executor = _get_rag_executor()
+
+    with span('init'):
+        initialized = await loop.run_in_executor(executor, _initialize_rag_components)
+    if not initialized:
+        note_chat(outcome='error')
+        return "Error: RAG components failed to initialize. Please check server logs."
+
+    try:
+        history = conversation.render() if conversation is not None else ""
+        search_query = conversation.retrieval_query(user_query) if conversation is not None else user_query
+        with span('embed'):
+            query_embedding = await _aembed_query(search_query)
+        if _is_off_topic(query_embedding):
+            return OFF_TOPIC_RESPONSE
+        if not history:
+            with span('cache'):
+                cached_answer = _cached_answer(user_query, query_embedding)
+            if cached_answer is not None:
+                note_chat(outcome='cached')
+                if conversation is not None:
+                    conversation.add_turn(user_query, cached_answer)
+                return cached_answer
+
+        with span('retrieve'):
+            chunk_ids, documents = await loop.run_in_executor(executor, _retrieve_context_with_ids, search_query, query_embedding)
+        note_chat(retrieved_ids=chunk_ids)
+        with span('prompt_build'):
+            prompt = _build_prompt(user_query, documents, history)
+        note_chat(prompt_tokens=estimate_tokens(prompt))
+        with span('llm'):
+            answer = await _acall_gemini_api(prompt)
+        note_chat(outcome='answered')
+        if not history:
+            _cache_answer(user_query, query_embedding, answer)
+        if conversation is not None:
+            conversation.add_turn(user_query, answer)
+        return answer
+
+    except LLMCallError as e:
+        note_chat(outcome='llm_error')
+        return str(e)
     except Exception as e:
+        note_chat(outcome='error')
         print(f"An unexpected error occurred during RAG process: {e}")
         return "An internal error occurred. Please try again later."
 
+# --- Batch API ---
+# For offline jobs (FAQ triage, regression suites): the messages of a batch are
+# embedded with one model call and retrieved with one multi-query vector lookup,
+# then their LLM calls run concurrently, at most BATCH_LLM_CONCURRENCY at a time.
+
+class _BatchItem:
+    """
+    One distinct message of a batch and its outcome: an answer or a user-safe
+    error, and how it was reached (a ChatLog outcome: 'local', 'cached',
+    'answered', 'llm_error', 'error' or 'invalid').
+    """
+
+    def __init__(self, user_query: str):
+        self.user_query = user_query
+        self.query_embedding = None
+        self.prompt = None  # set when the answer has to come from the LLM
+        self.answer = None
+        self.error = None
+        self.outcome = None
+
+    def result(self) -> dict:
+        return {'response': self.answer} if self.error is None else {'error': self.error}
+
+def _note_batch(user_queries: list[str], items: list[_BatchItem] = None, positions: list[int] = None, outcome: str = 'error'):
+    """
+    Notes one chat log entry per message of a batch: its item's outcome, or
+    'coalesced' for a repeat of an earlier message that shared its answer.
+    Without items (the batch failed as a whole), every message gets `outcome`.
+    """
+    if items is None:
+        note_chat(batch=[{'query': user_query, 'outcome': outcome} for user_query in user_queries])
+        return
+    seen, batch = set(), []
+    for user_query, position in zip(user_queries, positions):
+        item = items[position]
+        repeat = position in seen and item.error is None
+        seen.add(position)
+        batch.append({'query': user_query, 'outcome': 'coalesced' if repeat else item.outcome})
+    note_chat(batch=batch)
+
+def _prepare_batch(user_queries: list[str]) -> tuple[list[_BatchItem], list[int]]:
+    """
+    Runs everything before the LLM for a batch. Messages that are equal after
+    `_normalize_query` share one item; fast-path and cached answers are filled in
+    and prompts are built for the rest. Returns the items and, per message, its item's index.
+    """
+    items, positions, index_by_key = [], [], {}
+    for user_query in user_queries:
+        user_query = user_query.strip()
+        key = _normalize_query(user_query) if user_query else None
+        if key is not None and key in index_by_key:
+            positions.append(index_by_key[key])
+            continue
+        item = _BatchItem(user_query)
+        if key is None:
+            item.error, item.outcome = "Please enter a message.", 'invalid'
+        else:
+            item.answer = _local_reply(user_query)
+            if item.answer is not None:
+                item.outcome = 'local'
+            index_by_key[key] = len(items)
+        positions.append(len(items))
+        items.append(item)
+
+    pending = [item for item in items if item.error is None and item.answer is None]
+    if pending:
+        for item, query_embedding in zip(pending, _embedding_model.encode([item.user_query for item in pending])):
+            item.query_embedding = query_embedding
+            if _is_off_topic(query_embedding):
+                item.answer, item.outcome = OFF_TOPIC_RESPONSE, 'local'
+            else:
+                item.answer = _cached_answer(item.user_query, query_embedding)
+                if item.answer is not None:
+                    item.outcome = 'cached'
+        pending = [item for item in pending if item.answer is None]
+    if pending:
+        contexts = _retrieve_contexts([item.user_query for item in pending], [item.query_embedding for item in pending])
+        for item, documents in zip(pending, contexts):
+            item.prompt = _build_prompt(item.user_query, documents)
+    return items, positions
+
+def _answer_batch_item(item: _BatchItem):
+    """Sync LLM step for one batch item; a failure is recorded on the item."""
+    try:
+        item.answer = _call_gemini_api(item.prompt)
+        item.outcome = 'answered'
+        _cache_answer(item.user_query, item.query_embedding, item.answer)
+    except LLMCallError as e:
+        item.error, item.outcome = str(e), 'llm_error'
+    except Exception as e:
+        print(f"An unexpected error occurred during batch RAG process: {e}")
+        item.error, item.outcome = "An internal error occurred. Please try again later.", 'error'
+
+async def _aanswer_batch_item(item: _BatchItem, semaphore: asyncio.Semaphore):
+    """Async counterpart of `_answer_batch_item`, holding `semaphore` for the LLM call."""
+    async with semaphore:
+        try:
+            item.answer = await _acall_gemini_api(item.prompt)
+            item.outcome = 'answered'
+            _cache_answer(item.user_query, item.query_embedding, item.answer)
+        except LLMCallError as e:
+            item.error, item.outcome = str(e), 'llm_error'
+        except Exception as e:
+            print(f"An unexpected error occurred during batch RAG process: {e}")
+            item.error, item.outcome = "An internal error occurred. Please try again later.", 'error'
+
+def get_rag_responses(user_queries: list[str], concurrency: int = None) -> list[dict]:
+    """
+    Answers a list of messages in one pass. Returns one dict per message, in
+    order: {'response': answer} or {'error': message}, so one failed LLM call does
+    not fail the batch. At most `concurrency` (default BATCH_LLM_CONCURRENCY)
+    LLM calls run at a time. The outcome of each message is noted for the chat log.
+    """
+    if not _initialize_rag_components():
+        _note_batch(user_queries)
+        return [{'error': "Error: RAG components failed to initialize. Please check server logs."} for _ in user_queries]
+    try:
+        with span('batch_prepare'):
+            items, positions = _prepare_batch(user_queries)
+    except Exception as e:
+        print(f"An unexpected error occurred during batch RAG process: {e}")
+        _note_batch(user_queries)
+        return [{'error': "An internal error occurred. Please try again later."} for _ in user_queries]
+
+    pending = [item for item in items if item.prompt is not None]
+    if pending:
+        with span('batch_llm'), ThreadPoolExecutor(max_workers=concurrency or BATCH_LLM_CONCURRENCY, thread_name_prefix="rag-batch") as pool:
+            list(pool.map(_answer_batch_item, pending))
+    _note_batch(user_queries, items, positions)
+    return [items[position].result() for position in positions]
+
+async def aget_rag_responses(user_queries: list[str], concurrency: int = None) -> list[dict]:
+    """Async version of `get_rag_responses`: the LLM calls are awaited on the pooled aiohttp session."""
+    loop = asyncio.get_running_loop()
+    executor = _get_rag_executor()
+
+    if not await loop.run_in_executor(executor, _initialize_rag_components):
+        _note_batch(user_queries)
+        return [{'error': "Error: RAG components failed to initialize. Please check server logs."} for _ in user_queries]
+    try:
+        with span('batch_prepare'):
+            items, positions = await loop.run_in_executor(executor, _prepare_batch, user_queries)
+    except Exception as e:
+        print(f"An unexpected error occurred during batch RAG process: {e}")
+        _note_batch(user_queries)
+        return [{'error': "An internal error occurred. Please try again later."} for _ in user_queries]
+
+    semaphore = asyncio.Semaphore(concurrency or BATCH_LLM_CONCURRENCY)
+    with span('batch_llm'):
+        await asyncio.gather(*(_aanswer_batch_item(item, semaphore) for item in items if item.prompt is not None))
+    _note_batch(user_queries, items, positions)
+    return [items[position].result() for position in positions]
+
+# --- Streaming ---
+def _extract_chunk_text(result: dict) -> str:
+    """Returns the text carried by one streamed response chunk ('' if none)."""
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+async def _astream_gemini_api(prompt_text: str):
+    """Async generator yielding answer text from the LLM as it is generated. Raises LLMCallError on failure."""
+    if not GEMINI_API_KEY:
+        raise LLMCallError("LLM API key is not configured. Please set GEMINI_API_KEY in your .env file.")
+
+    print("--- Sending streaming request to LLM ---")
+
+    try:
+        # aclosing: a client that stops reading closes the LLM stream at once.
+        async with aclosing(_get_llm_client().astream(_gemini_payload(prompt_text))) as stream:
+            async for chunk in stream:
+                text = _extract_chunk_text(chunk)
+                if text:
+                    yield text
+    except LLMClientError as e:
+        raise _llm_call_error(e)
+    except Exception as e:
+        print(f"An unexpected error occurred during AI call: {e}")
+        raise LLMCallError("An internal error occurred with the AI. Please try again later.")
+
+async def astream_rag_response(user_query: str, conversation: Conversation = None):
+    """
+    Streaming version of `aget_rag_response`: retrieval happens up front, then
+    answer text is yielded chunk by chunk as the LLM produces it. The turn is
+    added to the `conversation` once the answer is complete.
+    """
+    reply = _local_reply(user_query)
+    if reply is not None:
+        yield reply
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = _get_rag_executor()
+
+    with span('init'):
+        initialized = await loop.run_in_executor(executor, _initialize_rag_components)
+    if not initialized:
+        note_chat(outcome='error')
+        yield "Error: RAG components failed to initialize. Please check server logs."
+        return
+
+    try:
+        history = conversation.render() if conversation is not None else ""
+        search_query = conversation.retrieval_query(user_query) if conversation is not None else user_query
+        with span('embed'):
+            query_embedding = await _aembed_query(search_query)
+        if _is_off_topic(query_embedding):
+            yield OFF_TOPIC_RESPONSE
+            return
+        if not history:
+            with span('cache'):
+                cached_answer = _cached_answer(user_query, query_embedding)
+            if cached_answer is not None:
+                note_chat(outcome='cached')
+                if conversation is not None:
+                    conversation.add_turn(user_query, cached_answer)
+                yield cached_answer
+                return
+        with span('retrieve'):
+            chunk_ids, documents = await loop.run_in_executor(executor, _retrieve_context_with_ids, search_query, query_embedding)
+        note_chat(retrieved_ids=chunk_ids)
+        with span('prompt_build'):
+            prompt = _build_prompt(user_query, documents, history)
+        note_chat(prompt_tokens=estimate_tokens(prompt))
+    except Exception as e:
+        note_chat(outcome='error')
+        print(f"An unexpected error occurred during RAG process: {e}")
+        yield "An internal error occurred. Please try again later."
+        return
+
+    chunks = []
+    try:
+        async for text in _astream_gemini_api(prompt):
+            chunks.append(text)
+            yield text
+    except LLMCallError as e:
+        note_chat(outcome='llm_error')
+        yield str(e)
+        return
+    note_chat(outcome='answered')
+    answer = "".join(chunks)
+    if not history:
+        _cache_answer(user_query, query_embedding, answer)
+    if conversation is not None:
+        conversation.add_turn(user_query, answer)
+
 # Example usage (for testing this module directly)
 if __name__ == "__main__":
     print("Testing RAG module directly. This version ensures seamless fallback without 'I don't know' messages.")
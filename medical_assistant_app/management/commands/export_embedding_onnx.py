@@ -0,0 +1,61 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Short, query-like inputs checked next to the knowledge-base chunks.
+CHECK_QUERIES = [
+    "hi",
+    "What are the symptoms of a common cold?",
+    "ICD-10 E11.9",
+    "Can I take ibuprofen with high blood pressure?",
+    "metformin side effects",
+]
+
+
+class Command(BaseCommand):
+    help = ("Exports the embedding model to ONNX (float32 and int8) for EMBEDDING_BACKEND=onnx / onnx-int8, "
+            "from the locally cached model, and checks both against the PyTorch embeddings.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help="Model name or local directory (default: MODEL_NAME).")
+        parser.add_argument('--output', help="Export directory (default: EMBEDDING_ONNX_PATH).")
+        parser.add_argument('--data-file', default='medical_data.txt', help="Chunks used for the correctness check.")
+        parser.add_argument('--check-chunks', type=int, default=200, help="Number of chunks checked.")
+        parser.add_argument('--opset', type=int, default=17)
+
+    def handle(self, *args, **options):
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')  # never reach for the network, the cache must do
+        from medical_assistant_app import llm_rag
+        from medical_assistant_app.onnx_embedder import MIN_COSINE, export_onnx_model
+
+        model_name = options['model'] or llm_rag.MODEL_NAME
+        output_dir = options['output'] or llm_rag.EMBEDDING_ONNX_PATH
+        sentences = list(CHECK_QUERIES)
+        if os.path.exists(options['data_file']):
+            with open(options['data_file'], encoding='utf-8') as f:
+                chunks = [chunk.strip() for chunk in f.read().split('\n\n') if chunk.strip()]
+            sentences += chunks[:options['check_chunks']]
+
+        self.stdout.write(f"Exporting '{model_name}' to {output_dir}...")
+        try:
+            config = export_onnx_model(model_name, output_dir, sentences, options['opset'])
+        except OSError as e:
+            raise CommandError(f"Could not load '{model_name}' from the local cache ({e}). Load it once with network "
+                               f"access (e.g. python load_data_to_vectordb.py) or pass a model directory to --model.")
+
+        self.stdout.write(f"Exported in {config['export_seconds']:.1f} s; lowest cosine similarity to PyTorch "
+                          f"over {len(sentences)} sentences:")
+        failed = []
+        for backend, cosine in config['checks'].items():
+            ok = cosine >= MIN_COSINE[backend]
+            style = self.style.SUCCESS if ok else self.style.ERROR
+            self.stdout.write(style(f"  {backend:<10} {cosine:.6f} (minimum {MIN_COSINE[backend]})"))
+            if not ok:
+                failed.append(backend)
+        if not config['installed']:
+            raise CommandError(f"Both exports drift too far from PyTorch; the export was discarded and {output_dir} "
+                               f"is unchanged.")
+        self.stdout.write(f"Installed in {output_dir}.")
+        if failed:
+            raise CommandError(f"EMBEDDING_BACKEND={' or '.join(failed)} would drift too far from PyTorch, so the app "
+                               f"refuses it and uses PyTorch instead.")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Loads the RAG components (vector index, embedding model, BM25 index) and reports the cold-start time of each."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        from medical_assistant_app import llm_rag
+        import_ms = (time.perf_counter() - start) * 1000
+
+        if not llm_rag.warm_up_rag_components():
+            raise CommandError("RAG components failed to initialize. See the output above.")
+
+        timings = llm_rag.get_rag_readiness()['timings_ms']
+        self.stdout.write("Cold-start breakdown:")
+        self.stdout.write(f"  {'imports':<16} {import_ms:>9.1f} ms")
+        for name in ('vector_index', 'chromadb', 'embedding_model', 'bm25_index', 'first_encode'):
+            if name in timings:
+                self.stdout.write(f"  {name:<16} {timings[name]:>9.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"  {'total':<16} {import_ms + timings['total']:>9.1f} ms"))
@@ -0,0 +1,205 @@
+# medical_assistant_app/metrics.py
+
+import bisect
+import contextvars
+import math
+import threading
+import time
+
+# Upper bounds in seconds; fine at the low end for the embedding and retrieval
+# stages, wide at the top for LLM calls.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_string(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    A Prometheus histogram, one series per combination of label values.
+
+    `observe` takes a lock, a bisect and two additions, so it is cheap enough for
+    every stage of every request. Bucket counts are stored per bucket and made
+    cumulative only when rendered.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        """The histogram in the Prometheus text exposition format."""
+        with self._lock:
+            snapshot = {label_values: list(series) for label_values, series in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_string(self.label_names, label_values, le)} {cumulative}")
+            labels = _label_string(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter, one series per combination of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._series.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in snapshot:
+            lines.append(f"{self.name}{_label_string(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    """A Prometheus gauge whose value is read from `read_fn` each time /metrics is rendered."""
+
+    def __init__(self, name: str, help_text: str, read_fn):
+        self.name = name
+        self.help_text = help_text
+        self.read_fn = read_fn
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.read_fn()}"]
+
+
+class Registry:
+    """The metrics served on /metrics: anything with a `render()` returning exposition lines."""
+
+    def __init__(self):
+        self._collectors = []
+
+    def register(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        return "\n".join(line for collector in self._collectors for line in collector.render()) + "\n"
+
+
+REGISTRY = Registry()
+RAG_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "medical_assistant_rag_stage_seconds", "Time spent in each stage of the RAG pipeline.", ("stage",),
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "medical_assistant_http_request_seconds", "Time to build the response of each API view.", ("view", "status"),
+))
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    "medical_assistant_admission_decisions_total",
+    "Chat API requests by view and admission outcome (admitted, queue_full, queue_timeout, rate_limited).",
+    ("view", "outcome"),
+))
+ADMISSION_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "medical_assistant_admission_queue_wait_seconds", "Time admitted chat API requests waited for a slot.", ("view",),
+))
+INTENT_FAST_PATH = REGISTRY.register(Counter(
+    "medical_assistant_intent_fast_path_total",
+    "Messages answered locally, without retrieval or an LLM call, by intent (greeting, off_topic) and tier (keyword, embedding).",
+    ("intent", "tier"),
+))
+
+# Stage durations of the request being served, for its Server-Timing header.
+# Tasks started by the request (e.g. a single-flight leader) copy the context, so
+# they add to the same dict; work handed to executor threads does not.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> dict:
+    """Starts collecting stage durations for the current request; returns the dict they go into."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def request_timings() -> dict:
+    """The stage durations collected so far for the current request (None outside a timed request)."""
+    return _request_timings.get()
+
+
+# What the pipeline did for the chat being served (outcome, retrieved chunk ids,
+# prompt size), for its chat log record. Shared the same way as the timings.
+_chat_record = contextvars.ContextVar("chat_record", default=None)
+
+
+def start_chat_record() -> dict:
+    """Starts the chat log record of the current request; returns the dict the pipeline's notes go into."""
+    record = {}
+    _chat_record.set(record)
+    return record
+
+
+def note_chat(**fields):
+    """Adds `fields` to the current request's chat log record; a no-op outside a logged request."""
+    record = _chat_record.get()
+    if record is not None:
+        record.update(fields)
+
+
+class span:
+    """
+    Context manager timing the enclosed block as one `stage`, including when it
+    raises. A plain class rather than a generator-based context manager, which
+    would double the cost of every span.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        RAG_STAGE_SECONDS.observe(elapsed, self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def server_timing_header(timings: dict) -> str:
+    """Formats stage durations (seconds) as a Server-Timing header value, in milliseconds."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
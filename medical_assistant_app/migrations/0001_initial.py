@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('view', models.CharField(max_length=32)),
+                ('query', models.TextField(blank=True)),
+                ('conversation_id', models.CharField(blank=True, max_length=64)),
+                ('outcome', models.CharField(choices=[('answered', 'Answered by the LLM'), ('cached', 'Served from the answer cache'), ('local', 'Answered locally by the intent fast-path'), ('coalesced', 'Shared the answer of an identical concurrent request'), ('llm_error', 'The LLM call failed'), ('error', 'Internal error'), ('invalid', 'Invalid request'), ('rate_limited', 'Over the per-client rate limit'), ('rejected', 'Rejected by admission control'), ('disconnected', 'Client left before the answer was complete')], max_length=16)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('retrieved_ids', models.JSONField(blank=True, default=list)),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('stage_ms', models.JSONField(blank=True, default=dict)),
+                ('total_ms', models.FloatField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    def run(apps, schema_editor):
+        # The journal mode is stored in the database file, so it is set once here
+        # rather than by every connection (see settings.DATABASES).
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={mode}')
+    return run
+
+
+class Migration(migrations.Migration):
+
+    # SQLite cannot change the journal mode inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('medical_assistant_app', '0002_conversation_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
@@ -1,3 +1,37 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class ChatLog(models.Model):
+    """
+    One chat answered (or refused) by the API, for compliance and capacity
+    planning. Rows are written in batches by the write-behind logger in
+    chat_log.py, so they appear up to CHAT_LOG_FLUSH_INTERVAL_SECONDS after the
+    request finished.
+    """
+
+    class Outcome(models.TextChoices):
+        ANSWERED = 'answered', 'Answered by the LLM'
+        CACHED = 'cached', 'Served from the answer cache'
+        LOCAL = 'local', 'Answered locally by the intent fast-path'
+        COALESCED = 'coalesced', 'Shared the answer of an identical concurrent request'
+        LLM_ERROR = 'llm_error', 'The LLM call failed'
+        ERROR = 'error', 'Internal error'
+        INVALID = 'invalid', 'Invalid request'
+        RATE_LIMITED = 'rate_limited', 'Over the per-client rate limit'
+        REJECTED = 'rejected', 'Rejected by admission control'
+        DISCONNECTED = 'disconnected', 'Client left before the answer was complete'
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    view = models.CharField(max_length=32)
+    query = models.TextField(blank=True)
+    conversation_id = models.CharField(max_length=64, blank=True)
+    outcome = models.CharField(max_length=16, choices=Outcome.choices)
+    status_code = models.PositiveSmallIntegerField()
+    retrieved_ids = models.JSONField(default=list, blank=True)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    stage_ms = models.JSONField(default=dict, blank=True)
+    total_ms = models.FloatField()
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.view} {self.outcome}"
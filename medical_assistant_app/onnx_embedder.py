@@ -0,0 +1,238 @@
+# medical_assistant_app/onnx_embedder.py
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+# Files of an export directory, written by `export_onnx_model`.
+CONFIG_FILE = "embedder_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+# Lowest cosine similarity to the PyTorch embeddings an export must keep on every check sentence.
+MIN_COSINE = {"onnx": 0.9999, "onnx-int8": 0.98}
+
+
+def _pooled(hidden: np.ndarray, attention_mask: np.ndarray, normalize: bool) -> np.ndarray:
+    """Mean of the token embeddings over the attention mask, optionally L2-normalized."""
+    mask = attention_mask[..., None].astype(np.float32)
+    embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+    return embeddings.astype(np.float32)
+
+
+class OnnxEmbedder:
+    """
+    Runs an exported sentence-transformers model on ONNX Runtime: the model's own
+    tokenizer (via `tokenizers`), then mean pooling and normalization in NumPy, as
+    the PyTorch pipeline does. Neither torch nor sentence_transformers is imported.
+    `encode` takes the arguments the app and load_data_to_vectordb.py pass to
+    `SentenceTransformer.encode`, and returns float32 NumPy arrays.
+    """
+
+    def __init__(self, model_dir: str, backend: str = "onnx-int8", threads: int = 0):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if backend not in MODEL_FILES:
+            raise ValueError(f"Unknown ONNX embedding backend '{backend}' (expected one of {', '.join(MODEL_FILES)}).")
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.backend = backend
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, MODEL_FILES[backend]), options, providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = None,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(sentences), self.config["dimension"]), dtype=np.float32)
+        # Batching sentences of similar length keeps padding, and so wasted compute, low.
+        order = sorted(range(len(sentences)), key=lambda index: -len(sentences[index]))
+        normalize = self.config["normalize"] or normalize_embeddings
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([sentences[index] for index in batch])
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self._input_names})[0]
+            embeddings[batch] = _pooled(hidden, inputs["attention_mask"], normalize)
+        return embeddings[0] if single else embeddings
+
+
+def _passed_check(config: dict, backend: str) -> bool:
+    """Whether the export's recorded check for `backend` reached MIN_COSINE."""
+    cosine = config.get("checks", {}).get(backend)
+    return cosine is not None and cosine >= MIN_COSINE[backend]
+
+
+def load_embedder(model_name: str, backend: str = "torch", onnx_path: str = None, threads: int = 0):
+    """
+    The embedding model for `backend`: a SentenceTransformer for 'torch', an
+    OnnxEmbedder for 'onnx' / 'onnx-int8'. Falls back to PyTorch (with a message)
+    if the export at `onnx_path` is missing, cannot be loaded, or did not pass
+    its correctness check (MIN_COSINE) when it was exported.
+    """
+    if backend != "torch":
+        try:
+            embedder = OnnxEmbedder(onnx_path, backend, threads)
+            if not _passed_check(embedder.config, backend):
+                cosine = embedder.config.get("checks", {}).get(backend)
+                print(f"The ONNX export at {onnx_path} failed its check for '{backend}' (lowest cosine similarity "
+                      f"to PyTorch {cosine}, minimum {MIN_COSINE[backend]}). Using PyTorch.")
+            else:
+                if embedder.config["model"] != model_name:
+                    print(f"Note: the ONNX export at {onnx_path} is of '{embedder.config['model']}', not '{model_name}'.")
+                return embedder
+        except FileNotFoundError as e:
+            print(f"ONNX embedding model file {e.filename} not found; using PyTorch until "
+                  f"`python manage.py export_embedding_onnx` writes it.")
+        except Exception as e:
+            print(f"Error loading the ONNX embedding model: {e}. Using PyTorch.")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def export_fingerprint(onnx_path: str, backend: str):
+    """
+    Identifies the ONNX export `load_embedder` serves for `backend`: a hash of its
+    model file, tokenizer and settings (not of when or how fast it was exported),
+    so a new export of another model or by another exporter gets a new one. None
+    if there is no export that passed its check, i.e. `load_embedder` would use
+    PyTorch.
+    """
+    try:
+        with open(os.path.join(onnx_path, CONFIG_FILE), encoding="utf-8") as f:
+            config = json.load(f)
+        if not _passed_check(config, backend):
+            return None
+        digest = hashlib.sha256(json.dumps(
+            {key: value for key, value in config.items() if key != "export_seconds"}, sort_keys=True,
+        ).encode("utf-8"))
+        for name in (TOKENIZER_FILE, MODEL_FILES[backend]):
+            with open(os.path.join(onnx_path, name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    except (OSError, ValueError):
+        return None
+    return digest.hexdigest()[:32]
+
+
+def min_cosine_similarity(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """The lowest row-wise cosine similarity between two embedding matrices."""
+    reference = reference / np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    candidate = candidate / np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    return float((reference * candidate).sum(axis=1).min())
+
+
+def export_onnx_model(model_name: str, output_dir: str, check_sentences: list[str], opset: int = 17) -> dict:
+    """
+    Exports the transformer of a locally cached sentence-transformers model to
+    ONNX, with an int8 dynamically quantized copy, plus its tokenizer and pooling
+    settings. Works offline: the model is only looked up in the local cache (or
+    `model_name` is a directory). Both exports are checked against the PyTorch
+    embeddings of `check_sentences`; returns the config, whose 'checks' hold the
+    lowest cosine similarity per backend. The export is written to a temporary
+    directory and replaces `output_dir` only if at least one backend passes
+    (`load_embedder` refuses the other), so a bad export never replaces a good
+    one; 'installed' says whether it did. Needs torch, onnx and onnxruntime.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu", local_files_only=True)
+    transformer, *rest = list(model)
+    pooling = next((module.get_config_dict() for module in rest if type(module).__name__ == "Pooling"), {})
+    if pooling.get("pooling_mode", "mean" if pooling.get("pooling_mode_mean_tokens") else None) != "mean":
+        raise ValueError(f"Only mean pooling is supported; '{model_name}' uses {pooling or 'none'}.")
+    tokenizer = transformer.tokenizer
+
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    # Models without segment embeddings (e.g. MPNet) take no token_type_ids.
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    # Exported next to `output_dir`, and moved into place once checked.
+    final_dir = os.path.abspath(output_dir)
+    os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+    output_dir = tempfile.mkdtemp(prefix=".onnx-export-", dir=os.path.dirname(final_dir))
+    try:
+        started = time.perf_counter()
+        axes = {0: "batch", 1: "sequence"}
+        torch.onnx.export(
+            _TokenEmbeddings(transformer.auto_model).eval(),
+            tuple(sample[name] for name in input_names),
+            os.path.join(output_dir, MODEL_FILES["onnx"]),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{name: axes for name in input_names}, "last_hidden_state": axes},
+            opset_version=opset,
+            dynamo=False,
+        )
+        quantize_dynamic(
+            os.path.join(output_dir, MODEL_FILES["onnx"]), os.path.join(output_dir, MODEL_FILES["onnx-int8"]),
+            per_channel=True, weight_type=QuantType.QInt8,
+        )
+        tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+        config = {
+            "model": model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+            "normalize": any(type(module).__name__ == "Normalize" for module in rest),
+            "export_seconds": round(time.perf_counter() - started, 1),
+        }
+        with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+
+        reference = model.encode(check_sentences, convert_to_numpy=True)
+        config["checks"] = {
+            backend: min_cosine_similarity(reference, OnnxEmbedder(output_dir, backend).encode(check_sentences))
+            for backend in MODEL_FILES
+        }
+        config["installed"] = any(config["checks"][backend] >= MIN_COSINE[backend] for backend in MODEL_FILES)
+        with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        if config["installed"]:
+            _replace_dir(output_dir, final_dir)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return config
+
+
+def _replace_dir(source: str, target: str):
+    """Moves directory `source` to `target`, replacing any directory there."""
+    previous = None
+    if os.path.exists(target):
+        previous = tempfile.mkdtemp(prefix=".onnx-previous-", dir=os.path.dirname(target))
+        os.rename(target, os.path.join(previous, "export"))
+    os.rename(source, target)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
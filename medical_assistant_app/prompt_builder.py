@@ -0,0 +1,106 @@
+# medical_assistant_app/prompt_builder.py
+
+import re
+
+from .bm25 import tokenize
+
+# Gemini's rule of thumb for English text: one token is about four characters.
+CHARS_PER_TOKEN = 4
+# A sentence ends at ".", "!" or "?" followed by whitespace, so codes such as "E11.9" stay whole.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# Placed between the context and the user's message when the chat has history.
+HISTORY_HEADER = "\n\n### Conversation So Far\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count of `text`; cheap enough to call on every chunk of every request."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def trim_to_relevant_sentences(document: str, query_terms: set, max_tokens: int) -> str:
+    """
+    Shortens `document` to at most `max_tokens` by keeping the sentences that
+    share the most terms with the query (earlier sentences win ties), in their
+    original order. If not even the best sentence fits, it is cut at a word boundary.
+    """
+    if max_tokens <= 0:
+        return ""
+    sentences = split_sentences(document)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda index: (-len(query_terms.intersection(tokenize(sentences[index]))), index),
+    )
+    kept, used = [], 0
+    for index in ranked:
+        cost = estimate_tokens(sentences[index]) + 1  # the joining space
+        if used + cost <= max_tokens:
+            kept.append(index)
+            used += cost
+    if not kept and ranked:
+        return sentences[ranked[0]][:max_tokens * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+    return " ".join(sentences[index] for index in sorted(kept))
+
+
+class PromptBuilder:
+    """
+    Assembles `prefix + context + suffix` prompts. The static prefix (persona and
+    rules) is built once and reused; per request only the retrieved context and
+    the suffix, formatted with `user_query`, are added.
+
+    The context is fitted to `context_token_budget` estimated tokens (0 = no
+    limit). Chunks whose word sets overlap a better-ranked chunk's by at least
+    `duplicate_similarity` (Jaccard) are dropped. Each remaining chunk, best
+    first, gets an equal share of the budget left; chunks longer than their
+    share keep their sentences most relevant to the query, and whatever a short
+    chunk does not use is left for the chunks after it.
+    """
+
+    def __init__(self, prefix: str, suffix_template: str, context_token_budget: int = 0,
+                 duplicate_similarity: float = 1.0):
+        self.prefix = prefix
+        self.suffix_template = suffix_template
+        self.context_token_budget = context_token_budget
+        self.duplicate_similarity = duplicate_similarity
+
+    def drop_duplicates(self, documents: list[str]) -> list[str]:
+        """`documents` without the near-duplicates of earlier ones."""
+        if self.duplicate_similarity > 1:  # no pair of word sets is more than identical
+            return list(documents)
+        kept, kept_terms = [], []
+        for document in documents:
+            terms = set(tokenize(document))
+            if any(_jaccard(terms, other) >= self.duplicate_similarity for other in kept_terms):
+                continue
+            kept.append(document)
+            kept_terms.append(terms)
+        return kept
+
+    def select_context(self, user_query: str, documents: list[str]) -> list[str]:
+        """The (possibly trimmed) documents to show the LLM, best first."""
+        documents = self.drop_duplicates(documents)
+        if not self.context_token_budget:
+            return documents
+        query_terms = set(tokenize(user_query))
+        remaining = self.context_token_budget
+        selected = []
+        for position, document in enumerate(documents):
+            share = max(remaining, 0) // (len(documents) - position)
+            if estimate_tokens(document) > share:
+                document = trim_to_relevant_sentences(document, query_terms, share)
+            if document:
+                selected.append(document)
+                remaining -= estimate_tokens(document) + 1  # the joining newline
+        return selected
+
+    def build(self, user_query: str, documents: list[str], history: str = "") -> str:
+        context_str = "\n".join(self.select_context(user_query, documents))
+        history_str = HISTORY_HEADER + history if history else ""
+        return self.prefix + context_str + history_str + self.suffix_template.format(user_query=user_query)
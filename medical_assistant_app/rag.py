@@ -0,0 +1,16 @@
+# medical_assistant_app/rag.py
+
+# Lazy facade over llm_rag for request-time callers (views). `rag.<name>` is
+# llm_rag's attribute of that name, looked up on each access, so the RAG stack
+# (aiohttp, requests, numpy, and on first retrieval ChromaDB and torch) is only
+# imported by processes that actually answer a chat, not by everything that
+# loads the URLconf (manage.py check/migrate, admin-only requests). Read
+# settings as `rag.SETTING` at call time rather than importing them by value.
+
+import importlib
+
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return getattr(importlib.import_module('.llm_rag', __package__), name)
@@ -0,0 +1,47 @@
+# medical_assistant_app/sharding.py
+
+import hashlib
+import heapq
+import os
+from itertools import islice
+
+# 'collections': the shards are collections of one ChromaDB directory (one SQLite
+# file). 'directories': each shard is a ChromaDB directory of its own, so shards
+# share no database and can be written and searched fully in parallel.
+SHARD_LAYOUTS = ('collections', 'directories')
+
+
+def shard_of(chunk_id: str, shards: int) -> int:
+    """
+    The shard holding `chunk_id`. Stable across processes and runs (unlike
+    `hash`), so the ingest script and the app agree on where every chunk lives.
+    """
+    if shards <= 1:
+        return 0
+    digest = hashlib.blake2b(chunk_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def shard_locations(db_path: str, collection_name: str, shards: int, layout: str = 'collections') -> list[tuple[str, str]]:
+    """
+    (ChromaDB directory, collection name) of each shard. A single shard is the
+    unsharded knowledge base itself, so VECTOR_SHARDS=1 keeps the existing layout.
+    """
+    if shards <= 1:
+        return [(db_path, collection_name)]
+    if layout == 'collections':
+        return [(db_path, f'{collection_name}_shard{index}') for index in range(shards)]
+    if layout == 'directories':
+        return [(os.path.join(db_path, f'shard_{index}'), collection_name) for index in range(shards)]
+    raise ValueError(f"Unknown shard layout '{layout}' (expected one of {', '.join(SHARD_LAYOUTS)}).")
+
+
+def merge_nearest(shard_results, n_results: int) -> tuple[list[str], list[str]]:
+    """
+    Merges per-shard (ids, documents, distances) results, each sorted nearest
+    first, into the overall `n_results` nearest: a heap-based k-way merge that
+    stops as soon as `n_results` are out, instead of sorting every candidate.
+    """
+    streams = [zip(distances, ids, documents) for ids, documents, distances in shard_results]
+    nearest = list(islice(heapq.merge(*streams, key=lambda hit: hit[0]), n_results))
+    return [cid for _, cid, _ in nearest], [doc for _, _, doc in nearest]
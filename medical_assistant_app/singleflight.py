@@ -0,0 +1,77 @@
+# medical_assistant_app/singleflight.py
+
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls (threads): while a call for `key` is in flight,
+    further callers with the same key wait for it and receive its result (or
+    its exception) instead of running `fn` again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0  # callers served by another caller's computation
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight. The shared computation runs as its own
+    task and every caller awaits it through `asyncio.shield`, so a cancelled
+    caller (e.g. a disconnected client) does not cancel it for the others.
+    Calls are only shared between callers on the same event loop.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.shared = 0
+
+    async def do(self, key, coro_fn, *args):
+        loop_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(loop_key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(coro_fn(*args))
+            self._tasks[loop_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(loop_key, None))
+        return await asyncio.shield(task)
@@ -5,6 +5,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const userInput = document.getElementById('user-input');
     const sendButton = document.getElementById('send-button');
     const loadingIndicator = document.getElementById('loading-indicator');
+    // Server-side conversation this chat belongs to; '' asks the server to start one
+    let conversationId = '';
 
     // Function to append a message to the chat box
     function appendMessage(sender, message) {
@@ -19,6 +21,56 @@ document.addEventListener('DOMContentLoaded', () => {
         chatBox.appendChild(messageDiv);
         // Scroll to the bottom of the chat box
         chatBox.scrollTop = chatBox.scrollHeight;
+        return messageDiv.querySelector('p');
+    }
+
+    // Function to render Server-Sent Events from /api/chat/stream/ as they arrive;
+    // resolves to the data of the final `done` event
+    async function readAnswerStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let messageParagraph = null;
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE frames are separated by a blank line
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+
+                let eventName = 'message';
+                let dataLine = '';
+                for (const line of frame.split('\n')) {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLine += line.slice(5).trim();
+                    }
+                }
+                const data = dataLine ? JSON.parse(dataLine) : {};
+
+                if (eventName === 'done') {
+                    return data;
+                }
+                if (eventName === 'error') {
+                    throw new Error(data.response || 'Something went wrong on the server.');
+                }
+                if (messageParagraph === null) {
+                    // First token: swap the loading indicator for the answer bubble
+                    loadingIndicator.classList.add('hidden');
+                    messageParagraph = appendMessage('assistant', '');
+                }
+                messageParagraph.textContent += data.token;
+                chatBox.scrollTop = chatBox.scrollHeight;
+            }
+        }
     }
 
     // Function to send message to the backend
@@ -36,13 +88,14 @@ document.addEventListener('DOMContentLoaded', () => {
         sendButton.disabled = true; // Disable send button while loading
 
         try {
-            const response = await fetch('/api/chat/', {
+            const response = await fetch('/api/chat/stream/', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                     'X-CSRFToken': csrftoken // Get CSRF token from the global variable set in index.html
                 },
-                body: JSON.stringify({ message: message })
+                body: JSON.stringify({ message: message, conversation_id: conversationId })
             });
 
             if (!response.ok) {
@@ -56,8 +109,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.response || 'Something went wrong on the server.');
             }
 
-            const data = await response.json();
-            appendMessage('assistant', data.response);
+            const done = await readAnswerStream(response);
+            if (done && done.conversation_id) {
+                conversationId = done.conversation_id;
+            }
         } catch (error) {
             console.error('Error sending message:', error);
             // Display an error message to the user
@@ -1,3 +1,1699 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase
+
+from . import admission, answer_cache, lifecycle, onnx_embedder, views
+from .admission import AdmissionController, AdmissionRejected, RateLimiter
+from .answer_cache import SemanticAnswerCache
+from .bm25 import BM25Builder, BM25Index, reciprocal_rank_fusion
+from .chat_log import WriteBehindLog
+from .conversation import Conversation, ConversationStore, is_follow_up
+from .intent import GREETING, MEDICAL, OFF_TOPIC, OFF_TOPIC_RESPONSE, classify_message
+from .llm_client import CircuitBreaker, CircuitOpenError, LLMClient, LLMHTTPError, LLMResponseError, LLMTimeoutError
+from .metrics import HTTP_REQUEST_SECONDS, span, start_chat_record
+from .models import ChatLog
+from .prompt_builder import PromptBuilder, estimate_tokens, trim_to_relevant_sentences
+from .sharding import merge_nearest, shard_locations, shard_of
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .vector_index import NumpyVectorIndex, quantize_int8, write_vector_index
+
+
+class _FakeResponse:
+    """Stands in for an aiohttp response returned by LLMClient._apost."""
+
+    def __init__(self, body: str = '{}', lines=()):
+        self.body = body
+        self.content = _Lines(lines)
+        self.released = False
+
+    async def text(self):
+        return self.body
+
+    def release(self):
+        self.released = True
+
+
+class _Lines:
+    def __init__(self, lines):
+        self.lines = list(lines)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for line in self.lines:
+            yield line
+
+
+def _open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertIs(breaker.admit(), True)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(breaker.admit())
+
+    def test_trial_outcome_closes_or_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.admit()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertIs(breaker.admit(), False)
+
+        breaker.record_failure()
+        breaker.admit()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_released_trial_lets_the_next_call_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertIs(breaker.admit(), True)
+        breaker.release_trial()
+        self.assertIs(breaker.admit(), True)
+
+    def test_release_after_an_outcome_is_a_no_op(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        breaker.release_trial()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+
+class LLMClientTrialTests(SimpleTestCase):
+    """A half-open trial call must free the breaker whichever way it ends."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.client = LLMClient("http://llm.invalid/v1/models/m:generateContent", "key", breaker=self.breaker)
+        _open_breaker(self.breaker)
+
+    def test_cancelled_trial_is_released(self):
+        started = asyncio.Event()
+
+        async def hang(*args, **kwargs):
+            started.set()
+            await asyncio.Event().wait()
+
+        async def scenario():
+            task = asyncio.ensure_future(self.client.agenerate({}))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(self.client, '_apost', hang):
+            asyncio.run(scenario())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIs(self.breaker.admit(), True)
+
+    def test_invalid_json_counts_as_a_failure(self):
+        async def respond(*args, **kwargs):
+            return _FakeResponse('<html>not json</html>')
+
+        with mock.patch.object(self.client, '_apost', respond):
+            with self.assertRaises(LLMResponseError):
+                asyncio.run(self.client.agenerate({}))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_abandoned_stream_is_released(self):
+        response = _FakeResponse(lines=[b'data: {"n": 1}\n', b'data: {"n": 2}\n'])
+
+        async def respond(*args, **kwargs):
+            return response
+
+        async def scenario():
+            stream = self.client.astream({})
+            self.assertEqual(await stream.__anext__(), {"n": 1})
+            await stream.aclose()
+
+        with mock.patch.object(self.client, '_apost', respond):
+            asyncio.run(scenario())
+        self.assertTrue(response.released)
+        self.assertIs(self.breaker.admit(), True)
+
+    def test_open_breaker_rejects_without_a_call(self):
+        self.breaker.reset_timeout = 60
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(self.client.agenerate({}))
+
+
+class _LLMServer:
+    """A local HTTP server answering every POST with `respond(handler)`; counts the requests."""
+
+    def __init__(self, respond):
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.requests += 1
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                respond(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/models/m:generateContent"
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _send(handler, status: int, body: bytes = b"{}"):
+    handler.send_response(status)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class LLMClientRetryTests(SimpleTestCase):
+    def make_client(self, respond, breaker, **kwargs):
+        server = _LLMServer(respond)
+        self.addCleanup(server.close)
+        client = LLMClient(server.url, "key", breaker=breaker, backoff_base=0, **kwargs)
+        self.addCleanup(client.close)
+        return server, client
+
+    def test_retried_call_counts_as_one_failure(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        server, client = self.make_client(lambda handler: _send(handler, 503), breaker, max_retries=2)
+        with self.assertRaises(LLMHTTPError):
+            client.generate({})
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        with self.assertRaises(LLMHTTPError):
+            client.generate({})
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_retry_stops_without_taking_the_trial_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+
+        def fail_while_others_open_the_breaker(handler):
+            breaker.record_failure()  # another call failed for good meanwhile
+            _send(handler, 503)
+
+        server, client = self.make_client(fail_while_others_open_the_breaker, breaker, max_retries=3)
+        with self.assertRaises(CircuitOpenError):
+            client.generate({})
+        self.assertEqual(server.requests, 1)
+        self.assertIs(breaker.admit(), True)  # the next call still gets the trial
+
+    def test_trial_call_keeps_retrying(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        _open_breaker(breaker)
+        responses = [503, 200]
+        server, client = self.make_client(lambda handler: _send(handler, responses.pop(0)), breaker, max_retries=3)
+        self.assertEqual(client.generate({}), {})
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_deadline_bounds_a_slowly_sent_body(self):
+        def trickle(handler):
+            handler.send_response(200)
+            handler.send_header("Content-Length", "100")
+            handler.end_headers()
+            try:
+                for _ in range(100):
+                    handler.wfile.write(b" ")
+                    handler.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:  # the client gave up
+                pass
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        _, client = self.make_client(trickle, breaker, deadline=0.5)
+        start = time.monotonic()
+        with self.assertRaises(LLMTimeoutError):
+            client.generate({})
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_body_read_in_chunks_is_decoded(self):
+        body = json.dumps({"text": "x" * 100_000}).encode()
+        _, client = self.make_client(lambda handler: _send(handler, 200, body), CircuitBreaker())
+        self.assertEqual(client.generate({}), {"text": "x" * 100_000})
+
+
+class LLMClientCloseTests(SimpleTestCase):
+    """close() reaches the aiohttp pool through the event loop that opened it."""
+
+    def test_close_on_the_session_loop(self):
+        async def open_then_close():
+            client = LLMClient("http://127.0.0.1:1/v1:generateContent", "key")
+            session = client._get_async_session()
+            client.close()
+            await client._closing
+            return session
+
+        self.assertTrue(asyncio.run(open_then_close()).closed)
+
+    def test_close_from_another_thread(self):
+        client = LLMClient("http://127.0.0.1:1/v1:generateContent", "key")
+        opened, closed = threading.Event(), threading.Event()
+
+        async def serve():
+            session = client._get_async_session()
+            opened.set()
+            while not session.closed:
+                await asyncio.sleep(0.01)
+            closed.set()
+
+        thread = threading.Thread(target=asyncio.run, args=(serve(),))
+        thread.start()
+        self.assertTrue(opened.wait(5))
+        client.close()
+        self.assertTrue(closed.wait(5))
+        thread.join(5)
+
+    def test_close_skips_the_pool_of_a_stopped_loop(self):
+        client = LLMClient("http://127.0.0.1:1/v1:generateContent", "key")
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def open_session():
+            return client._get_async_session()
+
+        session = loop.run_until_complete(open_session())
+        client.close()
+        self.assertFalse(session.closed)
+        loop.run_until_complete(session.close())
+
+
+class SharedLLMClientTests(SimpleTestCase):
+    def setUp(self):
+        from . import llm_rag
+        self.llm_rag = llm_rag
+        patcher = mock.patch.object(llm_rag, "_llm_client", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: llm_rag._llm_client and llm_rag._llm_client.close())
+
+    def test_changed_key_closes_the_replaced_client(self):
+        with mock.patch.object(self.llm_rag, "GEMINI_API_KEY", "old"):
+            old = self.llm_rag._get_llm_client()
+            self.assertIs(self.llm_rag._get_llm_client(), old)
+        with mock.patch.object(old, "close") as close:
+            with mock.patch.object(self.llm_rag, "GEMINI_API_KEY", "new"):
+                new = self.llm_rag._get_llm_client()
+        close.assert_called_once_with()
+        self.assertIsNot(new, old)
+        self.assertEqual(new.api_key, "new")
+
+    def test_close_llm_client_closes_and_forgets_it(self):
+        client = self.llm_rag._get_llm_client()
+        with mock.patch.object(client, "close") as close:
+            self.llm_rag.close_llm_client()
+        close.assert_called_once_with()
+        self.assertIsNone(self.llm_rag._llm_client)
+        self.llm_rag.close_llm_client()  # nothing left to close
+
+    def test_aclose_llm_client_closes_the_async_pool(self):
+        async def use_then_close():
+            client = self.llm_rag._get_llm_client()
+            session = client._get_async_session()
+            await self.llm_rag.aclose_llm_client()
+            return session
+
+        self.assertTrue(asyncio.run(use_then_close()).closed)
+        self.assertIsNone(self.llm_rag._llm_client)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_grants_slots_then_queues_then_rejects(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+        async def scenario():
+            self.assertEqual(await controller.acquire(), 0.0)
+            waiting = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(controller.queued, 1)
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            self.assertEqual(rejected.exception.reason, "queue_full")
+            controller.release()
+            await waiting
+            self.assertEqual((controller.in_flight, controller.queued), (1, 0))
+            controller.release()
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_queue_timeout_rejects_and_leaves_the_queue(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+
+        async def scenario():
+            await controller.acquire()
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            self.assertEqual(rejected.exception.reason, "queue_timeout")
+
+        asyncio.run(scenario())
+        self.assertEqual((controller.in_flight, controller.queued), (1, 0))
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+        async def scenario():
+            await controller.acquire()
+            waiting = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(controller.queued, 0)
+            controller.release()
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.in_flight, 0)
+
+    def _grant_as_the_wait_ends(self, controller, error):
+        """Replaces asyncio.wait_for: the slot is handed over just before the wait fails with `error`."""
+        async def wait_for(future, timeout):
+            controller.release()
+            raise error
+        return mock.patch("medical_assistant_app.admission.asyncio.wait_for", wait_for)
+
+    def test_slot_granted_as_the_wait_times_out_is_kept(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+        async def scenario():
+            await controller.acquire()
+            with self._grant_as_the_wait_ends(controller, asyncio.TimeoutError()):
+                await controller.acquire()
+
+        asyncio.run(scenario())
+        self.assertEqual((controller.in_flight, controller.queued), (1, 0))
+
+    def test_slot_granted_to_a_cancelled_waiter_is_passed_on(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+        async def scenario():
+            await controller.acquire()
+            with self._grant_as_the_wait_ends(controller, asyncio.CancelledError()):
+                with self.assertRaises(asyncio.CancelledError):
+                    await controller.acquire()
+
+        asyncio.run(scenario())
+        self.assertEqual((controller.in_flight, controller.queued), (0, 0))
+
+    def test_zero_max_concurrent_admits_everything(self):
+        controller = AdmissionController(max_concurrent=0)
+
+        async def scenario():
+            for _ in range(100):
+                await controller.acquire()
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.in_flight, 0)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch.object(answer_cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_the_same_key_hits_by_default(self):
+        cache = SemanticAnswerCache(max_entries=4)
+        cache.put("what is a cold", [1, 0, 0], "answer")
+        self.assertEqual(cache.get("what is a cold", [1, 0, 0]), "answer")
+        self.assertIsNone(cache.get("what's a cold", [1, 0, 0]))  # same embedding, other words
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["near_hits"], stats["misses"]), (1, 0, 1))
+
+    def test_near_hits_when_enabled(self):
+        cache = SemanticAnswerCache(max_entries=4, similarity_threshold=0.9, near_hits=True)
+        cache.put("what is a cold", [1, 0, 0], "answer")
+        self.assertEqual(cache.get("what's a cold", [1, 0.1, 0]), "answer")
+        self.assertIsNone(cache.get("what is the flu", [1, 1, 0]))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["near_hits"], stats["misses"]), (0, 1, 1))
+
+    def test_near_hit_with_other_numbers_or_negations_is_refused(self):
+        cache = SemanticAnswerCache(max_entries=4, similarity_threshold=0.9, near_hits=True)
+        cache.put("how is type 1 diabetes treated", [1, 0, 0], "type 1 answer")
+        cache.put("can i take ibuprofen with food", [0, 1, 0], "with food answer")
+        self.assertIsNone(cache.get("how is type 2 diabetes treated", [1, 0, 0]))
+        self.assertIsNone(cache.get("can i take ibuprofen without food", [0, 1, 0]))
+        self.assertEqual(cache.stats()["near_hits_refused"], 2)
+
+    def test_labeled_pairs_only_paraphrases_pass_the_guard(self):
+        """At similarity 1, the guard still refuses pairs that differ in a number or negation, and no paraphrase."""
+        for pair in _cache_pairs():
+            cache = SemanticAnswerCache(max_entries=1, near_hits=True)
+            cache.put(pair["a"].lower(), [1, 0, 0], "answer")
+            served = cache.get(pair["b"].lower(), [1, 0, 0]) is not None
+            if pair["paraphrase"]:
+                self.assertTrue(served, pair)
+            elif answer_cache._qualifiers(pair["a"]) != answer_cache._qualifiers(pair["b"]):
+                self.assertFalse(served, pair)
+
+    def test_labeled_pairs_at_the_default_threshold(self):
+        """With the real embedding model: near-hits never serve one of the different questions."""
+        from huggingface_hub import try_to_load_from_cache
+
+        from .llm_rag import ANSWER_CACHE_SIMILARITY, MODEL_NAME, _normalize_query
+        if not isinstance(try_to_load_from_cache(f"sentence-transformers/{MODEL_NAME}", "config.json"), str):
+            self.skipTest(f"{MODEL_NAME} is not in the local Hugging Face cache")
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(MODEL_NAME, local_files_only=True)
+        for pair in _cache_pairs():
+            if pair["paraphrase"]:
+                continue
+            cache = SemanticAnswerCache(max_entries=1, similarity_threshold=ANSWER_CACHE_SIMILARITY, near_hits=True)
+            a, b = model.encode([pair["a"], pair["b"]])
+            cache.put(_normalize_query(pair["a"]), a, "answer")
+            self.assertIsNone(cache.get(_normalize_query(pair["b"]), b), pair)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = SemanticAnswerCache(max_entries=4, ttl_seconds=60)
+        cache.put("a", [1, 0, 0], "answer")
+        self.clock.now += 60
+        self.assertEqual(cache.get("a", [1, 0, 0]), "answer")
+        self.clock.now += 1
+        self.assertIsNone(cache.get("a", [1, 0, 0]))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SemanticAnswerCache(max_entries=2, near_hits=True)
+        cache.put("a", [1, 0, 0], "a")
+        cache.put("b", [0, 1, 0], "b")
+        cache.get("a", [1, 0, 0])
+        cache.put("c", [0, 0, 1], "c")
+        self.assertIsNone(cache.get("b", [0, 1, 0]))
+        self.assertEqual(cache.get("a", [1, 0, 0]), "a")
+        self.assertEqual(cache.get("c", [0, 0, 1]), "c")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_knowledge_base_change_invalidates_everything(self):
+        fingerprints = ["v1"]
+        cache = SemanticAnswerCache(max_entries=4, fingerprint_fn=lambda: fingerprints[-1],
+                                    fingerprint_check_seconds=5)
+        cache.put("a", [1, 0, 0], "old answer")
+        fingerprints.append("v2")
+        self.assertEqual(cache.get("a", [1, 0, 0]), "old answer")  # not checked again yet
+        self.clock.now += 5
+        self.assertIsNone(cache.get("a", [1, 0, 0]))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        cache.put("a", [1, 0, 0], "new answer")
+        self.assertEqual(cache.get("a", [1, 0, 0]), "new answer")
+
+
+def _cache_pairs() -> list[dict]:
+    """Labeled question pairs shared with benchmarks/bench_answer_cache.py --pairs."""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "data", "cache_pairs.jsonl")
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the other thread")
+        time.sleep(0.001)
+
+
+def _call_outcome(call, *args):
+    """The result of `call(*args)`, or the exception it raised."""
+    try:
+        return call(*args)
+    except Exception as e:
+        return e
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _run_together(self, flight, fn):
+        """A leader call that blocks until a second caller has joined it, then runs `fn`; both outcomes."""
+        release = threading.Event()
+        outcomes = [None, None]
+
+        def leader():
+            def blocking():
+                release.wait(5)
+                return fn()
+            outcomes[0] = _call_outcome(flight.do, "key", blocking)
+
+        def follower():
+            outcomes[1] = _call_outcome(flight.do, "key", fn)
+
+        threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+        threads[0].start()
+        _wait_until(lambda: "key" in flight._calls)
+        threads[1].start()
+        _wait_until(lambda: flight.shared == 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight, calls = SingleFlight(), []
+        outcomes = self._run_together(flight, lambda: calls.append(1) or "result")
+        self.assertEqual(outcomes, ["result", "result"])
+        self.assertEqual((len(calls), flight.shared), (1, 1))
+
+    def test_error_is_raised_to_every_caller(self):
+        error = ValueError("boom")
+
+        def fail():
+            raise error
+
+        outcomes = self._run_together(SingleFlight(), fail)
+        self.assertEqual(outcomes, [error, error])
+
+    def test_finished_call_is_not_reused(self):
+        flight, calls = SingleFlight(), []
+        flight.do("key", calls.append, 1)
+        flight.do("key", calls.append, 2)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(flight.shared, 0)
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight, calls = AsyncSingleFlight(), []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0)
+            return value * 2
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", compute, 21) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(scenario()), [42, 42, 42])
+        self.assertEqual((calls, flight.shared), ([21], 2))
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        flight = AsyncSingleFlight()
+
+        async def scenario():
+            gate = asyncio.Event()
+
+            async def compute():
+                await gate.wait()
+                return "result"
+
+            first = asyncio.ensure_future(flight.do("key", compute))
+            second = asyncio.ensure_future(flight.do("key", compute))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            gate.set()
+            self.assertEqual(await second, "result")
+            self.assertTrue(first.cancelled())
+            self.assertEqual(flight._tasks, {})
+
+        asyncio.run(scenario())
+
+
+class BM25Tests(SimpleTestCase):
+    DOCS = {
+        "flu": "Influenza (flu) causes fever, cough and muscle aches.",
+        "diabetes": "Type 2 diabetes is coded E11.9; metformin is a common first treatment.",
+        "migraine": "Migraine headaches can be triggered by stress and lack of sleep.",
+        "fever": "A fever above 39 C in adults warrants a call to a doctor.",
+        "sleep": "Adults need seven to nine hours of sleep.",
+    }
+
+    def setUp(self):
+        builder = BM25Builder()
+        for doc_id, text in self.DOCS.items():
+            builder.add(doc_id, text)
+        self.index = builder.build()
+
+    def test_search_ranks_matching_chunks_first(self):
+        results = self.index.search("What does E11.9 mean?", k=3)
+        self.assertEqual([doc_id for doc_id, _ in results], ["diabetes"])
+        ids = [doc_id for doc_id, _ in self.index.search("fever and cough", k=5)]
+        self.assertEqual(ids, ["flu", "fever"])
+
+    def test_search_respects_k_and_orders_by_score(self):
+        results = self.index.search("fever cough sleep stress", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertGreaterEqual(results[0][1], results[1][1])
+
+    def test_search_without_known_terms_is_empty(self):
+        self.assertEqual(self.index.search("what is the", k=5), [])
+        self.assertEqual(self.index.search("astronomy", k=5), [])
+        self.assertEqual(self.index.search("fever", k=0), [])
+
+    def test_equal_scores_go_to_the_earlier_chunk(self):
+        builder = BM25Builder()
+        for doc_id in ("a", "b", "c", "d"):
+            builder.add(doc_id, "rash" if doc_id in ("b", "c") else "other words")
+        self.assertEqual([doc_id for doc_id, _ in builder.build().search("rash", k=1)], ["b"])
+
+    def test_save_and_load_round_trip(self):
+        path = os.path.join(tempfile.mkdtemp(), "bm25.npz")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.index.save(path)
+        loaded = BM25Index.load(path)
+        self.assertEqual(loaded.search("fever and cough", k=5), self.index.search("fever and cough", k=5))
+
+    def test_reciprocal_rank_fusion(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]]), ["b", "a", "c"])
+        self.assertEqual(reciprocal_rank_fusion([["a"], ["b"]]), ["a", "b"])  # tie: first seen
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["c"]], k=0), ["a", "c", "b"])
+        self.assertEqual(reciprocal_rank_fusion([]), [])
+
+
+class _HashEmbedder:
+    """Deterministic stand-in for the sentence-transformers model used by the ingest script."""
+
+    def encode(self, docs, batch_size=None, convert_to_numpy=True):
+        return np.array([
+            np.frombuffer(hashlib.sha256(doc.encode("utf-8")).digest()[:32], dtype=np.uint8) / 255.0
+            for doc in docs
+        ], dtype=np.float32)
+
+
+class IncrementalIngestTests(SimpleTestCase):
+    def setUp(self):
+        import load_data_to_vectordb as ingest
+
+        self.ingest = ingest
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.data_file = os.path.join(directory, "medical_data.txt")
+        chroma_path = os.path.join(directory, "chroma_db")
+        patches = {
+            "DATA_FILE": self.data_file,
+            "CHROMA_DB_PATH": chroma_path,
+            "MANIFEST_PATH": os.path.join(chroma_path, "ingest_manifest.json"),
+            "BM25_INDEX_PATH": os.path.join(chroma_path, "bm25_index.npz"),
+            "VECTOR_INDEX_PATH": os.path.join(chroma_path, "vector_index"),
+            "VECTOR_SHARDS": 1,
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(ingest, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        embedder = _HashEmbedder()
+        self.encoded = []
+        original_encode = embedder.encode
+        embedder.encode = lambda docs, **kwargs: self.encoded.extend(docs) or original_encode(docs, **kwargs)
+        patcher = mock.patch.object(ingest, "load_embedder", lambda *args: embedder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest_paragraphs(self, *paragraphs, backend="torch"):
+        with open(self.data_file, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs) + "\n")
+        self.encoded.clear()
+        with mock.patch("builtins.print"):
+            self.ingest.main(shards=1, backend=backend)
+        collection = self.ingest.open_shards(1)[0]
+        return set(collection.get(include=[])["ids"])
+
+    def test_chunk_id_ignores_whitespace_only(self):
+        ingest = self.ingest
+        self.assertEqual(ingest.chunk_id("Fever  and\ncough."), ingest.chunk_id(" Fever and cough. "))
+        self.assertNotEqual(ingest.chunk_id("Fever and cough."), ingest.chunk_id("Fever and a cough."))
+        self.assertRegex(ingest.chunk_id("Fever."), r"^chunk_[0-9a-f]{32}$")
+
+    def test_only_added_and_edited_chunks_are_embedded(self):
+        chunk_id = self.ingest.chunk_id
+        first = ("Flu causes fever.", "Diabetes raises blood sugar.", "Migraines cause headaches.")
+        self.assertEqual(self.ingest_paragraphs(*first), {chunk_id(text) for text in first})
+        self.assertEqual(sorted(self.encoded), sorted(first))
+
+        second = ("Flu causes fever and cough.", "Migraines cause headaches.", "Sleep seven to nine hours.")
+        self.assertEqual(self.ingest_paragraphs(*second), {chunk_id(text) for text in second})
+        self.assertEqual(sorted(self.encoded), ["Flu causes fever and cough.", "Sleep seven to nine hours."])
+
+        self.assertEqual(self.ingest_paragraphs(*second), {chunk_id(text) for text in second})
+        self.assertEqual(self.encoded, [])
+
+    def test_new_backend_or_export_embeds_everything_again(self):
+        paragraphs = ("Flu causes fever.", "Migraines cause headaches.")
+        fingerprint = mock.Mock(return_value="export-1")
+        patcher = mock.patch.object(self.ingest, "export_fingerprint", fingerprint)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.ingest_paragraphs(*paragraphs)
+        self.ingest_paragraphs(*paragraphs, backend="onnx")
+        self.assertEqual(sorted(self.encoded), sorted(paragraphs))
+        self.ingest_paragraphs(*paragraphs, backend="onnx")
+        self.assertEqual(self.encoded, [])
+
+        fingerprint.return_value = "export-2"  # re-exported
+        self.ingest_paragraphs(*paragraphs, backend="onnx")
+        self.assertEqual(sorted(self.encoded), sorted(paragraphs))
+
+        fingerprint.return_value = None  # no usable export: load_embedder serves PyTorch
+        self.ingest_paragraphs(*paragraphs, backend="onnx")
+        self.assertEqual(sorted(self.encoded), sorted(paragraphs))
+        self.ingest_paragraphs(*paragraphs)
+        self.assertEqual(self.encoded, [])
+
+    def test_manifest_without_the_backend_counts_as_pytorch(self):
+        paragraphs = ("Flu causes fever.",)
+        self.ingest_paragraphs(*paragraphs)
+        with open(self.ingest.MANIFEST_PATH, encoding="utf-8") as f:
+            manifest = json.load(f)
+        for key in ("embedding_backend", "onnx_export"):
+            del manifest[key]
+        with open(self.ingest.MANIFEST_PATH, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        self.ingest_paragraphs(*paragraphs)
+        self.assertEqual(self.encoded, [])
+
+
+class ClassifyMessageTests(SimpleTestCase):
+    def test_chitchat_is_answered_locally(self):
+        for message in ("Hi!", "hey, how's it going?", "Thanks so much", "ok bye"):
+            intent, reply = classify_message(message)
+            self.assertEqual(intent, GREETING, message)
+            self.assertTrue(reply)
+
+    def test_chitchat_with_a_question_goes_to_the_pipeline(self):
+        for message in ("hi, I have a rash", "thanks, and what about fever?"):
+            self.assertEqual(classify_message(message), (MEDICAL, ""), message)
+
+    def test_off_topic_requests_only_when_enabled(self):
+        self.assertEqual(classify_message("Tell me a joke"), (MEDICAL, ""))
+        self.assertEqual(classify_message("Tell me a joke", off_topic=True), (OFF_TOPIC, OFF_TOPIC_RESPONSE))
+        self.assertEqual(classify_message("What's the capital of France?", off_topic=True)[0], OFF_TOPIC)
+
+    def test_repeated_phrases_do_not_backtrack(self):
+        for message in ("bye " * 34 + "rash?", "bye " * 14 + "x", "hi " * 19 + "?", "thank you " * 500):
+            start = time.perf_counter()
+            classify_message(message, off_topic=True)
+            self.assertLess(time.perf_counter() - start, 0.05, message[:20])
+        self.assertEqual(classify_message("bye bye, take care")[0], GREETING)
+        self.assertEqual(classify_message("hi, how are you doing today?")[0], GREETING)
+
+    def test_medical_questions_are_never_rejected(self):
+        for message in ("Does the weather affect arthritis?", "Give me a recipe for a low sodium dinner",
+                        "Tell me a joke about the flu", "What is the capital of health insurance?"):
+            self.assertEqual(classify_message(message, off_topic=True), (MEDICAL, ""), message)
+
+
+class WriteBehindLogTests(SimpleTestCase):
+    def _log(self, **kwargs):
+        batches = []
+        log = WriteBehindLog(batches.append, **{"flush_interval": 60, **kwargs})
+        self.addCleanup(log.close)
+        return log, batches
+
+    def test_flush_writes_everything_submitted(self):
+        log, batches = self._log(batch_size=2)
+        for record in range(5):
+            self.assertTrue(log.submit(record))
+        self.assertTrue(log.flush(timeout=5))
+        self.assertEqual([record for batch in batches for record in batch], [0, 1, 2, 3, 4])
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual((log.written, log.pending()), (5, 0))
+
+    def test_close_writes_the_buffer_and_refuses_new_records(self):
+        log, batches = self._log()
+        log.submit("a")
+        log.submit("b")
+        self.assertTrue(log.close(timeout=5))
+        self.assertEqual(batches, [["a", "b"]])
+        self.assertFalse(log.submit("c"))
+        self.assertEqual(log.dropped, 1)
+
+    def test_records_beyond_max_pending_are_dropped(self):
+        log, _ = self._log(max_pending=2)
+        with log._cond:  # the writer cannot take records while the lock is held
+            results = [log.submit(record) for record in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(log.dropped, 1)
+
+    def test_failed_batch_is_counted_and_dropped(self):
+        def fail(batch):
+            raise RuntimeError("database is locked")
+
+        log = WriteBehindLog(fail, flush_interval=60)
+        self.addCleanup(log.close)
+        log.submit("a")
+        with mock.patch("builtins.print"):
+            self.assertTrue(log.flush(timeout=5))
+        self.assertEqual((log.failed, log.written, log.pending()), (1, 0, 0))
+
+
+class RAGWarmUpTests(SimpleTestCase):
+    """The warm-up starts once per serving process, never when the application is imported."""
+
+    def setUp(self):
+        self.started = []
+        for patcher in (
+            mock.patch.object(lifecycle, "_warmup_pid", None),
+            mock.patch.object(lifecycle.threading.Thread, "start", lambda thread: self.started.append(thread.name)),
+            mock.patch.dict(os.environ, {"RAG_WARMUP_ON_STARTUP": "1"}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_asgi_lifespan_startup_starts_it(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        application = lifecycle.asgi_application(mock.AsyncMock())
+        self.assertEqual(self.started, [])
+        asyncio.run(application({"type": "lifespan"}, receive, send))
+        self.assertEqual(self.started, ["rag-warmup"])
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+    def test_asgi_lifespan_shutdown_closes_the_llm_client(self):
+        from . import llm_rag
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        application = lifecycle.asgi_application(mock.AsyncMock())
+        with mock.patch.object(llm_rag, "aclose_llm_client") as aclose:
+            asyncio.run(application({"type": "lifespan"}, receive, send))
+        aclose.assert_awaited_once_with()
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+    def test_wsgi_first_request_starts_it_once_per_process(self):
+        django_application = mock.Mock(return_value=[b""])
+        application = lifecycle.wsgi_application(django_application)
+        self.assertEqual(self.started, [])
+        application({}, None)
+        application({}, None)
+        self.assertEqual(self.started, ["rag-warmup"])
+        with mock.patch.object(lifecycle.os, "getpid", return_value=os.getpid() + 1):  # a forked worker
+            application({}, None)
+        self.assertEqual(self.started, ["rag-warmup", "rag-warmup"])
+        self.assertEqual(django_application.call_count, 3)
+
+    def test_disabled_by_setting(self):
+        os.environ["RAG_WARMUP_ON_STARTUP"] = "0"
+        lifecycle.wsgi_application(mock.Mock())({}, None)
+        self.assertEqual(self.started, [])
+
+
+class _Conversation:
+    id = "c1"
+
+
+def _fake_rag(**overrides):
+    """Stands in for the `rag` facade the views call: no admission limit, no rate limit, fixed answers."""
+    fake = mock.Mock(
+        RATE_LIMIT_CLIENT_HEADER="",
+        RATE_LIMIT_TRUSTED_PROXIES=1,
+        BATCH_MAX_MESSAGES=10,
+        get_admission_controller=mock.Mock(return_value=AdmissionController(max_concurrent=0)),
+        get_rate_limiter=mock.Mock(return_value=None),
+        get_rag_response=mock.Mock(return_value="sync answer"),
+        aget_rag_response=mock.AsyncMock(return_value="async answer"),
+        aget_conversation=mock.AsyncMock(return_value=_Conversation()),
+        asave_conversation=mock.AsyncMock(),
+    )
+    fake.configure_mock(**overrides)
+    return fake
+
+
+class _ViewTestCase(SimpleTestCase):
+    """Runs the API views against a fake RAG pipeline, with the chat log calls captured instead of written."""
+
+    def setUp(self):
+        self.rag = _fake_rag()
+        self.logged = []
+        for patcher in (
+            mock.patch.object(views, "rag", self.rag),
+            mock.patch.object(views, "log_chat", lambda *args: self.logged.append(args)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, view, body, asgi: bool = True, **headers):
+        factory = AsyncRequestFactory() if asgi else RequestFactory()
+        data = body if isinstance(body, str) else json.dumps(body)
+        return asyncio.run(view(factory.post("/", data, content_type="application/json", headers=headers)))
+
+
+class ChatAPITests(_ViewTestCase):
+    def test_asgi_request_runs_the_async_pipeline(self):
+        response = self.post(views.chat_api, {"message": "  What is anemia?  "})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"response": "async answer"})
+        self.rag.aget_rag_response.assert_awaited_once_with("What is anemia?", None)
+        self.rag.get_rag_response.assert_not_called()
+
+    def test_wsgi_request_runs_the_sync_pipeline(self):
+        response = self.post(views.chat_api, {"message": "What is anemia?"}, asgi=False)
+        self.assertEqual(json.loads(response.content), {"response": "sync answer"})
+        self.rag.get_rag_response.assert_called_once_with("What is anemia?", None)
+        self.rag.aget_rag_response.assert_not_called()
+
+    def test_conversation_is_continued_and_saved(self):
+        response = self.post(views.chat_api, {"message": "And in children?", "conversation_id": "c1"})
+        self.assertEqual(json.loads(response.content), {"response": "async answer", "conversation_id": "c1"})
+        self.rag.aget_conversation.assert_awaited_once_with("c1")
+        self.rag.asave_conversation.assert_awaited_once()
+
+    def test_invalid_requests_are_rejected(self):
+        for body, status in (
+            ("{not json", 400),
+            ([1, 2], 400),
+            ({"message": 3}, 400),
+            ({"message": "   "}, 400),
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(views.chat_api, body).status_code, status)
+        response = asyncio.run(views.chat_api(AsyncRequestFactory().get("/")))
+        self.assertEqual(response.status_code, 405)
+        self.rag.aget_rag_response.assert_not_called()
+
+    def test_pipeline_error_is_a_500(self):
+        self.rag.aget_rag_response.side_effect = RuntimeError("boom")
+        with mock.patch("builtins.print"):
+            response = self.post(views.chat_api, {"message": "What is anemia?"})
+        self.assertEqual(response.status_code, 500)
+
+
+def _stream_of(*tokens, error=None):
+    async def astream_rag_response(user_message, conversation=None):
+        for token in tokens:
+            yield token
+        if error is not None:
+            raise error
+    return astream_rag_response
+
+
+def _sse_frames(response) -> list[tuple]:
+    """The (event, data) frames of a streamed SSE response, consumed the way the server would."""
+    if response.is_async:
+        async def consume():
+            return [chunk async for chunk in response.streaming_content]
+        chunks = asyncio.run(consume())
+    else:
+        chunks = list(response.streaming_content)
+    text = b"".join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in chunks).decode()
+    frames = []
+    for frame in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        frames.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return frames
+
+
+class ChatStreamAPITests(_ViewTestCase):
+    def test_asgi_request_streams_tokens_then_done(self):
+        self.rag.astream_rag_response = _stream_of("Anemia ", "is ", "low hemoglobin.")
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual(_sse_frames(response), [
+            ("message", {"token": "Anemia "}),
+            ("message", {"token": "is "}),
+            ("message", {"token": "low hemoglobin."}),
+            ("done", {}),
+        ])
+
+    def test_done_frame_carries_the_conversation_id(self):
+        self.rag.astream_rag_response = _stream_of("Yes.")
+        response = self.post(views.chat_stream_api, {"message": "And in children?", "conversation_id": ""})
+        self.assertEqual(_sse_frames(response)[-1], ("done", {"conversation_id": "c1"}))
+        self.rag.asave_conversation.assert_awaited_once()
+
+    def test_error_mid_stream_ends_with_an_error_frame(self):
+        self.rag.astream_rag_response = _stream_of("Anemia ", error=RuntimeError("boom"))
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"})
+        with mock.patch("builtins.print"):
+            frames = _sse_frames(response)
+        self.assertEqual([event for event, _ in frames], ["message", "error", "done"])
+
+    def test_wsgi_request_sends_the_whole_answer_as_one_frame(self):
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"}, asgi=False)
+        self.assertFalse(response.is_async)
+        self.assertEqual(_sse_frames(response), [("message", {"token": "sync answer"}), ("done", {})])
+
+    def test_invalid_request_is_answered_without_a_stream(self):
+        response = self.post(views.chat_stream_api, {"message": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    def setUp(self):
+        from .llm_rag import EmbeddingBatcher
+        self.calls = []
+
+        def encode(texts):
+            self.calls.append(list(texts))
+            return [f"vector of {text}" for text in texts]
+
+        self.make = lambda **kwargs: EmbeddingBatcher(encode, **kwargs)
+
+    def test_concurrent_queries_share_one_encode_call(self):
+        batcher = self.make(max_batch_size=4, max_wait_ms=2000)
+        futures = [batcher.submit(text) for text in "abcd"]
+        self.assertEqual([future.result(timeout=5) for future in futures], [f"vector of {text}" for text in "abcd"])
+        self.assertEqual(self.calls, [["a", "b", "c", "d"]])
+        self.assertEqual((batcher.batches, batcher.items), (1, 4))
+
+    def test_full_batch_goes_without_waiting_and_the_rest_follows(self):
+        batcher = self.make(max_batch_size=2, max_wait_ms=50)
+        futures = [batcher.submit(text) for text in "abc"]
+        self.assertEqual(futures[2].result(timeout=5), "vector of c")
+        self.assertEqual(self.calls, [["a", "b"], ["c"]])
+
+    def test_encode_error_reaches_every_caller_of_the_batch(self):
+        batcher = self.make(max_batch_size=2, max_wait_ms=2000)
+        failing = mock.Mock(side_effect=[RuntimeError("boom"), ["vector of c"]])
+        batcher._encode_fn = failing
+        futures = [batcher.submit(text) for text in "ab"]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        batcher.max_wait = 0.01
+        self.assertEqual(batcher.encode("c"), "vector of c")  # the batcher keeps serving
+
+
+def _random_chunks(count: int, dimensions: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = [f"chunk-{i}" for i in range(count)]
+    documents = [f"Document {i} \u2013 \u00e9" * (i % 3 + 1) for i in range(count)]
+    return ids, documents, rng.normal(size=(count, dimensions)).astype(np.float32)
+
+
+class NumpyVectorIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, "index")
+
+    def write(self, ids, documents, embeddings, batch_size: int = 7, **kwargs):
+        batches = (
+            (ids[i:i + batch_size], documents[i:i + batch_size], embeddings[i:i + batch_size])
+            for i in range(0, len(ids), batch_size)
+        )
+        write_vector_index(self.path, batches, len(ids), **kwargs)
+
+    def test_search_matches_brute_force_cosine(self):
+        ids, documents, embeddings = _random_chunks(50)
+        self.write(ids, documents, embeddings)
+        index = NumpyVectorIndex.load(self.path)
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        query = np.random.default_rng(1).normal(size=16).astype(np.float32)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        rows, scores = index.search(query * 3, 5)  # the query's norm does not matter
+        self.assertEqual(rows.tolist(), expected.tolist())
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+        self.assertEqual(index.query(query, 5), ([ids[row] for row in expected], [documents[row] for row in expected]))
+
+    def test_search_many_matches_search(self):
+        ids, documents, embeddings = _random_chunks(40)
+        self.write(ids, documents, embeddings)
+        index = NumpyVectorIndex.load(self.path)
+        queries = np.random.default_rng(2).normal(size=(20, 16)).astype(np.float32)  # more than one query group
+        for query, (rows, scores) in zip(queries, index.search_many(queries, 4)):
+            self.assertEqual(rows.tolist(), index.search(query, 4)[0].tolist())
+
+    def test_loaded_index_is_memory_mapped(self):
+        ids, documents, embeddings = _random_chunks(10)
+        self.write(ids, documents, embeddings)
+        index = NumpyVectorIndex.load(self.path)
+        self.assertIsInstance(index.embeddings, np.memmap)
+        self.assertEqual(index.get_documents(["chunk-3", "missing"]), {"chunk-3": documents[3]})
+
+    def test_k_larger_than_the_index_and_empty_index(self):
+        ids, documents, embeddings = _random_chunks(3)
+        self.write(ids, documents, embeddings)
+        self.assertEqual(len(NumpyVectorIndex.load(self.path).search(embeddings[0], 10)[0]), 3)
+        self.write([], [], np.zeros((0, 16), np.float32))
+        empty = NumpyVectorIndex.load(self.path)
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.query(embeddings[0], 3), ([], []))
+
+    def test_wrong_chunk_count_is_refused_and_the_old_index_kept(self):
+        ids, documents, embeddings = _random_chunks(5)
+        self.write(ids, documents, embeddings)
+        with self.assertRaises(ValueError):
+            write_vector_index(self.path, [(ids, documents, embeddings)], 6)
+        self.assertEqual(len(NumpyVectorIndex.load(self.path)), 5)
+
+    def test_int8_quantization_round_trip(self):
+        _, _, embeddings = _random_chunks(20)
+        embeddings[3] = 0  # an all-zero row keeps a usable scale
+        quantized, scales = quantize_int8(embeddings)
+        self.assertEqual((quantized.dtype, scales.dtype), (np.int8, np.float32))
+        restored = quantized.astype(np.float32) * scales[:, None]
+        self.assertTrue(np.all(np.abs(restored - embeddings) <= scales[:, None] / 2 + 1e-6))
+        self.assertFalse(restored[3].any())
+
+    def test_quantized_copies_round_trip_through_the_memory_maps(self):
+        ids, documents, embeddings = _random_chunks(30)
+        self.write(ids, documents, embeddings, quantizations=("int8", "float16"))
+        exact = NumpyVectorIndex.load(self.path)
+        int8 = NumpyVectorIndex.load(self.path, "int8")
+        float16 = NumpyVectorIndex.load(self.path, "float16")
+        self.assertEqual((int8.quantized.dtype, float16.quantized.dtype), (np.int8, np.float16))
+        self.assertIsInstance(int8.quantized, np.memmap)
+        restored = int8.quantized.astype(np.float32) * np.asarray(int8.scales)[:, None]
+        self.assertLess(np.abs(restored - exact.embeddings).max(), 0.01)
+        self.assertLess(np.abs(float16.quantized.astype(np.float32) - exact.embeddings).max(), 1e-3)
+        with self.assertRaises(ValueError):
+            NumpyVectorIndex.load(self.path, "int4")
+
+    def test_rerank_returns_float32_scores(self):
+        ids, documents, embeddings = _random_chunks(60)
+        self.write(ids, documents, embeddings, quantizations=("int8",))
+        exact = NumpyVectorIndex.load(self.path)
+        reranked = NumpyVectorIndex.load(self.path, "int8", rerank_candidates=20)
+        query = embeddings[7] + 0.1
+        rows, scores = reranked.search(query, 3)
+        self.assertEqual(rows[0], 7)
+        np.testing.assert_allclose(scores, exact.embeddings[rows] @ (query / np.linalg.norm(query)), rtol=1e-5)
+        self.assertEqual(rows.tolist(), exact.search(query, 3)[0].tolist())
+
+
+class PromptBuilderTests(SimpleTestCase):
+    ANEMIA = ("Anemia is a lack of healthy red blood cells. It often causes fatigue. "
+              "Iron deficiency is the most common cause. Treatment depends on the cause.")
+    DIABETES = "Diabetes raises blood sugar. Type 2 is the most common form. It is managed with diet and drugs."
+
+    def test_context_fits_the_budget(self):
+        documents = [self.ANEMIA * 3, self.DIABETES * 3, self.ANEMIA]
+        for budget in (20, 40, 80):
+            with self.subTest(budget=budget):
+                context = PromptBuilder("", "", context_token_budget=budget).select_context("anemia", documents)
+                self.assertLessEqual(sum(estimate_tokens(document) + 1 for document in context), budget)
+
+    def test_no_budget_keeps_every_document(self):
+        documents = [self.ANEMIA, self.DIABETES]
+        self.assertEqual(PromptBuilder("", "").select_context("anemia", documents), documents)
+
+    def test_trimming_keeps_the_sentences_about_the_query_in_order(self):
+        trimmed = trim_to_relevant_sentences(self.ANEMIA, {"iron", "deficiency", "anemia"}, 25)
+        self.assertEqual(trimmed, "Anemia is a lack of healthy red blood cells. Iron deficiency is the most common cause.")
+
+    def test_budget_left_by_a_short_document_goes_to_the_next(self):
+        short = "Anemia is common."
+        context = PromptBuilder("", "", context_token_budget=40).select_context("anemia cause", [short, self.ANEMIA])
+        self.assertEqual(context[0], short)
+        self.assertGreater(estimate_tokens(context[1]), 40 // 2)  # more than an even split
+
+    def test_near_duplicates_are_dropped(self):
+        builder = PromptBuilder("", "", duplicate_similarity=0.9)
+        documents = [self.ANEMIA, self.ANEMIA.replace("often", "Often"), self.DIABETES]
+        self.assertEqual(builder.select_context("anemia", documents), [self.ANEMIA, self.DIABETES])
+
+    def test_build_places_context_history_and_query(self):
+        builder = PromptBuilder("Rules:\n", "\nQ: {user_query}")
+        self.assertEqual(
+            builder.build("why?", ["a", "b"], history="User: hi"),
+            "Rules:\na\nb\n\n### Conversation So Far\nUser: hi\nQ: why?",
+        )
+
+
+class TimedViewTests(SimpleTestCase):
+    def test_server_timing_reports_the_stages_and_the_total(self):
+        @views._timed_view("timed_test")
+        async def view(request):
+            with span("retrieve"):
+                pass
+            with span("llm"):
+                pass
+            return views.JsonResponse({}, status=201)
+
+        response = asyncio.run(view(AsyncRequestFactory().get("/")))
+        stages = [entry.split(";dur=")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["retrieve", "llm", "total"])
+        self.assertIn(("timed_test", "201"), HTTP_REQUEST_SECONDS._series)
+
+    def test_concurrent_requests_keep_their_own_timings(self):
+        @views._timed_view("timed_test")
+        async def view(request, stage):
+            with span(stage):
+                await asyncio.sleep(0.01)
+            return views.JsonResponse({})
+
+        async def both():
+            return await asyncio.gather(*(view(AsyncRequestFactory().get("/"), stage) for stage in ("a", "b")))
+
+        headers = [response["Server-Timing"] for response in asyncio.run(both())]
+        self.assertTrue(headers[0].startswith("a;dur=") and "b;" not in headers[0])
+        self.assertTrue(headers[1].startswith("b;dur=") and "a;" not in headers[1])
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch.object(admission, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rejects_with_the_refill_time(self):
+        limiter = RateLimiter(rate_per_minute=6, burst=2)
+        limiter.acquire("a")
+        limiter.acquire("a")
+        with self.assertRaises(AdmissionRejected) as rejected:
+            limiter.acquire("a")
+        self.assertEqual((rejected.exception.reason, rejected.exception.retry_after), ("rate_limited", 10))
+        limiter.acquire("b")  # other clients have buckets of their own
+
+    def test_tokens_refill_over_time(self):
+        limiter = RateLimiter(rate_per_minute=6, burst=1)
+        limiter.acquire("a")
+        self.clock.now += 9
+        with self.assertRaises(AdmissionRejected) as rejected:
+            limiter.acquire("a")
+        self.assertEqual(rejected.exception.retry_after, 1)
+        self.clock.now += 1
+        limiter.acquire("a")
+
+    def test_least_recently_seen_client_is_forgotten(self):
+        limiter = RateLimiter(rate_per_minute=1, burst=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            limiter.acquire(client)
+        limiter.acquire("a")  # evicted, so it starts again with a full bucket
+        with self.assertRaises(AdmissionRejected):
+            limiter.acquire("c")
+
+
+class ClientAddressTests(SimpleTestCase):
+    def setUp(self):
+        self.rag = _fake_rag(RATE_LIMIT_CLIENT_HEADER="X-Forwarded-For")
+        patcher = mock.patch.object(views, "rag", self.rag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def address(self, forwarded=None):
+        headers = {"X-Forwarded-For": forwarded} if forwarded is not None else {}
+        return views._client_address(RequestFactory().get("/", REMOTE_ADDR="10.0.0.1", headers=headers))
+
+    def test_entry_appended_by_the_last_trusted_proxy_is_used(self):
+        self.assertEqual(self.address("1.1.1.1"), "1.1.1.1")
+        self.assertEqual(self.address("6.6.6.6, 1.1.1.1"), "1.1.1.1")  # the client sent 6.6.6.6
+
+    def test_hops_count_from_the_right(self):
+        self.rag.RATE_LIMIT_TRUSTED_PROXIES = 2
+        self.assertEqual(self.address("6.6.6.6, 1.1.1.1, 10.0.0.2"), "1.1.1.1")
+        self.assertEqual(self.address("1.1.1.1"), "10.0.0.1")  # did not come through both proxies
+
+    def test_missing_or_empty_header_falls_back_to_the_peer(self):
+        self.assertEqual(self.address(), "10.0.0.1")
+        self.assertEqual(self.address(""), "10.0.0.1")
+
+    def test_header_is_ignored_unless_configured(self):
+        self.rag.RATE_LIMIT_CLIENT_HEADER = ""
+        self.assertEqual(self.address("1.1.1.1"), "10.0.0.1")
+
+
+class AdmittedViewTests(_ViewTestCase):
+    def test_client_over_the_rate_limit_gets_a_429(self):
+        self.rag.get_rate_limiter.return_value = RateLimiter(rate_per_minute=1, burst=1)
+        self.assertEqual(self.post(views.chat_api, {"message": "What is anemia?"}).status_code, 200)
+        response = self.post(views.chat_api, {"message": "What is anemia?"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+        self.rag.aget_rag_response.assert_awaited_once()
+
+    def test_saturated_process_gets_a_503(self):
+        controller = AdmissionController(max_concurrent=1, retry_after=3)
+        self.rag.get_admission_controller.return_value = controller
+        asyncio.run(controller.acquire())
+        response = self.post(views.chat_api, {"message": "What is anemia?"})
+        self.assertEqual((response.status_code, response["Retry-After"]), (503, "3"))
+        self.rag.aget_rag_response.assert_not_called()
+
+    def test_slot_is_released_after_the_view(self):
+        controller = AdmissionController(max_concurrent=1)
+        self.rag.get_admission_controller.return_value = controller
+        self.post(views.chat_api, {"message": "What is anemia?"})
+        self.assertEqual(controller.in_flight, 0)
+
+        @views._admitted("admitted_test")
+        async def failing(request):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(failing(AsyncRequestFactory().get("/")))
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_stream_holds_its_slot_until_it_ends(self):
+        controller = AdmissionController(max_concurrent=1)
+        self.rag.get_admission_controller.return_value = controller
+        self.rag.astream_rag_response = _stream_of("Anemia.")
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"})
+        self.assertEqual(controller.in_flight, 1)
+        _sse_frames(response)
+        self.assertEqual(controller.in_flight, 0)
+
+
+class ConversationTests(SimpleTestCase):
+    def test_follow_ups_carry_the_topic_into_retrieval(self):
+        conversation = Conversation("c1")
+        conversation.add_turn("What are the symptoms of measles?", "Fever, cough and a rash.")
+        self.assertTrue(is_follow_up("Is it contagious?"))
+        self.assertEqual(conversation.retrieval_query("Is it contagious?"), "symptoms measles Is it contagious?")
+        self.assertEqual(conversation.retrieval_query("How is asthma treated?"), "How is asthma treated?")
+        conversation.add_turn("How is asthma treated?", "With inhalers.")
+        self.assertEqual(conversation.topic, "asthma treated")
+
+    def test_history_stays_within_its_budgets(self):
+        conversation = Conversation("c1", history_token_budget=60, summary_token_budget=40)
+        for turn in range(30):
+            conversation.add_turn(f"Question number {turn} about diabetes care?", "Answer sentence one. " * 5)
+            self.assertLessEqual(conversation.history_tokens, 100)
+        history = conversation.render()
+        self.assertTrue(history.startswith("Summary of earlier turns:"))
+        self.assertIn("User: Question number 29", history)
+        self.assertNotIn("number 0 ", history)
+        self.assertEqual(conversation.turn_count, 30)
+
+    def test_empty_conversation_has_no_history(self):
+        self.assertEqual(Conversation("c1").render(), "")
+
+
+class ConversationStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = ConversationStore(LocMemCache("conversation-tests", {}), ttl_seconds=60)
+
+    def test_saved_conversation_is_loaded_by_id(self):
+        conversation = self.store.get_or_create(None)
+        conversation.add_turn("What is measles?", "A viral infection.")
+        self.store.save(conversation)
+        loaded = self.store.get_or_create(conversation.id)
+        self.assertIsNot(loaded, conversation)  # a copy, as another worker would see it
+        self.assertEqual(loaded.render(), conversation.render())
+        loaded.add_turn("Is it contagious?", "Yes.")  # the lock survives the round trip
+
+    def test_unknown_or_malformed_ids_start_a_new_conversation(self):
+        for conversation_id in (None, "", "unknown", "../../etc", "x" * 65):
+            with self.subTest(conversation_id=conversation_id):
+                conversation = self.store.get_or_create(conversation_id)
+                self.assertNotEqual(conversation.id, conversation_id)
+                self.assertEqual(conversation.turn_count, 0)
+
+
+class _FakeShard:
+    """A shard holding chunk id -> (document, distance to every query); records the ids it is asked for."""
+
+    def __init__(self, chunks: dict):
+        self.chunks = chunks
+        self.fetched = []
+
+    def query_many_with_distances(self, query_embeddings, n_results: int):
+        nearest = sorted(self.chunks.items(), key=lambda item: item[1][1])[:n_results]
+        result = ([cid for cid, _ in nearest], [doc for _, (doc, _) in nearest], [dist for _, (_, dist) in nearest])
+        return [result for _ in query_embeddings]
+
+    def get_documents(self, ids):
+        self.fetched.extend(ids)
+        return {cid: self.chunks[cid][0] for cid in ids if cid in self.chunks}
+
+
+class ShardingTests(SimpleTestCase):
+    def test_merge_nearest_takes_the_overall_nearest(self):
+        merged = merge_nearest([
+            (["a1", "a2", "a3"], ["A1", "A2", "A3"], [0.1, 0.4, 0.9]),
+            (["b1", "b2"], ["B1", "B2"], [0.2, 0.3]),
+            ([], [], []),
+        ], 3)
+        self.assertEqual(merged, (["a1", "b1", "b2"], ["A1", "B1", "B2"]))
+        self.assertEqual(merge_nearest([(["a"], ["A"], [0.5])], 3), (["a"], ["A"]))
+
+    def test_shard_of_is_stable_and_in_range(self):
+        placements = [shard_of(f"chunk-{i}", 4) for i in range(200)]
+        self.assertEqual(placements, [shard_of(f"chunk-{i}", 4) for i in range(200)])
+        self.assertEqual(set(placements), {0, 1, 2, 3})
+        self.assertEqual(shard_of("chunk-1", 1), 0)
+
+    def test_shard_locations(self):
+        self.assertEqual(shard_locations("db", "kb", 1), [("db", "kb")])
+        self.assertEqual(shard_locations("db", "kb", 2), [("db", "kb_shard0"), ("db", "kb_shard1")])
+        self.assertEqual(shard_locations("db", "kb", 2, "directories"),
+                         [(os.path.join("db", "shard_0"), "kb"), (os.path.join("db", "shard_1"), "kb")])
+        with self.assertRaises(ValueError):
+            shard_locations("db", "kb", 2, "tables")
+
+    def test_sharded_retriever_scatters_and_merges(self):
+        from .llm_rag import ShardedRetriever
+        chunks = {f"chunk-{i}": (f"doc {i}", i / 10) for i in range(12)}
+        shards = [_FakeShard({}), _FakeShard({})]
+        for cid, chunk in chunks.items():
+            shards[shard_of(cid, 2)].chunks[cid] = chunk
+        retriever = ShardedRetriever(shards)
+        self.addCleanup(retriever._pool.shutdown)
+        self.assertEqual(retriever.query([0.0], 3), (["chunk-0", "chunk-1", "chunk-2"], ["doc 0", "doc 1", "doc 2"]))
+        self.assertEqual(len(retriever.query_many([[0.0], [1.0]], 2)), 2)
+        self.assertEqual(retriever.get_documents(["chunk-4", "chunk-7"]), {"chunk-4": "doc 4", "chunk-7": "doc 7"})
+        for shard in shards:  # each id is fetched only from the shard that holds it
+            self.assertTrue(all(cid in shard.chunks for cid in shard.fetched))
+
+
+class LoadEmbedderTests(SimpleTestCase):
+    """Which embedder load_embedder returns; neither ONNX Runtime nor PyTorch is loaded."""
+
+    def setUp(self):
+        self.sentence_transformers = mock.Mock()
+        self.config = {"model": "all-MiniLM-L6-v2", "checks": {"onnx": 0.99999, "onnx-int8": 0.95}}
+        self.onnx = mock.Mock(side_effect=lambda path, backend, threads: mock.Mock(config=self.config, backend=backend))
+        for patcher in (
+            mock.patch.dict(sys.modules, {"sentence_transformers": self.sentence_transformers}),
+            mock.patch.object(onnx_embedder, "OnnxEmbedder", self.onnx),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.torch_model = self.sentence_transformers.SentenceTransformer.return_value
+
+    def load(self, backend):
+        return onnx_embedder.load_embedder("all-MiniLM-L6-v2", backend, "/exports/onnx")
+
+    def test_export_that_passed_its_check_is_used(self):
+        embedder = self.load("onnx")
+        self.assertEqual(embedder.backend, "onnx")
+        self.sentence_transformers.SentenceTransformer.assert_not_called()
+
+    def test_export_below_the_minimum_similarity_falls_back_to_pytorch(self):
+        self.assertIs(self.load("onnx-int8"), self.torch_model)  # 0.95 < 0.98
+
+    def test_export_without_a_check_falls_back_to_pytorch(self):
+        del self.config["checks"]
+        self.assertIs(self.load("onnx"), self.torch_model)
+
+    def test_missing_or_broken_export_falls_back_to_pytorch(self):
+        for error in (FileNotFoundError(2, "No such file", "/exports/onnx/model.onnx"), ValueError("bad graph")):
+            with self.subTest(error=error):
+                self.onnx.side_effect = error
+                self.assertIs(self.load("onnx"), self.torch_model)
+
+    def test_torch_backend_never_opens_the_export(self):
+        self.assertIs(self.load("torch"), self.torch_model)
+        self.onnx.assert_not_called()
+
+
+class ExportFingerprintTests(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, True)
+        self.config = {"model": "all-MiniLM-L6-v2", "checks": {"onnx": 0.99999, "onnx-int8": 0.95}, "export_seconds": 12.0}
+        self.write(onnx_embedder.CONFIG_FILE, json.dumps(self.config).encode())
+        self.write(onnx_embedder.TOKENIZER_FILE, b"{}")
+        self.write(onnx_embedder.MODEL_FILES["onnx"], b"weights")
+
+    def write(self, name, content: bytes):
+        with open(os.path.join(self.path, name), "wb") as f:
+            f.write(content)
+
+    def test_changes_with_the_model_but_not_the_export_time(self):
+        fingerprint = onnx_embedder.export_fingerprint(self.path, "onnx")
+        self.assertRegex(fingerprint, r"^[0-9a-f]{32}$")
+        self.write(onnx_embedder.CONFIG_FILE, json.dumps({**self.config, "export_seconds": 30.0}).encode())
+        self.assertEqual(onnx_embedder.export_fingerprint(self.path, "onnx"), fingerprint)
+        self.write(onnx_embedder.MODEL_FILES["onnx"], b"other weights")
+        self.assertNotEqual(onnx_embedder.export_fingerprint(self.path, "onnx"), fingerprint)
+
+    def test_none_without_an_export_that_passed_its_check(self):
+        self.assertIsNone(onnx_embedder.export_fingerprint(self.path, "onnx-int8"))  # failed its check
+        os.remove(os.path.join(self.path, onnx_embedder.MODEL_FILES["onnx"]))
+        self.assertIsNone(onnx_embedder.export_fingerprint(self.path, "onnx"))
+        self.assertIsNone(onnx_embedder.export_fingerprint(os.path.join(self.path, "missing"), "onnx"))
+
+
+class LoggedViewTests(_ViewTestCase):
+    def test_answered_request_is_logged_with_its_notes_and_timings(self):
+        self.post(views.chat_api, {"message": "What is anemia?", "conversation_id": ""})
+        [(view, record, timings, status, seconds)] = self.logged
+        self.assertEqual((view, status), ("chat", 200))
+        self.assertEqual(record, {"query": "What is anemia?", "conversation_id": "c1"})
+        self.assertIn("total", timings)  # _timed_view's timings, not a dict of its own
+        self.assertGreaterEqual(seconds, 0)
+
+    def test_invalid_and_rejected_requests_are_logged(self):
+        self.post(views.chat_api, "{not json")
+        self.rag.get_rate_limiter.return_value = RateLimiter(rate_per_minute=1, burst=0)
+        self.post(views.chat_api, {"message": "What is anemia?"})
+        self.assertEqual([entry[3] for entry in self.logged], [400, 429])
+
+    def test_stream_is_logged_when_it_ends(self):
+        self.rag.astream_rag_response = _stream_of("Anemia.")
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"})
+        self.assertEqual(self.logged, [])
+        _sse_frames(response)
+        [(view, record, _, status, _)] = self.logged
+        self.assertEqual((view, status, record), ("chat_stream", 200, {"query": "What is anemia?"}))
+
+    def test_stream_closed_early_is_logged_as_disconnected(self):
+        self.rag.astream_rag_response = _stream_of("Anemia ", "is ", "common.")
+        response = self.post(views.chat_stream_api, {"message": "What is anemia?"})
+
+        async def read_one_frame_then_leave():
+            stream = response.streaming_content
+            await anext(stream)
+            await stream.aclose()
+
+        asyncio.run(read_one_frame_then_leave())
+        [(_, record, _, _, _)] = self.logged
+        self.assertEqual(record["outcome"], ChatLog.Outcome.DISCONNECTED)
+
+
+class BatchOutcomeTests(SimpleTestCase):
+    """get_rag_responses and aget_rag_responses note how each message was answered, for the chat log."""
+
+    MESSAGES = ["hello", "What is anemia?", "what is anemia", "What is flu?", "What is measles?", "  ", "What is gout?"]
+    OUTCOMES = ["local", "answered", "coalesced", "cached", "llm_error", "invalid", "answered"]
+
+    def setUp(self):
+        from . import llm_rag
+
+        self.llm_rag = llm_rag
+
+        def llm(prompt):
+            if "measles" in prompt:
+                raise llm_rag.LLMCallError("The AI service is unavailable.")
+            return f"answer to {prompt}"
+
+        async def allm(prompt):
+            return llm(prompt)
+
+        patcher = mock.patch.multiple(
+            llm_rag,
+            INTENT_FAST_PATH_ENABLED=True,
+            _initialize_rag_components=mock.Mock(return_value=True),
+            _embedding_model=mock.Mock(encode=lambda queries: [np.zeros(3) for _ in queries]),
+            _is_off_topic=mock.Mock(return_value=False),
+            _cached_answer=lambda user_query, embedding: "cached flu answer" if "flu" in user_query else None,
+            _cache_answer=mock.Mock(),
+            _retrieve_contexts=lambda queries, embeddings: [[] for _ in queries],
+            _build_prompt=lambda user_query, documents: user_query,
+            _call_gemini_api=llm,
+            _acall_gemini_api=allm,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, record, results):
+        self.assertEqual(record["batch"], [
+            {"query": message, "outcome": outcome} for message, outcome in zip(self.MESSAGES, self.OUTCOMES)
+        ])
+        self.assertEqual(results[2], results[1])
+        self.assertEqual(results[3], {"response": "cached flu answer"})
+        self.assertIn("error", results[4])
+
+    def run_sync(self, messages):
+        def run():
+            record = start_chat_record()
+            return record, self.llm_rag.get_rag_responses(messages)
+
+        return contextvars.copy_context().run(run)  # the chat record stays out of the other tests
+
+    def test_sync_batch(self):
+        self.check(*self.run_sync(self.MESSAGES))
+
+    def test_async_batch(self):
+        async def run():
+            record = start_chat_record()
+            return record, await self.llm_rag.aget_rag_responses(self.MESSAGES)
+
+        self.check(*asyncio.run(run()))
+
+    def test_failed_batch_is_an_error_for_every_message(self):
+        self.llm_rag._initialize_rag_components.return_value = False
+        record, _ = self.run_sync(["What is flu?", "What is gout?"])
+        self.assertEqual([note["outcome"] for note in record["batch"]], ["error", "error"])
+
+
+class ChatBatchAPITests(_ViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        async def aget_rag_responses(messages):
+            views.note_chat(batch=[{"query": message, "outcome": "cached"} for message in messages])
+            return [{"response": f"answer to {message}"} for message in messages]
+
+        self.rag.aget_rag_responses = aget_rag_responses
+
+    def test_results_come_back_in_order_and_the_pipeline_outcomes_are_logged(self):
+        response = self.post(views.chat_batch_api, {"messages": ["a", "b"]})
+        self.assertEqual(json.loads(response.content), {"results": [{"response": "answer to a"}, {"response": "answer to b"}]})
+        [(view, record, _, status, _)] = self.logged
+        self.assertEqual((view, status), ("chat_batch", 200))
+        self.assertEqual(record["batch"], [{"query": "a", "outcome": "cached"}, {"query": "b", "outcome": "cached"}])
+
+    def test_invalid_batches_are_rejected(self):
+        for body in ({"messages": []}, {"messages": ["a", 1]}, {"messages": "a"}, ["a"], {"messages": ["a"] * 11}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(views.chat_batch_api, body).status_code, 400)
@@ -6,4 +6,9 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/batch/', views.chat_batch_api, name='chat_batch_api'),
+    path('api/chat/stream/', views.chat_stream_api, name='chat_stream_api'),
+    path('api/cache/stats/', views.cache_stats_api, name='cache_stats_api'),
+    path('api/ready/', views.readiness_api, name='readiness_api'),
+    path('metrics', views.metrics_api, name='metrics_api'),
 ]
\ No newline at end of file
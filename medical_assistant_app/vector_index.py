@@ -0,0 +1,226 @@
+# medical_assistant_app/vector_index.py
+
+import os
+import shutil
+
+import numpy as np
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+IDS_FILE = 'ids.npy'
+DOCUMENTS_FILE = 'documents.bin'
+OFFSETS_FILE = 'document_offsets.npy'
+# Optional compact copies of the embeddings, searched instead of the float32 matrix
+QUANTIZED_FILES = {'int8': 'embeddings_int8.npy', 'float16': 'embeddings_float16.npy'}
+INT8_SCALES_FILE = 'embedding_scales.npy'
+# Quantized rows are widened to float32 this many at a time, so scoring never
+# allocates a float32 copy of the whole matrix.
+SCORE_BLOCK_ROWS = 1024
+# Queries scored together by `search_many`; bounds its (rows x queries) score matrix.
+SEARCH_BATCH_QUERIES = 16
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization: returns the int8 rows and each row's float32 scale."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class NumpyVectorIndex:
+    """
+    Exact nearest-neighbour search over the knowledge-base embeddings with plain NumPy.
+
+    The vectors are the L2-normalized float32 rows of one matrix, so the cosine
+    similarity of a query to every chunk is a single matrix-vector product and the
+    top k come from `argpartition`. Everything is memory-mapped from the index
+    directory: loading is instant, workers on one host share the pages, and only
+    the documents of the returned rows are decoded.
+
+    With `dtype` 'int8' (per-vector scale) or 'float16', the search scans the
+    quantized copy instead, a quarter or half of the float32 size. If
+    `rerank_candidates` is set, that many best approximate matches are then
+    rescored against their float32 rows; only those rows are read.
+    """
+
+    def __init__(self, embeddings, ids, documents, offsets, quantized=None, scales=None, rerank_candidates: int = 0):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.documents = documents
+        self.offsets = offsets
+        self.quantized = quantized
+        self.scales = scales
+        self.rerank_candidates = rerank_candidates
+        self._rows = None  # id -> row, built on the first lookup by id
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path: str, dtype: str = 'float32', rerank_candidates: int = 0) -> "NumpyVectorIndex":
+        documents_path = os.path.join(path, DOCUMENTS_FILE)
+        quantized = scales = None
+        if dtype != 'float32':
+            if dtype not in QUANTIZED_FILES:
+                raise ValueError(f"Unsupported vector index dtype '{dtype}'.")
+            quantized = np.load(os.path.join(path, QUANTIZED_FILES[dtype]), mmap_mode='r')
+            if dtype == 'int8':
+                scales = np.load(os.path.join(path, INT8_SCALES_FILE), mmap_mode='r')
+        return cls(
+            np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r'),
+            np.load(os.path.join(path, IDS_FILE), mmap_mode='r'),
+            # np.memmap refuses empty files; an empty index has no documents to map
+            np.memmap(documents_path, dtype=np.uint8, mode='r') if os.path.getsize(documents_path) else np.zeros(0, np.uint8),
+            np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r'),
+            quantized=quantized,
+            scales=scales,
+            rerank_candidates=rerank_candidates,
+        )
+
+    def search(self, query_embedding, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Rows of the `k` chunks most similar to `query_embedding` and their cosine similarities, best first."""
+        return self.search_many([query_embedding], k)[0]
+
+    def search_many(self, query_embeddings, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        `search` for several queries: each block of the matrix is scored against up
+        to SEARCH_BATCH_QUERIES queries at once, so a batch scans the index once
+        per group of queries instead of once per query.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if not len(self):
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        results = []
+        for start in range(0, len(queries), SEARCH_BATCH_QUERIES):
+            group = queries[start:start + SEARCH_BATCH_QUERIES]
+            if self.quantized is None:
+                scores = self.embeddings @ group.T
+                results.extend(_top_k(scores[:, column], k) for column in range(len(group)))
+                continue
+            scores = self._quantized_scores(group)
+            for column, query in enumerate(group):
+                results.append(self._rerank(query, *_top_k(scores[:, column], max(k, self.rerank_candidates)), k))
+        return results
+
+    def _rerank(self, query: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Rescores approximate matches against their float32 rows, if re-ranking is on."""
+        if not self.rerank_candidates:
+            return rows[:k], scores[:k]
+        order = np.argsort(rows)  # ascending rows read the float32 file sequentially
+        exact = np.empty(len(rows), dtype=np.float32)
+        exact[order] = self.embeddings[rows[order]] @ query
+        top, scores = _top_k(exact, k)
+        return rows[top], scores
+
+    def _quantized_scores(self, queries: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(self.quantized), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.quantized), SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            scores[start:end] = self.quantized[start:end].astype(np.float32) @ queries.T
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return scores
+
+    def chunk_id(self, row: int) -> str:
+        return self.ids[row].decode('ascii')
+
+    def document(self, row: int) -> str:
+        return self.documents[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def query(self, query_embedding, k: int) -> tuple[list[str], list[str]]:
+        """Ids and documents of the `k` nearest chunks, best first."""
+        rows, _ = self.search(query_embedding, k)
+        return [self.chunk_id(row) for row in rows], [self.document(row) for row in rows]
+
+    def query_many(self, query_embeddings, k: int) -> list[tuple[list[str], list[str]]]:
+        """`query` for several embeddings, in order."""
+        return [
+            ([self.chunk_id(row) for row in rows], [self.document(row) for row in rows])
+            for rows, _ in self.search_many(query_embeddings, k)
+        ]
+
+    def get_documents(self, ids: list[str]) -> dict[str, str]:
+        """Documents of the given ids (ids not in the index are left out)."""
+        if self._rows is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids.astype(str).tolist())}
+        return {chunk_id: self.document(self._rows[chunk_id]) for chunk_id in ids if chunk_id in self._rows}
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions and values of the `k` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+def _create_matrices(path: str, count: int, dimensions: int, quantizations) -> dict:
+    """Creates the embedding matrix files of an index; returns writable memory maps keyed by file name."""
+    layout = {EMBEDDINGS_FILE: ('float32', (count, dimensions))}
+    for dtype in quantizations:
+        layout[QUANTIZED_FILES[dtype]] = (dtype, (count, dimensions))
+    if 'int8' in quantizations:
+        layout[INT8_SCALES_FILE] = ('float32', (count,))
+    matrices = {}
+    for name, (dtype, shape) in layout.items():
+        if count:
+            matrices[name] = np.lib.format.open_memmap(os.path.join(path, name), mode='w+', dtype=dtype, shape=shape)
+        else:
+            np.save(os.path.join(path, name), np.zeros(shape, dtype=dtype))  # an empty matrix cannot be memory-mapped
+    return matrices
+
+
+def write_vector_index(path: str, batches, count: int, quantizations=()):
+    """
+    Writes a NumpyVectorIndex to the directory `path` from an iterable of
+    (ids, documents, embeddings) batches holding `count` chunks in total, without
+    holding more than one batch in memory. `quantizations` ('int8', 'float16')
+    are written next to the float32 matrix. The index is built next to `path`
+    and swapped in at the end, so a reader never maps a half-written index.
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrices = None  # file name -> writable memory map, created once the dimension is known
+    ids = []
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    row = 0
+    with open(os.path.join(tmp_path, DOCUMENTS_FILE), 'wb') as documents_file:
+        for batch_ids, batch_documents, batch_embeddings in batches:
+            batch = np.asarray(batch_embeddings, dtype=np.float32)
+            if matrices is None:
+                matrices = _create_matrices(tmp_path, count, batch.shape[1], quantizations)
+            norms = np.linalg.norm(batch, axis=1, keepdims=True)
+            batch = batch / np.where(norms > 0, norms, 1)
+            end = row + len(batch)
+            matrices[EMBEDDINGS_FILE][row:end] = batch
+            if 'int8' in quantizations:
+                matrices[QUANTIZED_FILES['int8']][row:end], matrices[INT8_SCALES_FILE][row:end] = quantize_int8(batch)
+            if 'float16' in quantizations:
+                matrices[QUANTIZED_FILES['float16']][row:end] = batch
+            for document in batch_documents:
+                encoded = document.encode('utf-8')
+                documents_file.write(encoded)
+                offsets[row + 1] = offsets[row] + len(encoded)
+                row += 1
+            ids.extend(batch_ids)
+    if row != count:
+        raise ValueError(f"Expected {count} chunks for the vector index, got {row}.")
+    if matrices is None:
+        matrices = _create_matrices(tmp_path, 0, 0, quantizations)
+    for matrix in matrices.values():
+        matrix.flush()
+    del matrices
+    np.save(os.path.join(tmp_path, IDS_FILE), np.array(ids, dtype='S'))
+    np.save(os.path.join(tmp_path, OFFSETS_FILE), offsets)
+
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)  # readers keep their mappings of the old files
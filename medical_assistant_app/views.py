@@ -1,32 +1,209 @@
 # medical_assistant_app/views.py
 
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+import functools
 import json
-from .llm_rag import get_rag_response # Import your RAG function
+import time
+from .admission import AdmissionRejected
+from .chat_log import log_chat
+from .metrics import (
+    ADMISSION_DECISIONS, ADMISSION_QUEUE_WAIT_SECONDS, HTTP_REQUEST_SECONDS, REGISTRY, note_chat, request_timings,
+    server_timing_header, span, start_chat_record, start_request_timings,
+)
+from .models import ChatLog
+from . import rag  # Your RAG functions, imported on first use (see rag.py)
 
 def index(request):
     """Renders the main chat interface HTML page."""
     return render(request, 'medical_assistant_app/index.html')
 
+def _timed_view(name: str):
+    """
+    Times an async API view into the request histogram and reports the RAG stage
+    durations of the request, plus its total, in a Server-Timing response header.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            timings = start_request_timings()
+            start = time.perf_counter()
+            response = await view(request, *args, **kwargs)
+            timings['total'] = time.perf_counter() - start
+            HTTP_REQUEST_SECONDS.observe(timings['total'], name, str(response.status_code))
+            response['Server-Timing'] = server_timing_header(timings)
+            return response
+        return wrapper
+    return decorator
+
+def _served_over_asgi(request) -> bool:
+    """
+    Whether the request came in through ASGI. Under WSGI every async view runs on
+    an event loop of its own, which would open (and leak) a new aiohttp session
+    per request, so the API views run the sync pipeline instead: its LLM calls
+    share the client's pooled `requests.Session`.
+    """
+    return isinstance(request, ASGIRequest)
+
+def _on_stream_end(response, callback):
+    """
+    Calls `callback(finished)` once a streamed response's content ends
+    (finished=True) or is closed early. The content stays sync (WSGI) or async
+    (ASGI), as it was.
+    """
+    content = response.streaming_content
+    if response.is_async:
+        async def relay():
+            finished = False
+            try:
+                async for chunk in content:
+                    yield chunk
+                finished = True
+            finally:
+                callback(finished)
+    else:
+        def relay():
+            finished = False
+            try:
+                yield from content
+                finished = True
+            finally:
+                callback(finished)
+    response.streaming_content = relay()
+
+def _logged(name: str):
+    """
+    Records each request to an API view in the chat log (see chat_log.py),
+    including rejected and invalid ones. The view and the RAG pipeline add what
+    they know with `note_chat`; the record is only queued, so the request never
+    waits on a database write. A streamed response is logged when its stream ends.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            record = start_chat_record()
+            start_request_timings()  # replaced by _timed_view's own when it wraps the view
+            start = time.perf_counter()
+            response = await view(request, *args, **kwargs)
+            timings = request_timings()
+            if response.streaming:
+                def log_streamed(finished: bool):
+                    if not finished:
+                        record['outcome'] = ChatLog.Outcome.DISCONNECTED
+                    log_chat(name, record, timings, 200, time.perf_counter() - start)
+                _on_stream_end(response, log_streamed)
+            else:
+                log_chat(name, record, timings, response.status_code, time.perf_counter() - start)
+            return response
+        return wrapper
+    return decorator
+
+async def _conversation_for(data: dict):
+    """
+    The conversation a chat request belongs to, if it takes part in one: a request
+    with a "conversation_id" key continues that conversation, or starts a new one
+    if the id is empty or unknown. Requests without the key are answered
+    statelessly. The view saves the conversation once its turn is added.
+    """
+    if 'conversation_id' not in data:
+        return None
+    conversation_id = data.get('conversation_id')
+    return await rag.aget_conversation(conversation_id if isinstance(conversation_id, str) else None)
+
+def _client_address(request) -> str:
+    """
+    The address the per-client rate limit is keyed on. Behind proxies, it is the
+    entry RATE_LIMIT_TRUSTED_PROXIES from the right of the forwarding header:
+    entries further left are whatever the client sent. A header with fewer
+    entries did not come through every proxy, so REMOTE_ADDR is used instead.
+    """
+    if rag.RATE_LIMIT_CLIENT_HEADER:
+        forwarded = [address.strip() for address in request.headers.get(rag.RATE_LIMIT_CLIENT_HEADER, '').split(',')]
+        hops = max(rag.RATE_LIMIT_TRUSTED_PROXIES, 1)
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+def _admitted(name: str):
+    """
+    Puts an async API view behind the per-client rate limit and the admission
+    controller. A rejected request is answered at once, without running the view:
+    429 when its client is over the rate limit, 503 when the process is saturated,
+    both with a Retry-After header. A streamed response holds its slot until the
+    stream ends.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            controller = rag.get_admission_controller()
+            try:
+                limiter = rag.get_rate_limiter()
+                if limiter is not None:
+                    limiter.acquire(_client_address(request))
+                waited = await controller.acquire()
+            except AdmissionRejected as e:
+                ADMISSION_DECISIONS.inc(name, e.reason)
+                if e.reason == 'rate_limited':
+                    response = JsonResponse({'response': 'Too many requests. Please try again shortly.'}, status=429)
+                else:
+                    response = JsonResponse({'response': 'The assistant is busy. Please try again shortly.'}, status=503)
+                response['Retry-After'] = str(e.retry_after)
+                return response
+            ADMISSION_DECISIONS.inc(name, 'admitted')
+            ADMISSION_QUEUE_WAIT_SECONDS.observe(waited, name)
+
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                controller.release()
+                raise
+            if response.streaming:
+                _on_stream_end(response, lambda finished: controller.release())
+            else:
+                controller.release()
+            return response
+        return wrapper
+    return decorator
+
 @csrf_exempt # Use this decorator for API views that receive POST requests
-def chat_api(request):
+@_logged('chat')
+@_timed_view('chat')
+@_admitted('chat')
+async def chat_api(request):
     """
     Handles chat requests, processes user query through RAG, and returns LLM response.
+    Async so that, when served through ASGI, a slow LLM call does not hold a worker.
     """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            user_message = data.get('message', '').strip()
+            message = data.get('message', '') if isinstance(data, dict) else None
+            if not isinstance(message, str):
+                return JsonResponse({'response': 'Expected a JSON object with a "message" string.'}, status=400)
+            user_message = message.strip()
 
             if not user_message:
                 return JsonResponse({'response': 'Please enter a message.'}, status=400)
+            note_chat(query=user_message)
 
             # Get response from the RAG system
-            assistant_response = get_rag_response(user_message)
+            conversation = await _conversation_for(data)
+            if conversation is not None:
+                note_chat(conversation_id=conversation.id)
+            if _served_over_asgi(request):
+                assistant_response = await rag.aget_rag_response(user_message, conversation)
+            else:
+                assistant_response = await sync_to_async(rag.get_rag_response)(user_message, conversation)
+            if conversation is not None:
+                await rag.asave_conversation(conversation)
 
-            return JsonResponse({'response': assistant_response})
+            with span('serialize'):
+                if conversation is not None:
+                    return JsonResponse({'response': assistant_response, 'conversation_id': conversation.id})
+                return JsonResponse({'response': assistant_response})
 
         except json.JSONDecodeError:
             return JsonResponse({'response': 'Invalid JSON in request body.'}, status=400)
@@ -34,4 +211,137 @@ def chat_api(request):
             print(f"Error in chat_api view: {e}")
             return JsonResponse({'response': 'An error occurred while processing your request.'}, status=500)
     else:
-        return JsonResponse({'response': 'Only POST requests are allowed.'}, status=405)
\ No newline at end of file
+        return JsonResponse({'response': 'Only POST requests are allowed.'}, status=405)
+
+
+@csrf_exempt
+@_logged('chat_batch')
+@_timed_view('chat_batch')
+@_admitted('chat_batch')
+async def chat_batch_api(request):
+    """
+    Answers many messages in one request, for offline jobs. Takes {"messages": [...]}
+    and returns {"results": [...]} in the same order, each item either
+    {"response": ...} or {"error": ...}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'response': 'Only POST requests are allowed.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'response': 'Invalid JSON in request body.'}, status=400)
+
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages or not all(isinstance(message, str) for message in messages):
+        return JsonResponse({'response': 'Expected a non-empty "messages" list of strings.'}, status=400)
+    if len(messages) > rag.BATCH_MAX_MESSAGES:
+        return JsonResponse({'response': f'A batch can hold at most {rag.BATCH_MAX_MESSAGES} messages.'}, status=400)
+
+    try:
+        if _served_over_asgi(request):
+            results = await rag.aget_rag_responses(messages)
+        else:
+            results = await sync_to_async(rag.get_rag_responses)(messages)
+    except Exception as e:
+        print(f"Error in chat_batch_api view: {e}")
+        return JsonResponse({'response': 'An error occurred while processing your request.'}, status=500)
+    # The pipeline noted one chat log row per message with its outcome; each gets the batch's timings.
+    with span('serialize'):
+        return JsonResponse({'results': results})
+
+
+def readiness_api(request):
+    """Readiness probe: 200 once the RAG components are loaded, 503 while they are still warming up."""
+    readiness = rag.get_rag_readiness()
+    return JsonResponse(readiness, status=200 if readiness['ready'] else 503)
+
+
+def metrics_api(request):
+    """Stage and request latency histograms in the Prometheus text format."""
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def cache_stats_api(request):
+    """Returns the answer cache's hit, near-hit and miss counters for monitoring."""
+    return JsonResponse(rag.get_answer_cache_stats())
+
+
+def _sse_event(data: dict, event: str = None) -> str:
+    """Formats one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+async def _stream_events(user_message: str, conversation=None):
+    """
+    Relays RAG answer chunks as SSE `message` frames, then a final `done` frame
+    (carrying the conversation id, if any).
+    """
+    try:
+        async for text in rag.astream_rag_response(user_message, conversation):
+            yield _sse_event({'token': text})
+        if conversation is not None:
+            await rag.asave_conversation(conversation)
+    except Exception as e:
+        note_chat(outcome=ChatLog.Outcome.ERROR)
+        print(f"Error in chat_stream_api stream: {e}")
+        yield _sse_event({'response': 'An error occurred while processing your request.'}, event='error')
+    yield _sse_event({'conversation_id': conversation.id} if conversation is not None else {}, event='done')
+
+async def _answer_events(user_message: str, conversation=None) -> list[str]:
+    """
+    The SSE frames of a whole answer from the sync pipeline, for WSGI: it cannot
+    stream from an event loop (Django would buffer the async stream anyway), so
+    the answer is sent as a single `message` frame before `done`.
+    """
+    try:
+        answer = await sync_to_async(rag.get_rag_response)(user_message, conversation)
+        if conversation is not None:
+            await rag.asave_conversation(conversation)
+        frames = [_sse_event({'token': answer})]
+    except Exception as e:
+        note_chat(outcome=ChatLog.Outcome.ERROR)
+        print(f"Error in chat_stream_api: {e}")
+        frames = [_sse_event({'response': 'An error occurred while processing your request.'}, event='error')]
+    frames.append(_sse_event({'conversation_id': conversation.id} if conversation is not None else {}, event='done'))
+    return frames
+
+@csrf_exempt
+@_logged('chat_stream')
+@_admitted('chat_stream')
+async def chat_stream_api(request):
+    """
+    Streaming variant of `chat_api`: answer text is sent as Server-Sent Events
+    while the LLM generates it, so the first words arrive before the full reply.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'response': 'Only POST requests are allowed.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'response': 'Invalid JSON in request body.'}, status=400)
+
+    message = data.get('message', '') if isinstance(data, dict) else None
+    if not isinstance(message, str):
+        return JsonResponse({'response': 'Expected a JSON object with a "message" string.'}, status=400)
+    user_message = message.strip()
+    if not user_message:
+        return JsonResponse({'response': 'Please enter a message.'}, status=400)
+    note_chat(query=user_message)
+
+    try:
+        conversation = await _conversation_for(data)
+    except Exception as e:
+        print(f"Error in chat_stream_api view: {e}")
+        return JsonResponse({'response': 'An error occurred while processing your request.'}, status=500)
+    if conversation is not None:
+        note_chat(conversation_id=conversation.id)
+    if _served_over_asgi(request):
+        events = _stream_events(user_message, conversation)
+    else:
+        events = await _answer_events(user_message, conversation)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop reverse proxies from buffering the stream
+    return response
@@ -11,6 +11,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from medical_assistant_app.lifecycle import asgi_application
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_assistant_project.settings')
 
-application = get_asgi_application()
+# Starts the RAG warm-up in each worker once it serves (see lifecycle.py).
+application = asgi_application(get_asgi_application())
@@ -83,9 +83,54 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL lets readers (the admin, reports) run while the chat log writes. It
+        # is persistent, so `migrate` turns it on once (migration 0003) instead
+        # of every connection rewriting the file header. synchronous=NORMAL is
+        # per connection: with WAL it syncs at checkpoints, not on every commit.
+        # IMMEDIATE transactions take the write lock up front, so concurrent
+        # writers wait out `timeout` seconds instead of failing with "database is locked".
+        'OPTIONS': {
+            'init_command': 'PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Caches. 'conversations' holds the server-side history of chats (see
+# conversation.py) and must be shared by every worker process, so a follow-up
+# finds its history whichever worker serves it. The default is a table in the
+# database (created by `migrate`), keeping up to CONVERSATION_MAX_ACTIVE
+# conversations. Any shared backend works: set CONVERSATION_CACHE_BACKEND and
+# CONVERSATION_CACHE_LOCATION for Redis (django.core.cache.backends.redis.RedisCache)
+# or Memcached. LocMemCache would give each worker its own conversations.
+CONVERSATION_CACHE_BACKEND = os.getenv('CONVERSATION_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'conversations': {
+        'BACKEND': CONVERSATION_CACHE_BACKEND,
+        'LOCATION': os.getenv('CONVERSATION_CACHE_LOCATION', 'conversation_cache'),
+        # Only Django's own backends cull; Redis and Memcached evict by their own settings.
+        'OPTIONS': (
+            {'MAX_ENTRIES': int(os.getenv('CONVERSATION_MAX_ACTIVE', '10000'))}
+            if CONVERSATION_CACHE_BACKEND.rsplit('.', 1)[-1] in ('DatabaseCache', 'FileBasedCache', 'LocMemCache') else {}
+        ),
+    },
+}
+
+# Chat log: every chat API request is recorded in the ChatLog table (query,
+# retrieved chunk ids, prompt tokens, stage latencies, outcome). Records are
+# buffered in memory and written in batches by a background thread, at most
+# CHAT_LOG_BATCH_SIZE rows per transaction, every CHAT_LOG_FLUSH_INTERVAL_SECONDS.
+# Past CHAT_LOG_MAX_PENDING buffered records, new ones are dropped rather than
+# slowing requests down.
+CHAT_LOG_ENABLED = os.getenv('CHAT_LOG_ENABLED', '1') == '1'
+CHAT_LOG_BATCH_SIZE = int(os.getenv('CHAT_LOG_BATCH_SIZE', '500'))
+CHAT_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('CHAT_LOG_FLUSH_INTERVAL_SECONDS', '1'))
+CHAT_LOG_MAX_PENDING = int(os.getenv('CHAT_LOG_MAX_PENDING', '10000'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
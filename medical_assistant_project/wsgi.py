@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from medical_assistant_app.lifecycle import wsgi_application
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_assistant_project.settings')
 
-application = get_wsgi_application()
+# Starts the RAG warm-up in each worker once it serves (see lifecycle.py).
+application = wsgi_application(get_wsgi_application())